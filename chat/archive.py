@@ -0,0 +1,32 @@
+from chat.models import ArchivedMessage, Message, Room
+from fms.sqlite import write_transaction
+
+
+def archive_messages(older_than, batch_size=5000):
+    """
+    Move messages sent before `older_than` from Message to ArchivedMessage
+    in batches, one write transaction per batch. A room's last message stays
+    hot because the inbox reads it. Returns the number of archived messages.
+    """
+    last_messages = Room.objects.filter(last_message__isnull=False).values(
+        "last_message_id"
+    )
+    candidates = (
+        Message.objects.filter(timestamp__lt=older_than, room__isnull=False)
+        .exclude(id__in=last_messages)
+        .order_by("id")
+        .values("id", "room_id", "sender_id", "message", "timestamp")
+    )
+
+    archived = 0
+    while True:
+        with write_transaction(model=Message):
+            batch = list(candidates[:batch_size])
+            if not batch:
+                return archived
+            # ignore_conflicts makes a retried batch harmless
+            ArchivedMessage.objects.bulk_create(
+                [ArchivedMessage(**row) for row in batch], ignore_conflicts=True
+            )
+            Message.objects.filter(id__in=[row["id"] for row in batch]).delete()
+        archived += len(batch)
@@ -2,16 +2,88 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from urllib.parse import parse_qs
+import asyncio
 import json
+import logging
+import time
 
 from chat.models import Message, Room
+from chat.realtime import (
+    agroup_send,
+    anotify_user,
+    room_group_name,
+    user_group_name,
+)
+from fms import metrics
+from fms.db_router import pin_to_primary
+from fms.log import connection_id, new_id
+from users.authentication import get_cached_user
+from users.revocation import is_revoked
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+# Per-message records; sampled by the logging config
+message_logger = logging.getLogger(f"{__name__}.messages")
 
-class ChatConsumer(AsyncWebsocketConsumer):
+# Connections that send nothing (not even a heartbeat) for this long are
+# closed, which broadcasts the participant as offline
+PRESENCE_TIMEOUT = getattr(settings, "CHAT_PRESENCE_TIMEOUT", 60)
+# At most one typing event per connection is fanned out per interval
+TYPING_INTERVAL = getattr(settings, "CHAT_TYPING_INTERVAL", 3)
+
+# Frame types other than chat messages
+CONTROL_FRAMES = {"heartbeat", "typing", "read"}
+
+# Close code used when a connection misses its heartbeats
+CLOSE_PRESENCE_EXPIRED = 4000
+
+# Notifications buffered per connection before the oldest ones are dropped
+NOTIFICATION_QUEUE_SIZE = getattr(settings, "NOTIFICATION_QUEUE_SIZE", 100)
+
+
+class TokenAuthConsumer(AsyncWebsocketConsumer):
+    """
+    Base consumer authenticating the socket from a ?token=<JWT> query param.
+    """
+
+    async def websocket_connect(self, message):
+        # Every record logged for this socket carries the connection id
+        connection_id.set(new_id())
+        consumer = type(self).__name__
+        metrics.ws_connects.inc(consumer)
+        metrics.ws_open.inc(consumer)
+        await super().websocket_connect(message)
+
+    async def websocket_disconnect(self, message):
+        consumer = type(self).__name__
+        metrics.ws_disconnects.inc(consumer)
+        metrics.ws_open.dec(consumer)
+        await super().websocket_disconnect(message)
+
+    @database_sync_to_async
+    def get_user_from_token(self):
+        query_params = parse_qs(self.scope["query_string"].decode())
+        token = query_params.get("token", [None])[0]
+
+        if not token:
+            return None
+
+        try:
+            # Validate the token
+            validated_token = UntypedToken(token)
+            if is_revoked(validated_token):
+                return None
+            user_id = validated_token.payload.get("user_id")
+            return get_cached_user(user_id)
+        except (InvalidToken, TokenError):
+            return None
+
+
+class ChatConsumer(TokenAuthConsumer):
 
     async def connect(self):
         # Authenticate the user
@@ -27,14 +99,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()  # Close connection if the room is invalid
             return
 
-        self.room_group_name = f"chat_{self.room_name}"
+        self.room_group_name = room_group_name(self.room_name)
 
         if not await self.is_valid_room():
             await self.close()  # Close connection if the room is invalid
             return
 
-        # Debug: Log user joining the room
-        print(f"User {self.scope['user'].email} is joining room { self.room_group_name}")
+        logger.info(
+            "User %s is joining room %s", self.scope["user"].id, self.room_group_name
+        )
 
         # Add the client to the room group
         await self.channel_layer.group_add(
@@ -45,9 +118,26 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # Accept the WebSocket connection
         await self.accept()
 
+        # Presence lives only in the channel layer: announce ourselves and
+        # expire the connection if the client stops sending heartbeats
+        self.last_seen = time.monotonic()
+        self.last_typing_sent = 0.0
+        self.presence_task = asyncio.ensure_future(self.expire_presence())
+        await self.send_presence("online", reply_channel=self.channel_name)
+
     async def disconnect(self, close_code):
-        # Debug: Log user disconnecting
-        print( f"User {self.scope['user'].email} is disconnecting from { self.room_group_name}" )
+        if not hasattr(self, "presence_task"):
+            return  # Connection was rejected before joining the room
+
+        logger.info(
+            "User %s is disconnecting from %s (code %s)",
+            self.scope["user"].id,
+            self.room_group_name,
+            close_code,
+        )
+
+        self.presence_task.cancel()
+        await self.send_presence("offline")
 
         # Remove the client from the room group
         await self.channel_layer.group_discard(
@@ -56,60 +146,184 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
     async def receive(self, text_data):
+        self.last_seen = time.monotonic()
         data = json.loads(text_data)
+        event_type = data.get("type")
+        # Anything that is not a control frame is handled as a message
+        metrics.chat_frames.inc(
+            event_type if event_type in CONTROL_FRAMES else "message"
+        )
+        if event_type == "heartbeat":
+            return  # Only refreshes last_seen; nothing is fanned out
+        if event_type == "typing":
+            await self.receive_typing()
+            return
+        if event_type == "read":
+            await self.receive_read(data)
+            return
+
         message = data["message"]
         sender = self.scope["user"]
 
-        # Debug: Log received message
-        print(f"Received message from {sender.email}: {message}")
+        message_logger.debug(
+            "Received message from %s in %s (%d chars)",
+            sender.id,
+            self.room_group_name,
+            len(message),
+        )
 
+        # Persist once per message, before fan-out to the participants
+        saved_message = await self.save_message(sender, message)
 
         # Broadcast the message to the group
-        await self.channel_layer.group_send(
+        await agroup_send(
+            self.channel_layer,
             self.room_group_name,
             {
                 "type": "chat_message",
+                "id": saved_message.id,
                 "message": message,
                 "sender": sender.email,
             },
         )
 
+        # Update both participants' inboxes on their notification sockets
+        payload = {
+            "room_name": self.room_name,
+            "id": saved_message.id,
+            "sender_id": sender.id,
+            "message": message,
+            "timestamp": saved_message.timestamp.isoformat(),
+        }
+        for user_id in map(int, self.room_name.split("-")):
+            await anotify_user(self.channel_layer, user_id, "chat.message", payload)
+
+    async def receive_typing(self):
+        now = time.monotonic()
+        if now - self.last_typing_sent < TYPING_INTERVAL:
+            return  # Rate limited; the peer's indicator is still showing
+        self.last_typing_sent = now
+
+        await agroup_send(
+            self.channel_layer,
+            self.room_group_name,
+            {
+                "type": "typing",
+                "user_id": self.scope["user"].id,
+                "channel": self.channel_name,
+            },
+        )
+
+    async def receive_read(self, data):
+        message_id = data.get("message_id")
+        try:
+            message_id = int(message_id) if message_id is not None else None
+        except (TypeError, ValueError):
+            return
+
+        last_read_id = await self.mark_read(message_id)
+        if last_read_id is None:
+            return
+
+        await agroup_send(
+            self.channel_layer,
+            self.room_group_name,
+            {
+                "type": "read_receipt",
+                "reader_id": self.scope["user"].id,
+                "last_read_id": last_read_id,
+            },
+        )
+
     async def chat_message(self, event):
         message = event["message"]
         sender = event["sender"]
 
-        # Debug: Log the sender and receiver
-        print(f"Sender: {sender}")
-        print(f"Current User (receiver): {self.scope['user'].email}")
-        await self.save_message(self.room_name, sender, message)
-
-        # Send the message to the WebSocket client only if the current user is NOT the sender
-        print(f"Sending message to: {self.scope['user'].email}")
+        message_logger.debug(
+            "Sending message %s from %s to %s",
+            event.get("id"),
+            sender,
+            self.scope["user"].id,
+        )
         await self.send(
             text_data=json.dumps(
                 {
+                    "type": "message",
+                    "id": event.get("id"),
                     "message": message,
                     "sender": sender,
                 }
             )
         )
 
-    @database_sync_to_async
-    def get_user_from_token(self):
-        query_params = parse_qs(self.scope["query_string"].decode())
-        token = query_params.get("token", [None])[0]
+    async def typing(self, event):
+        if event["channel"] == self.channel_name:
+            return
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "typing",
+                    "user_id": event["user_id"],
+                    "expires_in": TYPING_INTERVAL,
+                }
+            )
+        )
 
-        if not token:
-            return None
+    async def presence(self, event):
+        if event["channel"] == self.channel_name:
+            return
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "presence",
+                    "user_id": event["user_id"],
+                    "status": event["status"],
+                }
+            )
+        )
 
-        try:
-            # Validate the token
-            UntypedToken(token)
-            payload = UntypedToken(token).payload
-            user_id = payload.get("user_id")
-            return User.objects.get(id=user_id)
-        except (InvalidToken, TokenError, User.DoesNotExist):
-            return None
+        # Answer a newcomer directly (not through the group) so it learns
+        # who is already online without another room-wide broadcast
+        reply_channel = event.get("reply_channel")
+        if event["status"] == "online" and reply_channel:
+            await self.channel_layer.send(
+                reply_channel,
+                {
+                    "type": "presence",
+                    "user_id": self.scope["user"].id,
+                    "status": "online",
+                    "channel": self.channel_name,
+                },
+            )
+
+    async def send_presence(self, status, reply_channel=None):
+        event = {
+            "type": "presence",
+            "user_id": self.scope["user"].id,
+            "status": status,
+            "channel": self.channel_name,
+        }
+        if reply_channel:
+            event["reply_channel"] = reply_channel
+        await agroup_send(self.channel_layer, self.room_group_name, event)
+
+    async def expire_presence(self):
+        while True:
+            await asyncio.sleep(PRESENCE_TIMEOUT / 2)
+            if time.monotonic() - self.last_seen > PRESENCE_TIMEOUT:
+                await self.close(code=CLOSE_PRESENCE_EXPIRED)
+                return
+
+    async def read_receipt(self, event):
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "read_receipt",
+                    "reader_id": event["reader_id"],
+                    "last_read_id": event["last_read_id"],
+                }
+            )
+        )
 
     @database_sync_to_async
     def format_room_name(self, room_name):
@@ -147,21 +361,77 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return False
     
     @database_sync_to_async
-    def save_message(self, room_name, sender_email, message_content):
-        try:
-            # Find the Room by room_name
-            room = Room.objects.get(name=room_name)
-            
-            # Find the User by sender_email
-            sender = User.objects.get(email=sender_email)
-
-            # Save the message
-            Message.objects.create(
-                room=room,
-                sender_id=sender.pk,
-                message=message_content,
-            )
-        except Room.DoesNotExist:
-            print(f"Room with name {room_name} does not exist.")
-        except User.DoesNotExist:
-            print(f"User with email {sender_email} does not exist.")
\ No newline at end of file
+    def save_message(self, sender, message_content):
+        message = Message.objects.create_in_room(
+            self.room_name, sender.pk, message_content
+        )
+
+        # The sender's next history fetch must include this message
+        pin_to_primary(sender.pk)
+        return message
+
+    @database_sync_to_async
+    def mark_read(self, message_id):
+        """
+        Advance the current user's read cursor. Returns the new cursor, or
+        None when it did not move (nothing to announce).
+        """
+        room = Room.objects.filter(name=self.room_name).first()
+        if room is None:
+            return None
+
+        user_id = self.scope["user"].id
+        previous_read_id = room.last_read_id(user_id)
+        last_read_id = room.mark_read(user_id, message_id)
+        if last_read_id == previous_read_id:
+            return None
+        return last_read_id
+
+
+class NotificationConsumer(TokenAuthConsumer):
+    """
+    One socket per user carrying every realtime event addressed to them:
+    chat messages from all rooms, order updates and application decisions.
+
+    Events are buffered in a bounded queue drained by a single sender task,
+    so a slow client never blocks the channel layer. When the queue is full
+    the oldest event is dropped and the next delivered event reports how
+    many were lost, telling the client to resync over REST.
+    """
+
+    async def connect(self):
+        self.scope["user"] = await self.get_user_from_token()
+        if not self.scope["user"]:
+            await self.close()
+            return
+
+        self.user_group_name = user_group_name(self.scope["user"].id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept()
+
+        self.queue = asyncio.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+        self.dropped = 0
+        self.sender_task = asyncio.ensure_future(self.drain_queue())
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, "sender_task"):
+            return
+        self.sender_task.cancel()
+        await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        pass  # Server-to-client only
+
+    async def notify(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait({"type": event["event"], "payload": event["payload"]})
+
+    async def drain_queue(self):
+        while True:
+            frame = await self.queue.get()
+            if self.dropped:
+                frame["dropped"] = self.dropped
+                self.dropped = 0
+            await self.send(text_data=json.dumps(frame))
@@ -1,10 +1,45 @@
+from django.conf import settings
+
+CHAT_DATABASE = "chat"
+
+
 class ChatDatabaseRouter:
+    """
+    Keep the chat app (Room, Message) in its own "chat" database when one is
+    configured (CHAT_DB_NAME, see fms/databases.py), so chat write volume
+    never contends with the marketplace tables. Chat models only refer to
+    users by id, so no relation crosses the two databases.
+    Without a "chat" database the router stays out of the way.
+    """
+
+    def enabled(self):
+        return CHAT_DATABASE in settings.DATABASES
+
+    def is_chat(self, model):
+        return model._meta.app_label == "chat"
+
     def db_for_read(self, model, **hints):
-        if model._meta.app_label == "chat":
-            return "chat"
+        if self.enabled() and self.is_chat(model):
+            return CHAT_DATABASE
         return None
 
     def db_for_write(self, model, **hints):
-        if model._meta.app_label == "chat":
-            return "chat"
+        if self.enabled() and self.is_chat(model):
+            return CHAT_DATABASE
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not self.enabled():
+            return None
+        if self.is_chat(obj1) or self.is_chat(obj2):
+            return self.is_chat(obj1) and self.is_chat(obj2)
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not self.enabled():
+            return None
+        if app_label == "chat":
+            return db == CHAT_DATABASE
+        if db == CHAT_DATABASE:
+            return False
         return None
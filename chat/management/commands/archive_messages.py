@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.archive import archive_messages
+
+
+class Command(BaseCommand):
+    help = "Move chat messages older than --days into the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.ARCHIVE_MESSAGES_AFTER_DAYS
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(days=options["days"])
+        archived = archive_messages(older_than, batch_size=options["batch_size"])
+        self.stdout.write(f"Archived {archived} messages sent before {older_than}.")
@@ -0,0 +1,65 @@
+# Squashed by hand so a fresh chat database (ChatDatabaseRouter) is created
+# without the foreign keys to users_user that 0001_initial used to have.
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    replaces = [
+        ('chat', '0001_initial'),
+        ('chat', '0002_auto_20241130_1934'),
+        ('chat', '0003_auto_20241130_1940'),
+        ('chat', '0004_auto_20241130_1948'),
+        ('chat', '0005_alter_message_id_alter_room_id'),
+        ('chat', '0006_auto_20241201_1250'),
+        ('chat', '0007_room_last_message'),
+        ('chat', '0008_room_read_state'),
+    ]
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('user1_id', models.IntegerField()),
+                ('user2_id', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_activity', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user1_last_read_id', models.PositiveIntegerField(default=0)),
+                ('user2_last_read_id', models.PositiveIntegerField(default=0)),
+                ('user1_unread', models.PositiveIntegerField(default=0)),
+                ('user2_unread', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sender_id', models.IntegerField()),
+                ('message', models.TextField()),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chat.room')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['user1_id', '-last_activity'], name='room_user1_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['user2_id', '-last_activity'], name='room_user2_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.12 on 2026-10-19 15:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_last_message(apps, schema_editor):
+    Room = apps.get_model("chat", "Room")
+    Message = apps.get_model("chat", "Message")
+    db = schema_editor.connection.alias
+    for room in Room.objects.using(db).all().iterator():
+        last_message = (
+            Message.objects.using(db).filter(room=room).order_by("-timestamp").first()
+        )
+        room.last_message = last_message
+        room.last_activity = last_message.timestamp if last_message else room.created_at
+        room.save(update_fields=["last_message", "last_activity"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_auto_20241201_1250'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['user1_id', '-last_activity'], name='room_user1_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['user2_id', '-last_activity'], name='room_user2_activity_idx'),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+    ]
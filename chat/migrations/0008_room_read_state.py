@@ -0,0 +1,44 @@
+# Generated by Django 3.1.12 on 2026-10-19 15:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def mark_history_read(apps, schema_editor):
+    # Existing conversations start fully read rather than all unread
+    Room = apps.get_model("chat", "Room")
+    last_message_id = Coalesce("last_message_id", 0)
+    Room.objects.using(schema_editor.connection.alias).update(
+        user1_last_read_id=last_message_id, user2_last_read_id=last_message_id
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_room_last_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='user1_last_read_id',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='user1_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='user2_last_read_id',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='user2_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_history_read, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.12 on 2026-10-19 15:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_room_read_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('sender_id', models.IntegerField()),
+                ('message', models.TextField()),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='chat.room')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedmessage',
+            index=models.Index(fields=['room', 'timestamp'], name='archived_msg_room_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.12 on 2026-10-19 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_archivedmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'timestamp'], name='message_room_ts_idx'),
+        ),
+    ]
@@ -1,4 +1,10 @@
 from django.db import models
+from django.db.models import Case, F, When
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from fms.sqlite import write_transaction
 
 
 class Room(models.Model):
@@ -8,10 +14,102 @@ class Room(models.Model):
     user1_id = models.IntegerField()
     user2_id = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized by the message writer so the inbox needs no per-room lookups
+    last_message = models.ForeignKey(
+        "Message",
+        on_delete=models.SET_NULL,
+        related_name="+",
+        blank=True,
+        null=True,
+    )
+    last_activity = models.DateTimeField(default=timezone.now)
+    # Per-participant read cursors (last read message id) and unread counters,
+    # kept incrementally so badge counts never scan the message history
+    user1_last_read_id = models.PositiveIntegerField(default=0)
+    user2_last_read_id = models.PositiveIntegerField(default=0)
+    user1_unread = models.PositiveIntegerField(default=0)
+    user2_unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user1_id", "-last_activity"], name="room_user1_activity_idx"
+            ),
+            models.Index(
+                fields=["user2_id", "-last_activity"], name="room_user2_activity_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"Room {self.name} between {self.user1_id} and {self.user2_id}"
 
+    def companion_id(self, user_id):
+        return self.user2_id if self.user1_id == user_id else self.user1_id
+
+    def participant(self, user_id):
+        """
+        Return the field prefix ("user1" or "user2") of the given participant.
+        """
+        if self.user1_id == user_id:
+            return "user1"
+        if self.user2_id == user_id:
+            return "user2"
+        raise ValueError("User is not a participant in this room")
+
+    def last_read_id(self, user_id):
+        return getattr(self, f"{self.participant(user_id)}_last_read_id")
+
+    def unread_count(self, user_id):
+        return getattr(self, f"{self.participant(user_id)}_unread")
+
+    def mark_read(self, user_id, message_id=None):
+        """
+        Move the participant's read cursor forward to message_id (defaults to
+        the last message) and recompute their unread counter.
+        Returns the new cursor.
+        """
+        prefix = self.participant(user_id)
+        last_message_id = self.last_message_id or 0
+        if message_id is None or message_id > last_message_id:
+            message_id = last_message_id
+        if message_id <= getattr(self, f"{prefix}_last_read_id"):
+            return getattr(self, f"{prefix}_last_read_id")
+
+        rooms = Room.objects.using(self._state.db).filter(pk=self.pk)
+        updated = 0
+        if message_id == last_message_id:
+            # Everything is read; only valid if no message arrived meanwhile
+            updated = rooms.filter(last_message_id=self.last_message_id).update(
+                **{f"{prefix}_last_read_id": message_id, f"{prefix}_unread": 0}
+            )
+        if not updated:
+            unread = (
+                self.messages.filter(id__gt=message_id)
+                .exclude(sender_id=user_id)
+                .count()
+            )
+            rooms.update(
+                **{f"{prefix}_last_read_id": message_id, f"{prefix}_unread": unread}
+            )
+        setattr(self, f"{prefix}_last_read_id", message_id)
+        return message_id
+
+
+class MessageManager(models.Manager):
+    def create_in_room(self, room_name, sender_id, message):
+        """
+        Store a message sent in the room "<user1_id>-<user2_id>", creating
+        the room on first use. Runs as one write transaction.
+        """
+        user1_id, user2_id = map(int, room_name.split("-"))
+        with write_transaction(model=Message):
+            room, _ = Room.objects.get_or_create(
+                name=room_name,
+                defaults={"user1_id": user1_id, "user2_id": user2_id},
+            )
+            # Saving the message also refreshes room.last_message/last_activity
+            return self.create(room=room, sender_id=sender_id, message=message)
+
 
 class Message(models.Model):
     room = models.ForeignKey(
@@ -21,5 +119,54 @@ class Message(models.Model):
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = MessageManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["room", "timestamp"], name="message_room_ts_idx"),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender_id} in Room {self.room.name}"
+
+
+class ArchivedMessage(models.Model):
+    """
+    A message moved out of the hot Message table by archive_messages.
+    Keeps the original id, so read cursors stay valid.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    room = models.ForeignKey(
+        Room, on_delete=models.CASCADE, related_name="archived_messages"
+    )
+    sender_id = models.IntegerField()
+    message = models.TextField()
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["room", "timestamp"], name="archived_msg_room_ts_idx")
+        ]
+
+    def __str__(self):
+        return f"Archived message from {self.sender_id} in Room {self.room_id}"
+
+
+@receiver(post_save, sender=Message)
+def update_room_last_message(sender, instance, created, **kwargs):
+    if created and instance.room_id:
+        # Bump the unread counter of the participant who did not send it
+        Room.objects.using(kwargs.get("using")).filter(pk=instance.room_id).update(
+            last_message=instance,
+            last_activity=instance.timestamp,
+            user1_unread=Case(
+                When(user1_id=instance.sender_id, then=F("user1_unread")),
+                default=F("user1_unread") + 1,
+            ),
+            user2_unread=Case(
+                When(user2_id=instance.sender_id, then=F("user2_unread")),
+                default=F("user2_unread") + 1,
+            ),
+        )
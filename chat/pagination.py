@@ -0,0 +1,15 @@
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class InboxPagination(LimitOffsetPagination):
+    """
+    Opt-in limit/offset pagination: without ?limit= the whole inbox is
+    returned and no COUNT query is issued.
+    """
+
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.get_limit(request) is None:
+            return None
+        return super().paginate_queryset(queryset, request, view=view)
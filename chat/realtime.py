@@ -0,0 +1,66 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from fms import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def room_group_name(room_name):
+    return f"chat_{room_name}"
+
+
+def user_group_name(user_id):
+    return f"user_{user_id}"
+
+
+def notification_event(event, payload):
+    return {"type": "notify", "event": event, "payload": payload}
+
+
+async def agroup_send(channel_layer, group, event):
+    """
+    channel_layer.group_send, timed for the metrics endpoint.
+    """
+    with metrics.group_send_duration.time():
+        await channel_layer.group_send(group, event)
+
+
+def group_send(group, event):
+    """
+    Push an event to a channel layer group from synchronous code.
+    Delivery is best-effort: the database is the source of truth, so a
+    channel layer outage must not fail the request that triggered it.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(agroup_send)(channel_layer, group, event)
+    except Exception:
+        logger.exception("Failed to send %s to group %s", event.get("type"), group)
+
+
+def notify_user(user_id, event, payload):
+    """
+    Queue a realtime notification for the user's personal channel group.
+    The event is sent after the current transaction commits, so listeners
+    never hear about rows they cannot read yet.
+    """
+    transaction.on_commit(
+        lambda: group_send(
+            user_group_name(user_id), notification_event(event, payload)
+        )
+    )
+
+
+async def anotify_user(channel_layer, user_id, event, payload):
+    """
+    Async counterpart of notify_user for consumers.
+    """
+    await agroup_send(
+        channel_layer, user_group_name(user_id), notification_event(event, payload)
+    )
@@ -0,0 +1,339 @@
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import DEFAULT_DB_ALIAS, connections, router
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from fms import metrics
+from users.models import User
+from .archive import archive_messages
+from .models import ArchivedMessage, Message, Room
+from .realtime import notification_event, user_group_name
+from .routing import websocket_urlpatterns
+
+
+@contextmanager
+def assert_total_queries(test_case, expected):
+    """
+    assertNumQueries summed over every database, whether or not chat lives
+    in its own one.
+    """
+    aliases = {router.db_for_read(Room), DEFAULT_DB_ALIAS}
+    with ExitStack() as stack:
+        contexts = [
+            stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in aliases
+        ]
+        yield
+    test_case.assertEqual(sum(len(context) for context in contexts), expected)
+
+
+class ChatInboxTestCase(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="buyer@example.com", password="password123", role="Buyer"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_room(self, companion):
+        user1_id, user2_id = sorted([self.user.id, companion.id])
+        return Room.objects.create(
+            name=f"{user1_id}-{user2_id}", user1_id=user1_id, user2_id=user2_id
+        )
+
+    def test_message_updates_room_last_message(self):
+        companion = User.objects.create_user(
+            email="farmer@example.com", password="password123", role="Farmer"
+        )
+        room = self.create_room(companion)
+        message = Message.objects.create(
+            room=room, sender_id=companion.id, message="Hello"
+        )
+        room.refresh_from_db()
+        self.assertEqual(room.last_message_id, message.id)
+        self.assertEqual(room.last_activity, message.timestamp)
+
+    def test_inbox_query_count_is_constant(self):
+        for i in range(5):
+            companion = User.objects.create_user(
+                email=f"farmer{i}@example.com", password="password123", role="Farmer"
+            )
+            room = self.create_room(companion)
+            Message.objects.create(room=room, sender_id=companion.id, message=f"#{i}")
+
+        with assert_total_queries(self, 2):
+            response = self.client.get("/api/v1/chat/rooms/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [room["last_message"]["message"] for room in response.data],
+            ["#4", "#3", "#2", "#1", "#0"],
+        )
+
+    def test_inbox_pagination(self):
+        for i in range(3):
+            companion = User.objects.create_user(
+                email=f"farmer{i}@example.com", password="password123", role="Farmer"
+            )
+            self.create_room(companion)
+
+        response = self.client.get("/api/v1/chat/rooms/", {"limit": 2})
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class ChatReadStateTestCase(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.buyer = User.objects.create_user(
+            email="buyer@example.com", password="password123", role="Buyer"
+        )
+        self.farmer = User.objects.create_user(
+            email="farmer@example.com", password="password123", role="Farmer"
+        )
+        user1_id, user2_id = sorted([self.buyer.id, self.farmer.id])
+        self.room = Room.objects.create(
+            name=f"{user1_id}-{user2_id}", user1_id=user1_id, user2_id=user2_id
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_unread_counter_tracks_incoming_messages(self):
+        for i in range(3):
+            Message.objects.create(
+                room=self.room, sender_id=self.farmer.id, message=f"#{i}"
+            )
+        Message.objects.create(room=self.room, sender_id=self.buyer.id, message="Hi")
+
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.unread_count(self.buyer.id), 3)
+        self.assertEqual(self.room.unread_count(self.farmer.id), 1)
+
+        with assert_total_queries(self, 2):
+            response = self.client.get("/api/v1/chat/unread/")
+        self.assertEqual(response.data["unread_count"], 3)
+
+    def test_mark_read_moves_cursor_and_recounts(self):
+        messages = [
+            Message.objects.create(
+                room=self.room, sender_id=self.farmer.id, message=f"#{i}"
+            )
+            for i in range(3)
+        ]
+
+        response = self.client.post(
+            f"/api/v1/chat/rooms/{self.room.name}/read/",
+            {"message_id": messages[0].id},
+            format="json",
+        )
+        self.assertEqual(response.data["last_read_id"], messages[0].id)
+        self.assertEqual(response.data["unread_count"], 2)
+
+        response = self.client.post(f"/api/v1/chat/rooms/{self.room.name}/read/")
+        self.assertEqual(response.data["last_read_id"], messages[-1].id)
+        self.assertEqual(response.data["unread_count"], 0)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class ChatConsumerSignalsTestCase(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.buyer = User.objects.create_user(
+            email="buyer@example.com", password="password123", role="Buyer"
+        )
+        self.farmer = User.objects.create_user(
+            email="farmer@example.com", password="password123", role="Farmer"
+        )
+        user1_id, user2_id = sorted([self.buyer.id, self.farmer.id])
+        self.room_name = f"{user1_id}-{user2_id}"
+
+    def connect(self, user):
+        token = AccessToken.for_user(user)
+        return WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f"/ws/chat/{self.room_name}/?token={token}",
+        )
+
+    def test_presence_and_rate_limited_typing(self):
+        async def scenario():
+            buyer = self.connect(self.buyer)
+            connected, _ = await buyer.connect()
+            self.assertTrue(connected)
+
+            farmer = self.connect(self.farmer)
+            await farmer.connect()
+
+            # The buyer sees the farmer arrive, the farmer is told directly
+            # that the buyer is already online
+            self.assertEqual(
+                await buyer.receive_json_from(),
+                {"type": "presence", "user_id": self.farmer.id, "status": "online"},
+            )
+            self.assertEqual(
+                await farmer.receive_json_from(),
+                {"type": "presence", "user_id": self.buyer.id, "status": "online"},
+            )
+
+            await buyer.send_json_to({"type": "heartbeat"})
+            await buyer.send_json_to({"type": "typing"})
+            await buyer.send_json_to({"type": "typing"})
+            event = await farmer.receive_json_from()
+            self.assertEqual(event["type"], "typing")
+            self.assertTrue(await farmer.receive_nothing())
+            self.assertTrue(await buyer.receive_nothing())
+
+            await buyer.disconnect()
+            self.assertEqual(
+                await farmer.receive_json_from(),
+                {"type": "presence", "user_id": self.buyer.id, "status": "offline"},
+            )
+            await farmer.disconnect()
+
+        async_to_sync(scenario)()
+
+        # Ephemeral signals must not touch the database
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(Room.objects.exists())
+
+    def connect_notifications(self, user):
+        token = AccessToken.for_user(user)
+        return WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/notifications/?token={token}"
+        )
+
+    def test_chat_message_reaches_notification_socket(self):
+        async def scenario():
+            notifications = self.connect_notifications(self.farmer)
+            connected, _ = await notifications.connect()
+            self.assertTrue(connected)
+
+            buyer = self.connect(self.buyer)
+            await buyer.connect()
+            await buyer.send_json_to({"message": "Is the honey in stock?"})
+
+            event = await notifications.receive_json_from()
+            self.assertEqual(event["type"], "chat.message")
+            self.assertEqual(event["payload"]["room_name"], self.room_name)
+            self.assertEqual(event["payload"]["sender_id"], self.buyer.id)
+
+            await buyer.disconnect()
+            await notifications.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_socket_and_frame_metrics(self):
+        def value(metric, *labels):
+            return metric.collect().get(labels, 0)
+
+        def sends():
+            # Histogram slots are the bucket counts followed by the sum
+            histogram = metrics.group_send_duration.collect()
+            return sum(sum(counts[:-1]) for counts in histogram.values())
+
+        before = (
+            value(metrics.chat_frames, "message"),
+            value(metrics.ws_connects, "ChatConsumer"),
+            value(metrics.ws_open, "ChatConsumer"),
+            sends(),
+        )
+
+        async def scenario():
+            buyer = self.connect(self.buyer)
+            await buyer.connect()
+            open_sockets = value(metrics.ws_open, "ChatConsumer")
+            await buyer.send_json_to({"message": "Hello"})
+            await buyer.receive_json_from()
+            await buyer.disconnect()
+            return open_sockets
+
+        open_sockets = async_to_sync(scenario)()
+
+        self.assertEqual(open_sockets, before[2] + 1)
+        self.assertEqual(value(metrics.chat_frames, "message"), before[0] + 1)
+        self.assertEqual(value(metrics.ws_connects, "ChatConsumer"), before[1] + 1)
+        self.assertEqual(value(metrics.ws_open, "ChatConsumer"), before[2])
+        self.assertGreater(sends(), before[3])
+
+    def test_notification_queue_drops_oldest_when_full(self):
+        async def scenario():
+            notifications = self.connect_notifications(self.farmer)
+            await notifications.connect()
+
+            # Fill the queue faster than the sender task can drain it
+            layer = get_channel_layer()
+            group = user_group_name(self.farmer.id)
+            for order_id in range(5):
+                await layer.group_send(
+                    group, notification_event("order.status", {"order_id": order_id})
+                )
+
+            frames = []
+            while not await notifications.receive_nothing():
+                frames.append(await notifications.receive_json_from())
+            await notifications.disconnect()
+            return frames
+
+        with mock.patch("chat.consumers.NOTIFICATION_QUEUE_SIZE", 2):
+            frames = async_to_sync(scenario)()
+
+        self.assertLessEqual(len(frames), 5)
+        self.assertEqual(frames[-1]["payload"], {"order_id": 4})
+        self.assertEqual(
+            len(frames) + sum(frame.get("dropped", 0) for frame in frames), 5
+        )
+
+
+class ChatArchiveTestCase(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.buyer = User.objects.create_user(
+            email="buyer@example.com", password="password123", role="Buyer"
+        )
+        self.farmer = User.objects.create_user(
+            email="farmer@example.com", password="password123", role="Farmer"
+        )
+        user1_id, user2_id = sorted([self.buyer.id, self.farmer.id])
+        self.room = Room.objects.create(
+            name=f"{user1_id}-{user2_id}", user1_id=user1_id, user2_id=user2_id
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_old_messages_are_archived_and_still_in_history(self):
+        for i in range(3):
+            Message.objects.create(
+                room=self.room, sender_id=self.farmer.id, message=f"#{i}"
+            )
+        Message.objects.update(timestamp=timezone.now() - timedelta(days=120))
+
+        archived = archive_messages(timezone.now() - timedelta(days=90))
+
+        # The room's last message stays hot for the inbox
+        self.assertEqual(archived, 2)
+        self.assertEqual(Message.objects.count(), 1)
+        self.assertEqual(ArchivedMessage.objects.count(), 2)
+
+        response = self.client.get(f"/api/v1/chat/history/{self.room.name}/")
+        self.assertEqual(
+            [message["message"] for message in response.data["messages"]],
+            ["#0", "#1", "#2"],
+        )
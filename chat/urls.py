@@ -1,7 +1,14 @@
 from django.urls import path
-from .views import ChatHistoryView, ListChatRoomsView
+from .views import (
+    ChatHistoryView,
+    ListChatRoomsView,
+    MarkRoomReadView,
+    UnreadCountView,
+)
 
 urlpatterns = [
     path("rooms/", ListChatRoomsView.as_view(), name="chats"),
     path("history/<str:room_name>/", ChatHistoryView.as_view(), name="chat-history"),
+    path("rooms/<str:room_name>/read/", MarkRoomReadView.as_view(), name="chat-read"),
+    path("unread/", UnreadCountView.as_view(), name="chat-unread"),
 ]
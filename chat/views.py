@@ -1,34 +1,50 @@
-import json
+from itertools import chain
+
 from django.contrib.auth import get_user_model
+from django.db.models import Q, Sum
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
+from fms.async_views import AsyncReadMixin
+from fms.db_router import ReplicaReadMixin
 from .models import Room, Message
+from .pagination import InboxPagination
+from .realtime import group_send, room_group_name
 
 User = get_user_model()  # Use the custom User model if applicable
 
 
-class ListChatRoomsView(APIView):
+class ListChatRoomsView(AsyncReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         user = request.user
 
-        # Get rooms where the user is either user1 or user2
-        rooms = Room.objects.filter(user1_id=user.id)
-        rooms2 = Room.objects.filter(user2_id=user.id)
-        rooms = list(rooms) + list(rooms2)
+        # Rooms where the user is either user1 or user2, most recent first.
+        # last_message is denormalized on Room, so this is a single query.
+        rooms = (
+            Room.objects.filter(Q(user1_id=user.id) | Q(user2_id=user.id))
+            .select_related("last_message")
+            .order_by("-last_activity", "-id")
+        )
+
+        # Pagination is opt-in (?limit=&offset=) to keep the plain list response
+        paginator = InboxPagination()
+        page = paginator.paginate_queryset(rooms, request, view=self)
+        rooms = page if page is not None else list(rooms)
+
+        # Fetch all companions at once instead of one query per room
+        companions = User.objects.in_bulk(
+            {room.companion_id(user.id) for room in rooms}
+        )
 
         response = []
         for room in rooms:
-            # Get the last message in the room, or set last_message to None if it doesn't exist
-            last_message = (
-                Message.objects.filter(room=room).order_by("-timestamp").first()
-            )
+            last_message = room.last_message
 
             # If no message exists, set default values
-            last_message_exists = last_message is not None
-            if not last_message_exists:
+            if last_message is None:
                 last_message_data = {
                     "who": "companion",  # Default to "companion" if no message exists
                     "message": "No messages yet.",
@@ -41,9 +57,9 @@ class ListChatRoomsView(APIView):
                     "timestamp": last_message.timestamp,
                 }
 
-            # Determine the companion's ID
-            companion_id = room.user2_id if room.user1_id == user.id else room.user1_id
-            companion = User.objects.get(id=companion_id)
+            companion = companions.get(room.companion_id(user.id))
+            if companion is None:
+                continue
 
             # Construct response for each room
             response.append(
@@ -55,13 +71,17 @@ class ListChatRoomsView(APIView):
                         "email": companion.email,
                     },
                     "last_message": last_message_data,
+                    "last_activity": room.last_activity,
+                    "unread_count": room.unread_count(user.id),
                 }
             )
 
+        if page is not None:
+            return paginator.get_paginated_response(response)
         return Response(response)
 
 
-class ChatHistoryView(APIView):
+class ChatHistoryView(AsyncReadMixin, ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, room_name):
@@ -86,12 +106,16 @@ class ChatHistoryView(APIView):
             except User.DoesNotExist:
                 return Response({"error": "Companion does not exist"}, status=404)
 
-            # Retrieve chat messages
-            messages = room.messages.order_by("timestamp").values(
-                "sender_id", "message", "timestamp"
+            # Retrieve chat messages. Archived ones are always older than the
+            # hot ones, so the history is the archive followed by the table.
+            fields = ["id", "sender_id", "message", "timestamp"]
+            messages = chain(
+                room.archived_messages.order_by("timestamp").values(*fields),
+                room.messages.order_by("timestamp").values(*fields),
             )
             processed_messages = [
                 {
+                    "id": msg["id"],
                     "sender_id": msg["sender_id"],
                     "message": msg["message"],
                     "timestamp": msg["timestamp"],
@@ -108,8 +132,73 @@ class ChatHistoryView(APIView):
                     "email": companion.email,
                 },
                 "messages": list(processed_messages),
+                "last_read_id": room.last_read_id(user.id),
+                "companion_last_read_id": room.last_read_id(companion_id),
             }
             return Response(response)
 
         except Room.DoesNotExist:
             return Response({"error": "Room does not exist"}, status=404)
+
+
+class MarkRoomReadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, room_name):
+        user = request.user
+        try:
+            room = Room.objects.get(name=room_name)
+        except Room.DoesNotExist:
+            return Response({"error": "Room does not exist"}, status=404)
+
+        if user.id not in (room.user1_id, room.user2_id):
+            return Response(
+                {"error": "You are not a participant in this room"}, status=403
+            )
+
+        message_id = request.data.get("message_id")
+        try:
+            message_id = int(message_id) if message_id is not None else None
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "message_id must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        previous_read_id = room.last_read_id(user.id)
+        last_read_id = room.mark_read(user.id, message_id)
+        if last_read_id != previous_read_id:
+            # Let the companion's open socket show the read receipt
+            group_send(
+                room_group_name(room.name),
+                {
+                    "type": "read_receipt",
+                    "reader_id": user.id,
+                    "last_read_id": last_read_id,
+                },
+            )
+
+        room.refresh_from_db(fields=["user1_unread", "user2_unread"])
+        return Response(
+            {
+                "room_name": room.name,
+                "last_read_id": last_read_id,
+                "unread_count": room.unread_count(user.id),
+            }
+        )
+
+
+class UnreadCountView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+
+        # Two indexed aggregates over the user's rooms, no message scans
+        as_user1 = Room.objects.filter(user1_id=user.id).aggregate(
+            unread=Sum("user1_unread")
+        )["unread"]
+        as_user2 = Room.objects.filter(user2_id=user.id).aggregate(
+            unread=Sum("user2_unread")
+        )["unread"]
+        return Response({"unread_count": (as_user1 or 0) + (as_user2 or 0)})
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.12 on 2026-10-19 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('farms', '0006_auto_20241201_1250'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='application',
+            index=models.Index(fields=['status', '-created_at'], name='application_status_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 from users.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -51,6 +52,11 @@ class Application(models.Model):
     rejection_reason = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "-created_at"], name="application_status_idx"),
+        ]
+
     def __str__(self):
         return f"Application {self.id} - Farmer: {self.farmer.email} - Status: {self.status}"
 
@@ -59,3 +65,14 @@ class Application(models.Model):
 def create_application_for_farm(sender, instance, created, **kwargs):
     if created:
         Application.objects.create(farmer=instance.farmer, farm=instance)
+
+
+# The verified farms as FarmViewSet lists them to buyers and admins
+CATALOGUE_CACHE_KEY = "farms:catalogue"
+
+
+@receiver(post_save, sender=Farm)
+@receiver(post_delete, sender=Farm)
+def forget_cached_catalogue(sender, instance, **kwargs):
+    # See FarmViewSet.get_catalogue
+    cache.delete(CATALOGUE_CACHE_KEY)
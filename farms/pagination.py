@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ApplicationCursorPagination(CursorPagination):
+    """
+    Keyset pagination of the application review queue, oldest first: each
+    page continues from the last creation time of the previous one, so
+    deep pages cost the same as the first and no COUNT query is issued.
+    """
+
+    ordering = "created_at"
+    page_size = 50
+    page_size_query_param = "limit"
+    max_page_size = 500
@@ -1,8 +1,8 @@
 from rest_framework import serializers
 
-from farms.utils import calculate_distance
+from farms.utils import distance_from_request
 from users.serializers import UserSerializer
-from .models import Application, Farm
+from .models import Application, ApplicationStatus, Farm
 
 
 class BriefFarmSerializer(serializers.ModelSerializer):
@@ -14,24 +14,9 @@ class BriefFarmSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "name", "address", "is_verified", "distance"]
 
     def get_distance(self, obj):
-        request = self.context.get("request")
-        if not obj.latitude or not obj.longitude:
-            return None
-
-        farm_location = (obj.latitude, obj.longitude)
-
-        if request:
-            latitude = request.query_params.get("latitude")
-            longitude = request.query_params.get("longitude")
-
-            if latitude and longitude:
-                try:
-                    user_location = (float(latitude), float(longitude))
-                    return round(calculate_distance(user_location, farm_location), 2)
-                except ValueError:
-                    return None
-
-        return None
+        return distance_from_request(
+            self.context.get("request"), obj.latitude, obj.longitude
+        )
 
 
 class FarmSerializer(serializers.ModelSerializer):
@@ -65,24 +50,9 @@ class FarmSerializer(serializers.ModelSerializer):
         return False
 
     def get_distance(self, obj):
-        request = self.context.get("request")
-        if not obj.latitude or not obj.longitude:
-            return None
-
-        farm_location = (obj.latitude, obj.longitude)
-
-        if request:
-            latitude = request.query_params.get("latitude")
-            longitude = request.query_params.get("longitude")
-
-            if latitude and longitude:
-                try:
-                    user_location = (float(latitude), float(longitude))
-                    return round(calculate_distance(user_location, farm_location), 2)
-                except ValueError:
-                    return None
-
-        return None
+        return distance_from_request(
+            self.context.get("request"), obj.latitude, obj.longitude
+        )
 
 
 class ApplicationSerializer(serializers.ModelSerializer):
@@ -113,3 +83,23 @@ class ApplicationSerializer(serializers.ModelSerializer):
                 }
             )
         return data
+
+
+class ApplicationReviewSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000,
+    )
+    status = serializers.ChoiceField(
+        choices=[ApplicationStatus.APPROVED, ApplicationStatus.REJECTED]
+    )
+    rejection_reason = serializers.CharField(required=False)
+
+    def validate(self, data):
+        rejected = data["status"] == ApplicationStatus.REJECTED
+        if rejected and not data.get("rejection_reason"):
+            raise serializers.ValidationError(
+                {"rejection_reason": "Rejection reason is required when rejecting."}
+            )
+        return data
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.utils import timezone
+
+from chat.realtime import notify_user
+from farms.models import CATALOGUE_CACHE_KEY, Application, ApplicationStatus, Farm
+from fms.sqlite import write_transaction
+from market.models import Product
+
+
+def review_applications(ids, status, rejection_reason=None):
+    """
+    Approve or reject the applications with the given ids in one
+    transaction: one UPDATE for the applications, one for the is_verified
+    flag of their farms and two for the visibility of their products,
+    whatever their number. Returns the number of applications reviewed.
+
+    Applications that already have this status and reason are left alone,
+    so a retried batch changes nothing and notifies no farmer twice.
+    """
+    if status == ApplicationStatus.APPROVED:
+        rejection_reason = None
+    with write_transaction(model=Application):
+        reviewed = list(
+            Application.objects.select_for_update()
+            .filter(id__in=ids)
+            .exclude(status=status, rejection_reason=rejection_reason)
+            .values_list("id", "farm_id", "farmer_id")
+        )
+        if not reviewed:
+            return 0
+        Application.objects.filter(
+            id__in=[application_id for application_id, _, _ in reviewed]
+        ).update(status=status, rejection_reason=rejection_reason)
+        farm_ids = {farm_id for _, farm_id, _ in reviewed}
+        Farm.objects.filter(id__in=farm_ids).update(
+            is_verified=status == ApplicationStatus.APPROVED,
+            updated_at=timezone.now(),
+        )
+        Product.objects.filter(farm_id__in=farm_ids).update_visibility()
+        for application_id, farm_id, farmer_id in reviewed:
+            notify_user(
+                farmer_id,
+                "application.decision",
+                {
+                    "application_id": application_id,
+                    "farm_id": farm_id,
+                    "status": status,
+                    "rejection_reason": rejection_reason,
+                },
+            )
+    # Queryset updates send no post_save; see FarmViewSet.get_catalogue
+    cache.delete(CATALOGUE_CACHE_KEY)
+    return len(reviewed)
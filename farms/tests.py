@@ -1,6 +1,16 @@
-from django.test import TestCase
-from users.models import User
-from .models import Farm, Application
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.choices import Role, SocialType
+from users.models import Social, User
+from users.service import create_if_not_exists
+from .models import CATALOGUE_CACHE_KEY, Farm, Application
 
 
 class FarmApplicationTestCase(TestCase):
@@ -14,10 +24,216 @@ class FarmApplicationTestCase(TestCase):
             farmer=self.farmer,
             name="Test Farm",
             address="123 Green Lane",
-            geo_loc="45.12345, -93.12345",
+            latitude=45.12345,
+            longitude=-93.12345,
             size="20 acres",
             crop_types="Corn",
         )
         application = Application.objects.get(farm=farm)
         self.assertEqual(application.farmer, self.farmer)
         self.assertEqual(application.status, "pending")
+
+
+class FarmQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        buyer = User.objects.create_user(
+            email="buyer@example.com", password="password123", role=Role.Buyer
+        )
+        admin = User.objects.create_user(
+            email="admin@example.com", password="password123", role=Role.Admin
+        )
+        self.buyer_client = self.client_for(buyer)
+        self.admin_client = self.client_for(admin)
+        self.add_farms(1)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        return client
+
+    def add_farms(self, count):
+        for _ in range(count):
+            number = User.objects.count()
+            farmer = User.objects.create_user(
+                email=f"farmer{number}@example.com",
+                password="password123",
+                role=Role.Farmer,
+            )
+            create_if_not_exists(farmer)
+            Social.objects.create(
+                farmer=farmer, platform=SocialType.choices[0][0], url="https://a.b"
+            )
+            Farm.objects.create(
+                farmer=farmer,
+                name="Farm",
+                address="123 Green Lane",
+                size="20 acres",
+                crop_types="Corn",
+                is_verified=True,
+            )
+
+    def count_queries(self, client, path):
+        client.get(path)  # Authenticates, so the user is cached
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_farm_list_queries_do_not_grow_with_farms(self):
+        one, _ = self.count_queries(self.buyer_client, "/api/v1/farms/")
+        self.add_farms(3)
+        many, response = self.count_queries(self.buyer_client, "/api/v1/farms/")
+
+        self.assertEqual(one, many)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(response.data[0]["farmer"]["socials"]), 1)
+        self.assertIn("rating", response.data[0]["farmer"]["info"])
+
+    def test_application_list_queries_do_not_grow_with_applications(self):
+        one, _ = self.count_queries(self.admin_client, "/api/v1/applications/")
+        self.add_farms(3)
+        many, response = self.count_queries(self.admin_client, "/api/v1/applications/")
+
+        self.assertEqual(one, many)
+        self.assertEqual(len(response.data), 4)
+
+    def test_review_queue_queries_do_not_grow_with_applications(self):
+        one, _ = self.count_queries(self.admin_client, "/api/v1/applications/queue/")
+        self.add_farms(3)
+        many, response = self.count_queries(
+            self.admin_client, "/api/v1/applications/queue/"
+        )
+
+        self.assertEqual(one, many)
+        self.assertEqual(len(response.data["results"]), 4)
+
+
+class ApplicationReviewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_user(
+            email="admin@example.com", password="password123", role=Role.Admin
+        )
+        self.admin_client = APIClient()
+        self.admin_client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(admin)}"
+        )
+        buyer = User.objects.create_user(
+            email="buyer@example.com", password="password123", role=Role.Buyer
+        )
+        self.buyer = buyer
+        self.buyer_client = APIClient()
+        self.buyer_client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(buyer)}"
+        )
+        self.farmer = User.objects.create_user(
+            email="farmer@example.com", password="password123", role=Role.Farmer
+        )
+        self.farms = [
+            Farm.objects.create(
+                farmer=self.farmer,
+                name=f"Farm {number}",
+                address="123 Green Lane",
+                latitude=43.24,
+                longitude=76.95,
+                size="20 acres",
+                crop_types="Corn",
+            )
+            for number in range(3)
+        ]
+        self.applications = list(Application.objects.order_by("created_at"))
+
+    def review(self, ids, status, rejection_reason=None):
+        data = {"ids": ids, "status": status}
+        if rejection_reason:
+            data["rejection_reason"] = rejection_reason
+        return self.admin_client.post(
+            "/api/v1/applications/review/", data, format="json"
+        )
+
+    def test_queue_is_pending_and_keyset_paginated(self):
+        Application.objects.filter(id=self.applications[0].id).update(
+            status="approved"
+        )
+        response = self.admin_client.get("/api/v1/applications/queue/", {"limit": 1})
+        ids = [application["id"] for application in response.data["results"]]
+        while response.data["next"]:
+            response = self.admin_client.get(response.data["next"])
+            ids += [application["id"] for application in response.data["results"]]
+
+        self.assertEqual(ids, [a.id for a in self.applications[1:]])
+        self.assertEqual(
+            self.buyer_client.get("/api/v1/applications/queue/").status_code, 403
+        )
+
+    @mock.patch("farms.service.notify_user")
+    def test_batch_approval_is_set_based(self, notify_user):
+        ids = [application.id for application in self.applications]
+        self.review(ids[:1], "approved")
+        notify_user.reset_mock()
+
+        # The SELECT, an UPDATE each for applications and farms, two for
+        # product visibility, and a savepoint
+        with self.assertNumQueries(7):
+            response = self.review(ids, "approved")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"reviewed": 2})
+        self.assertEqual(notify_user.call_count, 2)
+        self.assertEqual(Farm.objects.filter(is_verified=True).count(), 3)
+        self.assertEqual(
+            set(Application.objects.values_list("status", flat=True)), {"approved"}
+        )
+        # A retried batch is a no-op
+        self.assertEqual(self.review(ids, "approved").data, {"reviewed": 0})
+
+    @mock.patch("farms.service.notify_user")
+    def test_batch_rejection_requires_a_reason(self, notify_user):
+        ids = [application.id for application in self.applications]
+        self.assertEqual(self.review(ids, "rejected").status_code, 400)
+        self.assertEqual(self.review(ids, "pending", "x").status_code, 400)
+
+        response = self.review(ids, "rejected", "Incomplete documents")
+        self.assertEqual(response.data, {"reviewed": 3})
+        self.assertEqual(
+            Application.objects.filter(rejection_reason="Incomplete documents").count(),
+            3,
+        )
+        self.assertFalse(Farm.objects.filter(is_verified=True).exists())
+
+    def test_catalogue_is_not_cached_per_process(self):
+        self.review([self.applications[0].id], "approved")
+        self.buyer_client.get("/api/v1/farms/")
+
+        self.assertIsNone(cache.get(CATALOGUE_CACHE_KEY))
+
+    @override_settings(FARM_CATALOGUE_CACHE_SECONDS=60)
+    def test_catalogue_is_cached_until_a_review(self):
+        self.review([self.applications[0].id], "approved")
+        response = self.buyer_client.get("/api/v1/farms/")
+        self.assertEqual([farm["id"] for farm in response.data], [self.farms[0].id])
+
+        with self.assertNumQueries(0):
+            response = self.buyer_client.get(
+                "/api/v1/farms/", {"latitude": 43.25, "longitude": 76.95}
+            )
+        self.assertIsNotNone(response.data[0]["distance"])
+        self.assertFalse(response.data[0]["is_owner"])
+
+        self.review([self.applications[1].id], "approved")
+        self.assertIsNone(cache.get(CATALOGUE_CACHE_KEY))
+        response = self.buyer_client.get("/api/v1/farms/")
+        self.assertEqual(len(response.data), 2)
+
+    def test_single_review_verifies_the_farm(self):
+        application = self.applications[0]
+        response = self.admin_client.put(
+            f"/api/v1/applications/{application.id}/",
+            {"status": "approved"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "approved")
+        self.assertTrue(response.data["farm"]["is_verified"])
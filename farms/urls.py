@@ -1,6 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ApplicationView, FarmViewSet
+from .views import (
+    ApplicationQueueView,
+    ApplicationReviewView,
+    ApplicationView,
+    FarmViewSet,
+)
 
 router = DefaultRouter()
 router.register(r"farms", FarmViewSet, basename="farm")
@@ -8,6 +13,16 @@ router.register(r"farms", FarmViewSet, basename="farm")
 urlpatterns = [
     path("", include(router.urls)),
     path("applications/", ApplicationView.as_view(), name="applications"),
+    path(
+        "applications/queue/",
+        ApplicationQueueView.as_view(),
+        name="application-queue",
+    ),
+    path(
+        "applications/review/",
+        ApplicationReviewView.as_view(),
+        name="application-review",
+    ),
     path(
         "applications/<int:pk>/", ApplicationView.as_view(), name="application-detail"
     ),
@@ -9,3 +9,23 @@ def calculate_distance(user_location, farm_location):
     :return: Distance in kilometers.
     """
     return geodesic(user_location, farm_location).km
+
+
+def distance_from_request(request, latitude, longitude):
+    """
+    Kilometres from the latitude/longitude query parameters of the request
+    to a farm, rounded to 2 places, or None when either location is
+    unknown.
+    """
+    if not latitude or not longitude or request is None:
+        return None
+
+    user_latitude = request.query_params.get("latitude")
+    user_longitude = request.query_params.get("longitude")
+    if not user_latitude or not user_longitude:
+        return None
+    try:
+        user_location = (float(user_latitude), float(user_longitude))
+    except ValueError:
+        return None
+    return round(calculate_distance(user_location, (latitude, longitude)), 2)
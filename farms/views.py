@@ -1,23 +1,32 @@
-from farms.models import Application, Farm
+from farms.models import CATALOGUE_CACHE_KEY, Application, ApplicationStatus, Farm
+from farms.pagination import ApplicationCursorPagination
 from farms.serializers import (
+    ApplicationReviewSerializer,
     ApplicationSerializer,
     FarmSerializer,
 )
+from farms.service import review_applications
+from farms.utils import distance_from_request
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
+from users.managers import with_profile
 from users.models import Social, User
 from users.permissions import IsAdmin, IsFarmer
 from users.serializers import CustomTokenObtainPairSerializer
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework import viewsets
+from rest_framework import generics, viewsets
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.decorators import action
 from market.serializers import FarmProductSerializer
+from fms.async_views import AsyncReadMixin
+from fms.db_router import ReplicaReadMixin
 
 
-class FarmViewSet(viewsets.ModelViewSet):
+class FarmViewSet(AsyncReadMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for creating, retrieving, listing, updating, and deleting farms.
     """
@@ -33,9 +42,47 @@ class FarmViewSet(viewsets.ModelViewSet):
         - Others can view all farms.
         """
         user = self.request.user
+        farms = with_profile(Farm.objects.all(), "farmer")
         if user.role == "Farmer":
-            return Farm.objects.filter(Q(is_verified=True) | Q(farmer=user))
-        return Farm.objects.filter(is_verified=True)
+            return farms.filter(Q(is_verified=True) | Q(farmer=user))
+        return farms.filter(is_verified=True)
+
+    def get_catalogue(self, request):
+        """
+        The verified farms, cached for FARM_CATALOGUE_CACHE_SECONDS unless a
+        farm is saved or applications are reviewed (farms/models.py). That
+        reaches every process only on a shared cache (fms/cache.py).
+        """
+        timeout = settings.FARM_CATALOGUE_CACHE_SECONDS
+        farms = cache.get(CATALOGUE_CACHE_KEY) if timeout else None
+        if farms is None:
+            # Cached without the request; its parts are filled in below
+            farms = [
+                dict(farm)
+                for farm in self.serializer_class(self.get_queryset(), many=True).data
+            ]
+            if timeout:
+                cache.set(CATALOGUE_CACHE_KEY, farms, timeout)
+        return [self.for_request(request, farm) for farm in farms]
+
+    def for_request(self, request, farm):
+        farmer = farm["farmer"]
+        if farmer.get("avatar"):
+            farmer = {**farmer, "avatar": request.build_absolute_uri(farmer["avatar"])}
+        return {
+            **farm,
+            "farmer": farmer,
+            "is_owner": farmer["id"] == request.user.id,
+            "distance": distance_from_request(
+                request, farm["latitude"], farm["longitude"]
+            ),
+        }
+
+    def list(self, request, *args, **kwargs):
+        # Farmers also see their own unverified farms, so are not cached
+        if request.user.role == "Farmer":
+            return super().list(request, *args, **kwargs)
+        return Response(self.get_catalogue(request), status=status.HTTP_200_OK)
 
     def perform_create(self, serializer):
         """
@@ -74,7 +121,7 @@ class FarmViewSet(viewsets.ModelViewSet):
         user = request.user
         if user.role != "Farmer":
             raise PermissionDenied("Only farmers can view their farms.")
-        farms = Farm.objects.filter(farmer=user)
+        farms = with_profile(Farm.objects.filter(farmer=user), "farmer")
         serializer = self.serializer_class(
             farms, many=True, context={"request": request}
         )
@@ -99,11 +146,12 @@ class ApplicationView(APIView):
         query_params = request.query_params
         status_filter = query_params.get("status")
 
+        applications = with_profile(Application.objects.all(), "farm__farmer")
         if status_filter in ["pending", "approved", "rejected"]:
-            applications = Application.objects.filter(status=status_filter)
+            applications = applications.filter(status=status_filter)
         elif pk:
             try:
-                application = Application.objects.get(pk=pk)
+                application = applications.get(pk=pk)
                 serializer = self.serializer_class(application)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             except Application.DoesNotExist:
@@ -111,8 +159,6 @@ class ApplicationView(APIView):
                     {"detail": "Application not found."},
                     status=status.HTTP_404_NOT_FOUND,
                 )
-        else:
-            applications = Application.objects.all()
 
         serializer = self.serializer_class(applications, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -141,17 +187,47 @@ class ApplicationView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if status_value == "approved":
-            application.farm.is_verified = True
-            application.farm.save()
-
-        elif status_value == "rejected":
-            application.farm.is_verified = False
-            application.farm.save()
-
         serializer = self.serializer_class(application, data=data, partial=True)
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if status_value in ["approved", "rejected"]:
+            # Verifies the farm and notifies the farmer, see farms/service.py
+            review_applications([application.id], status_value, rejection_reason)
+        else:
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        application = with_profile(Application.objects.all(), "farm__farmer").get(
+            pk=application.pk
+        )
+        return Response(
+            self.serializer_class(application).data, status=status.HTTP_200_OK
+        )
+
+
+class ApplicationQueueView(generics.ListAPIView):
+    """
+    The pending applications, oldest first.
+    """
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    serializer_class = ApplicationSerializer
+    permission_classes = [IsAdmin]
+    pagination_class = ApplicationCursorPagination
+
+    def get_queryset(self):
+        return with_profile(
+            Application.objects.filter(status=ApplicationStatus.PENDING),
+            "farm__farmer",
+        )
+
+
+class ApplicationReviewView(APIView):
+    serializer_class = ApplicationReviewSerializer
+    permission_classes = [IsAdmin]
+
+    def post(self, request):
+        """
+        Approve or reject many applications at once.
+        """
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({"reviewed": review_applications(**serializer.validated_data)})
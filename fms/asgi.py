@@ -1,16 +1,26 @@
 import os
+
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from chat.routing import websocket_urlpatterns
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "fms.settings")
 
+# Sets Django up; must run before anything importing models
+http_application = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+
+from chat.routing import websocket_urlpatterns  # noqa: E402
+from fms.ratelimit import WebSocketRateLimitMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),  # Handles HTTP traffic
-        "websocket": AuthMiddlewareStack(
-            URLRouter(websocket_urlpatterns)  # Routes WebSocket traffic
+        "http": http_application,  # Handles HTTP traffic
+        # Rate limited before anything else runs
+        "websocket": WebSocketRateLimitMiddleware(
+            AuthMiddlewareStack(
+                URLRouter(websocket_urlpatterns)  # Routes WebSocket traffic
+            )
         ),
     }
 )
@@ -0,0 +1,89 @@
+"""
+Async entry points for read-heavy DRF views.
+
+Under ASGI Django runs every sync view on one thread per process, so a
+worker serves a single sync request at a time however many are waiting.
+Views using AsyncReadMixin are exposed as coroutines instead: a safe
+request runs the whole DRF view (authentication, queries, serialization
+and rendering) on a pooled thread, and concurrent reads proceed side by
+side. The ORM of this Django version is sync-only, so the thread pool is
+where the queries run; database_sync_to_async closes expired connections
+around each call, as it does for the chat consumers.
+
+A view may widen concurrent_methods to writes that are safe off the sync
+thread: login and registration, which mostly wait for the password
+hashing pool (users/passwords.py).
+
+Everything else stays on Django's sync thread, as if the view were sync:
+other writes, requests served over WSGI (the test client, where the test's
+transaction lives on the calling thread), profiled requests (rendering is
+timed when Django renders the response) and all requests when
+ASYNC_READ_VIEWS is off.
+
+The project's own middleware is async-capable, so these views are not
+funnelled through the sync thread. Django's MiddlewareMixin hooks still
+hop to it briefly on the way in and out.
+"""
+
+import functools
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse
+from rest_framework.permissions import SAFE_METHODS
+
+from perf import profiling
+
+
+def runs_concurrently(request, methods=SAFE_METHODS):
+    return (
+        settings.ASYNC_READ_VIEWS
+        and isinstance(request, ASGIRequest)
+        and request.method in methods
+        and profiling.current.get() is None
+    )
+
+
+def rendered(response):
+    """
+    Render a DRF response into a plain HttpResponse, so Django does not
+    hop back to the sync thread to render it.
+    """
+    if not callable(getattr(response, "render", None)):
+        return response
+    response.render()
+    plain = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        plain[header] = value
+    plain.cookies = response.cookies
+    return plain
+
+
+def async_view(view, methods=SAFE_METHODS):
+    def concurrent(request, *args, **kwargs):
+        return rendered(view(request, *args, **kwargs))
+
+    concurrent = database_sync_to_async(concurrent, thread_sensitive=False)
+    # What Django itself does with a sync view
+    sync = sync_to_async(view, thread_sensitive=True)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if runs_concurrently(request, methods):
+            return await concurrent(request, *args, **kwargs)
+        return await sync(request, *args, **kwargs)
+
+    return wrapper
+
+
+class AsyncReadMixin:
+    # Serve the view as a coroutine, see the module docstring. (A comment,
+    # as the API schema would show a docstring on every endpoint.)
+    concurrent_methods = SAFE_METHODS
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        return async_view(view, cls.concurrent_methods)
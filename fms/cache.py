@@ -0,0 +1,134 @@
+"""
+Cache configuration, and a Redis backend (Django ships one from 4.0).
+
+Everything kept in the cache must be seen by every process that reads
+it: cached users and profiles are dropped on save, the farm catalogue on
+reviews, and replica pins (fms/db_router.py) are set by the process that
+wrote and read by whichever serves the next request. CACHE_STORE picks
+the backend:
+    memory (default)  per process; enough for a single process and tests
+    redis             shared by all workers, at REDIS_URL
+"""
+
+import pickle
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+import redis
+
+
+def build_caches(environ, redis_url):
+    store = environ.get("CACHE_STORE", "memory")
+    if store == "memory":
+        default = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    elif store == "redis":
+        default = {
+            "BACKEND": "fms.cache.RedisCache",
+            "LOCATION": redis_url,
+            "KEY_PREFIX": "cache",
+        }
+    else:
+        raise ValueError(f"Unknown cache store {store!r}")
+    return {"default": default}
+
+
+class RedisCache(BaseCache):
+    def __init__(self, server, params):
+        super().__init__(params)
+        # Thread safe; connections come from the client's pool
+        self.client = redis.Redis.from_url(server)
+
+    def get_backend_timeout(self, timeout=DEFAULT_TIMEOUT):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(0, int(timeout))
+
+    def encode(self, value):
+        # Integers stay plain so INCRBY works on them
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.key(key, version)
+        timeout = self.get_backend_timeout(timeout)
+        if timeout == 0:
+            added = bool(self.client.set(key, self.encode(value), nx=True))
+            if added:
+                self.client.delete(key)
+            return added
+        return bool(self.client.set(key, self.encode(value), ex=timeout, nx=True))
+
+    def get(self, key, default=None, version=None):
+        value = self.client.get(self.key(key, version))
+        return default if value is None else self.decode(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.key(key, version)
+        timeout = self.get_backend_timeout(timeout)
+        if timeout == 0:
+            self.client.delete(key)
+        else:
+            self.client.set(key, self.encode(value), ex=timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.key(key, version)
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return bool(self.client.persist(key))
+        return bool(self.client.expire(key, timeout))
+
+    def delete(self, key, version=None):
+        return bool(self.client.delete(self.key(key, version)))
+
+    def has_key(self, key, version=None):
+        return bool(self.client.exists(self.key(key, version)))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.key(key, version)
+        if not self.client.exists(key):
+            raise ValueError(f"Key '{key}' not found")
+        return self.client.incr(key, delta)
+
+    def get_many(self, keys, version=None):
+        keys = {self.key(key, version): key for key in keys}
+        values = self.client.mget(list(keys))
+        return {
+            keys[key]: self.decode(value)
+            for key, value in zip(keys, values)
+            if value is not None
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.get_backend_timeout(timeout)
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in data.items():
+            key = self.key(key, version)
+            if timeout == 0:
+                pipeline.delete(key)
+            else:
+                pipeline.set(key, self.encode(value), ex=timeout)
+        pipeline.execute()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.key(key, version) for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        # Only this cache's keys; revocation and rate limits share the server
+        keys = list(self.client.scan_iter(f"{self.key_prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
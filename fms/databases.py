@@ -0,0 +1,83 @@
+"""
+Database configuration from the environment.
+
+DB_ENGINE selects the backend:
+    sqlite (default)  single file at DB_NAME (defaults to db.sqlite3)
+    postgres          DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+
+Connections are kept open for DB_CONN_MAX_AGE seconds (default 60 on
+Postgres). Read replicas are listed in DB_REPLICA_HOSTS (comma separated,
+same credentials as the primary); they become the "replica_<n>" aliases.
+For local runs and tests, DB_SQLITE_REPLICAS=<n> adds SQLite aliases that
+mirror the primary, which exercises replica routing on a single node.
+
+Chat rooms and messages move to a separate "chat" database when
+CHAT_DB_NAME is set: a file path on SQLite, or a database name on Postgres
+(on CHAT_DB_HOST, defaulting to DB_HOST). Run `manage.py migrate
+--database=chat` to create it.
+
+SQLite waits up to DB_SQLITE_BUSY_TIMEOUT seconds (default 20) for a lock
+before failing; see fms/sqlite.py for the DB_SQLITE_PROFILE=tuned mode.
+"""
+
+import os
+
+
+def sqlite_database(environ, name):
+    return {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name,
+        "OPTIONS": {
+            "timeout": float(environ.get("DB_SQLITE_BUSY_TIMEOUT", "20")),
+        },
+    }
+
+
+def postgres_database(environ, host):
+    return {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": environ.get("DB_NAME", "fms"),
+        "USER": environ.get("DB_USER", "fms"),
+        "PASSWORD": environ.get("DB_PASSWORD", ""),
+        "HOST": host,
+        "PORT": environ.get("DB_PORT", "5432"),
+        "CONN_MAX_AGE": int(environ.get("DB_CONN_MAX_AGE", "60")),
+        "OPTIONS": {
+            "connect_timeout": int(environ.get("DB_CONNECT_TIMEOUT", "5")),
+        },
+    }
+
+
+def build_databases(base_dir, environ=os.environ):
+    """
+    Return (DATABASES, DATABASE_REPLICAS) for the given environment.
+    """
+    engine = environ.get("DB_ENGINE", "sqlite")
+    replicas = {}
+
+    if engine == "postgres":
+        default = postgres_database(environ, environ.get("DB_HOST", "localhost"))
+        hosts = [h.strip() for h in environ.get("DB_REPLICA_HOSTS", "").split(",")]
+        for number, host in enumerate(filter(None, hosts), start=1):
+            replicas[f"replica_{number}"] = dict(
+                postgres_database(environ, host), TEST={"MIRROR": "default"}
+            )
+    elif engine == "sqlite":
+        default = sqlite_database(
+            environ, environ.get("DB_NAME", base_dir / "db.sqlite3")
+        )
+        default["CONN_MAX_AGE"] = int(environ.get("DB_CONN_MAX_AGE", "0"))
+        for number in range(1, int(environ.get("DB_SQLITE_REPLICAS", "0")) + 1):
+            replicas[f"replica_{number}"] = dict(default, TEST={"MIRROR": "default"})
+    else:
+        raise ValueError(f"Unsupported DB_ENGINE: {engine}")
+
+    databases = {"default": default, **replicas}
+    chat_name = environ.get("CHAT_DB_NAME")
+    if chat_name and engine == "postgres":
+        chat_host = environ.get("CHAT_DB_HOST", default["HOST"])
+        databases["chat"] = dict(postgres_database(environ, chat_host), NAME=chat_name)
+    elif chat_name:
+        databases["chat"] = sqlite_database(environ, chat_name)
+
+    return databases, list(replicas)
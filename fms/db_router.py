@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import random
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# Set while a read-only endpoint that tolerates replica lag is being served
+use_replica = contextvars.ContextVar("use_replica", default=False)
+
+
+def primary_pin_key(user_id):
+    return f"db:pin-primary:{user_id}"
+
+
+def pin_to_primary(user_id):
+    """
+    Send the user's reads to the primary for REPLICA_PIN_SECONDS so they
+    always see their own writes, whatever the replication lag.
+    """
+    if settings.DATABASE_REPLICAS:
+        cache.set(primary_pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user_id):
+    return bool(cache.get(primary_pin_key(user_id)))
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes and ordinary reads go to the primary ("default"). Reads made
+    while serving a ReplicaReadMixin view go to a random replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and use_replica.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False  # Replicas receive the schema through replication
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Serve safe requests of this view from a read replica, unless the user
+    has written recently (see ReplicaPinningMiddleware).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not settings.DATABASE_REPLICAS:
+            return
+        user = request.user
+        if request.method in SAFE_METHODS and not (
+            user.is_authenticated and is_pinned_to_primary(user.id)
+        ):
+            self.replica_token = use_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Threads are reused across requests, so never leak the flag
+        if getattr(self, "replica_token", None) is not None:
+            use_replica.reset(self.replica_token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pin users to the primary after any successful write request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # The user may still be the lazy session user, and the cache
+            # client is sync
+            await sync_to_async(self.pin, thread_sensitive=True)(request)
+        return response
+
+    def pin(self, request):
+        # DRF copies the authenticated user onto the Django request
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.id)
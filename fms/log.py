@@ -0,0 +1,148 @@
+"""
+Structured logging for the project.
+
+Records are rendered as one JSON object per line and tagged with the id
+of the HTTP request or WebSocket connection they belong to. Handlers only
+enqueue records; formatting and the actual write happen on a background
+listener thread, so logging never blocks a request or the event loop.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from asgiref.sync import markcoroutinefunction
+
+request_id = contextvars.ContextVar("request_id", default=None)
+connection_id = contextvars.ContextVar("connection_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the low-level records of the given hot-path
+    loggers. Records at WARNING and above always pass.
+    """
+
+    def __init__(self, rate=1.0, loggers=(), level="INFO"):
+        super().__init__()
+        self.rate = float(rate)
+        self.loggers = tuple(loggers)
+        self.level = logging.getLevelName(level)
+
+    def filter(self, record):
+        if record.levelno > self.level or not record.name.startswith(self.loggers):
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a queue drained by a listener thread writing to stderr.
+    Only the context ids are captured in the calling thread; the configured
+    formatter runs on the listener thread.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.start_listener()
+        atexit.register(self.close)
+        # Server workers forked from a preloaded master inherit the handler
+        # but not its thread
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def start_listener(self):
+        self.listener = logging.handlers.QueueListener(
+            self.queue, self.target, respect_handler_level=False
+        )
+        self.listener.start()
+
+    def after_fork(self):
+        if self.listener is not None:
+            # Records still queued were the parent's to write
+            self.queue = queue.SimpleQueue()
+            self.start_listener()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def close(self):
+        # Flush everything still queued; safe to call more than once
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+    def prepare(self, record):
+        record.request_id = request_id.get()
+        record.connection_id = connection_id.get()
+        return record
+
+
+class RequestIdMiddleware:
+    """
+    Tag every log record of a request with its id, taken from the
+    X-Request-ID header when the proxy sets one, and echo it back.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        current_id = request.headers.get("X-Request-ID") or new_id()
+        token = request_id.set(current_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response["X-Request-ID"] = current_id
+        return response
+
+    async def __acall__(self, request):
+        current_id = request.headers.get("X-Request-ID") or new_id()
+        token = request_id.set(current_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response["X-Request-ID"] = current_id
+        return response
@@ -0,0 +1,245 @@
+"""
+Prometheus metrics, rendered in the text exposition format at /metrics.
+
+Recording never takes a lock: every thread (including the event loop
+thread serving WebSockets) updates its own shard, and the shards are only
+summed when /metrics is scraped. A metric update is a dict lookup and an
+addition, well under a microsecond. Values are kept per process, so each
+worker is scraped separately and Prometheus sums across them.
+"""
+
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; suited to HTTP requests and database transactions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds; channel layer round trips are much shorter
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+REGISTRY = []
+
+
+def escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.local = threading.local()
+        self.shards = []  # (thread, values)
+        self.retired = {}  # Merged values of threads that have exited
+        self.shards_lock = threading.Lock()  # Taken once per thread
+        REGISTRY.append(self)
+
+    def shard(self):
+        try:
+            return self.local.values
+        except AttributeError:
+            values = self.local.values = {}
+            with self.shards_lock:
+                self.shards.append((threading.current_thread(), values))
+            return values
+
+    def collect(self):
+        """
+        Return {label values: merged value} over all shards.
+        """
+        with self.shards_lock:
+            live = []
+            for thread, values in self.shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    self.retired = self.merge_all([self.retired, values])
+            self.shards = live
+            retired = self.retired
+        # dict.copy() runs without releasing the GIL, so it is a consistent
+        # snapshot even while the owning thread writes
+        return self.merge_all([retired, *(values.copy() for _, values in live)])
+
+    def merge_all(self, shards):
+        merged = {}
+        for shard in shards:
+            for key, value in shard.items():
+                merged[key] = self.merge(merged.get(key), value)
+        return merged
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for key, value in sorted(self.collect().items()):
+            lines.extend(self.render_sample(key, value))
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        shard = self.shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def merge(self, total, value):
+        return value if total is None else total + value
+
+    def render_sample(self, key, value):
+        yield f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self.shard()
+        # One slot per bucket plus +Inf, then the sum
+        counts = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def render_sample(self, key, value):
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], value):
+            cumulative += count
+            labels = format_labels(self.labels, key, f'le="{bound}"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = format_labels(self.labels, key)
+        yield f"{self.name}_sum{labels} {format_value(value[-1])}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_requests = Counter(
+    "http_requests_total",
+    "HTTP requests by view, method and status.",
+    ["view", "method", "status"],
+)
+http_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by view.", ["view"]
+)
+ws_connects = Counter(
+    "websocket_connects_total", "WebSocket connections opened.", ["consumer"]
+)
+ws_disconnects = Counter(
+    "websocket_disconnects_total", "WebSocket connections closed.", ["consumer"]
+)
+ws_open = Gauge(
+    "websocket_open_connections", "Open WebSocket connections.", ["consumer"]
+)
+chat_frames = Counter(
+    "chat_frames_total", "Frames received by ChatConsumer, by type.", ["type"]
+)
+group_send_duration = Histogram(
+    "channel_layer_group_send_seconds",
+    "Latency of channel layer group_send calls.",
+    buckets=FAST_BUCKETS,
+)
+checkout_duration = Histogram(
+    "checkout_duration_seconds", "Checkout latency by outcome.", ["outcome"]
+)
+checkout_failures = Counter(
+    "checkout_failures_total", "Failed checkouts by reason.", ["reason"]
+)
+stock_outs = Counter(
+    "product_stock_outs_total", "Products whose stock reached zero on checkout."
+)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        return self.observe(request, response, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.observe(request, response, started)
+
+    def observe(self, request, response, started):
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        http_duration.observe(time.perf_counter() - started, view)
+        http_requests.inc(view, request.method, response.status_code)
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. When METRICS_TOKEN is set, scrapers must
+    send it as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    if token and not constant_time_compare(authorization, f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
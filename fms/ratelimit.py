@@ -0,0 +1,218 @@
+"""
+Rate limiting.
+
+Requests are metered with token buckets: a bucket holds up to N tokens,
+refills at N per period and every request takes one, so a client can
+burst up to N and is then held to the average rate. RATE_LIMITS maps a
+scope to its rate, in DRF's "count/period" format ("10/min").
+
+- API views name their scope in throttle_scope; RateLimitThrottle (a
+  default throttle class) keys the bucket by scope and user, or client IP
+  for anonymous requests. A rejected request gets a 429 with Retry-After.
+  Throttles run before the view, and authentication reads the user from
+  the cache, so a rejection costs no query.
+- WebSocketRateLimitMiddleware wraps the ASGI WebSocket application. It
+  refuses handshakes over the "ws-connect" rate per client IP before the
+  consumer (and its token and room queries) runs, and drops frames over
+  the "ws-message" rate per connection before they reach receive().
+
+API buckets live in the store named by RATE_LIMIT_STORE: "memory" counts
+per process, "redis" shares atomic counters (a Lua script) across
+workers. A connection lives in one process, so its message bucket is
+always local.
+"""
+
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+import redis
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """
+    Return (capacity, tokens per second) for a "count/period" rate.
+    """
+    count, period = rate.split("/")
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.capacity, self.refill = parse_rate(rate)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        """
+        Take a token. Return 0 if there was one, or else the seconds until
+        there is.
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill)
+        self.updated = max(now, self.updated)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.refill
+
+
+class MemoryStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, key, rate):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= 10000:
+                    self.prune(now)
+                bucket = self.buckets[key] = TokenBucket(rate)
+            return bucket.take(now)
+
+    def prune(self, now):
+        # A bucket that has refilled is the same as a new one
+        self.buckets = {
+            key: bucket
+            for key, bucket in self.buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.refill
+            < bucket.capacity
+        }
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+# KEYS[1] = bucket, ARGV = capacity, tokens per second. Uses the server
+# clock, so workers need not agree on the time; writing after TIME needs
+# the effects replication that is the default from Redis 5.
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / refill
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / refill) + 1)
+return tostring(wait)
+"""
+
+
+class RedisStore:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate):
+        capacity, refill = parse_rate(rate)
+        wait = self.script(keys=[f"ratelimit:{key}"], args=[capacity, refill])
+        return float(wait)
+
+    def clear(self):
+        keys = list(self.client.scan_iter("ratelimit:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+stores = {}
+
+
+def get_store():
+    backend = settings.RATE_LIMIT_STORE
+    if backend not in stores:
+        if backend == "memory":
+            stores[backend] = MemoryStore()
+        elif backend == "redis":
+            stores[backend] = RedisStore(settings.REDIS_URL)
+        else:
+            raise ValueError(f"Unknown rate limit store {backend!r}")
+    return stores[backend]
+
+
+class RateLimitThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        rate = settings.RATE_LIMITS.get(scope)
+        if rate is None:
+            return True
+        user = request.user
+        if user is not None and user.is_authenticated:
+            client = f"user:{user.id}"
+        else:
+            client = f"ip:{self.get_ident(request)}"
+        self.wait_time = get_store().take(f"{scope}:{client}", rate)
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+def websocket_ident(scope):
+    """
+    The client IP of a WebSocket, as BaseThrottle.get_ident() finds it
+    for a request.
+    """
+    headers = dict(scope.get("headers", ()))
+    forwarded = headers.get(b"x-forwarded-for", b"").decode("latin-1")
+    proxies = api_settings.NUM_PROXIES
+    if forwarded and proxies != 0:
+        if proxies is None:
+            return "".join(forwarded.split())
+        addresses = forwarded.split(",")
+        return addresses[-min(proxies, len(addresses))].strip()
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+class WebSocketRateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        connect_rate = settings.RATE_LIMITS.get("ws-connect")
+        if connect_rate is not None:
+            key = f"ws-connect:ip:{websocket_ident(scope)}"
+            # Off the event loop, as the store may be Redis
+            take = sync_to_async(get_store().take, thread_sensitive=False)
+            if await take(key, connect_rate):
+                # Closing before accepting rejects the handshake (403)
+                await receive()
+                await send({"type": "websocket.close"})
+                return
+
+        message_rate = settings.RATE_LIMITS.get("ws-message")
+        if message_rate is None:
+            return await self.app(scope, receive, send)
+
+        bucket = TokenBucket(message_rate)
+        rejection = json.dumps({"type": "error", "error": "rate_limited"})
+
+        async def limited_receive():
+            while True:
+                message = await receive()
+                if message["type"] != "websocket.receive" or not bucket.take():
+                    return message
+                # Dropped; tell the client so it can back off
+                await send({"type": "websocket.send", "text": rejection})
+
+        return await self.app(scope, limited_receive, send)
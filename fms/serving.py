@@ -0,0 +1,97 @@
+"""
+Gunicorn configuration for production serving.
+
+Two pools of uvicorn worker processes serve fms.asgi:application, and the
+proxy in front (deploy/nginx.conf) splits traffic between them:
+
+    api   short HTTP requests, everything but /ws/
+    chat  long-lived WebSockets under /ws/
+
+Keeping them apart means thousands of idle chat sockets never take a slot
+the REST API needs, and each pool is sized for its work. Workers of both
+pools share the Redis channel layer (REDIS_URL), so a message sent through
+any chat worker reaches sockets held by the others.
+
+Run a pool with
+
+    SERVER_POOL=api gunicorn -c python:fms.serving
+    SERVER_POOL=chat gunicorn -c python:fms.serving
+
+Sync Django views run one at a time per ASGI process (on its single sync
+thread), so the api pool gets 2 * CPUs + 1 workers and is recycled every
+SERVER_MAX_REQUESTS requests. Consumers are async, so the chat pool gets
+one worker per CPU. WEB_CONCURRENCY overrides either count, and the
+running pool can be grown or shrunk by one worker with `kill -TTIN` or
+`kill -TTOU` on the master.
+
+A logout or role switch revokes tokens in TOKEN_REVOCATION_STORE, so a
+pool of more than one worker needs the shared "redis" store: with
+"memory" the other workers would keep accepting the revoked tokens (and
+their stale role claim), and the master refuses to start.
+
+The app is imported once in the master before forking (preload_app), so
+workers start without loading Django themselves. A preloaded master keeps
+the old code on SIGHUP; deploy by sending SIGUSR2 (a new master with the
+new code starts alongside) and then SIGTERM to the old master, which
+drains its workers for up to SERVER_GRACEFUL_TIMEOUT seconds.
+"""
+
+import multiprocessing
+import os
+
+POOLS = {
+    "api": {
+        "port": 8000,
+        "worker_class": "fms.workers.ApiWorker",
+        "workers": lambda cpus: 2 * cpus + 1,
+        "max_requests": 10000,
+    },
+    "chat": {
+        "port": 8001,
+        "worker_class": "fms.workers.ChatWorker",
+        "workers": lambda cpus: cpus,
+        # Recycling a chat worker would drop every socket it holds
+        "max_requests": 0,
+    },
+}
+
+
+def pool_settings(pool, environ=os.environ, cpu_count=None):
+    """
+    Return the gunicorn settings of the given pool for this environment.
+    """
+    if pool not in POOLS:
+        raise ValueError(f"Unknown SERVER_POOL {pool!r}, expected one of {list(POOLS)}")
+    defaults = POOLS[pool]
+    cpus = cpu_count or multiprocessing.cpu_count()
+    max_requests = int(environ.get("SERVER_MAX_REQUESTS", defaults["max_requests"]))
+    return {
+        "wsgi_app": "fms.asgi:application",
+        "bind": [f"0.0.0.0:{environ.get('PORT', defaults['port'])}"],
+        "worker_class": defaults["worker_class"],
+        "workers": int(environ.get("WEB_CONCURRENCY", defaults["workers"](cpus))),
+        "preload_app": True,
+        "max_requests": max_requests,
+        "max_requests_jitter": max_requests // 10,
+        "graceful_timeout": int(environ.get("SERVER_GRACEFUL_TIMEOUT", "30")),
+        "timeout": int(environ.get("SERVER_TIMEOUT", "30")),
+        "keepalive": 5,
+        "proc_name": f"fms-{pool}",
+        # Requests are logged by the application (fms/log.py)
+        "accesslog": None,
+    }
+
+
+def on_starting(server):
+    # The app is preloaded by now, so settings are configured
+    from django.conf import settings
+
+    if server.num_workers > 1 and settings.TOKEN_REVOCATION_STORE == "memory":
+        raise RuntimeError(
+            f"{server.num_workers} workers would each keep their own revoked "
+            "tokens; set TOKEN_REVOCATION_STORE=redis (or CACHE_STORE=redis) "
+            "or WEB_CONCURRENCY=1"
+        )
+
+
+globals().update(pool_settings(os.environ.get("SERVER_POOL", "api")))
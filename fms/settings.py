@@ -15,6 +15,8 @@ from datetime import timedelta
 import os
 
 from farms.utils import calculate_distance
+from fms.cache import build_caches
+from fms.databases import build_databases
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,26 +52,37 @@ INSTALLED_APPS = [
     "farms",
     "market",
     "chat",
+    "perf.apps.PerfConfig",
     "corsheaders",
 ]
 
 MIDDLEWARE = [
+    "fms.log.RequestIdMiddleware",
+    "fms.metrics.MetricsMiddleware",
+    "perf.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "fms.db_router.ReplicaPinningMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_THROTTLE_CLASSES": ("fms.ratelimit.RateLimitThrottle",),
+    # Proxies in front of the app; the client IP is taken from
+    # X-Forwarded-For accordingly (throttling is keyed by it)
+    "NUM_PROXIES": (
+        int(os.environ["NUM_PROXIES"]) if "NUM_PROXIES" in os.environ else None
+    ),
 }
 
 SIMPLE_JWT = {
@@ -80,6 +93,51 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Seconds a user stays in the authentication cache (users/authentication.py)
+USER_CACHE_SECONDS = int(os.environ.get("USER_CACHE_SECONDS", "60"))
+
+# Seconds a profile stays cached for ProfileView, unless a save drops it
+PROFILE_CACHE_SECONDS = int(os.environ.get("PROFILE_CACHE_SECONDS", "60"))
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379")
+
+# "memory" (per process) or "redis" (shared by all workers), see
+# fms/cache.py. The cached users, profiles, farm catalogue and replica pins
+# are only dropped or seen everywhere with "redis".
+CACHES = build_caches(os.environ, REDIS_URL)
+
+# Seconds the verified-farm catalogue stays cached for FarmViewSet. Farm
+# saves and application reviews drop it, but a "memory" cache drops it only
+# in the process that saved, so it is not cached there unless set.
+# Farmer profile changes show after this long.
+FARM_CATALOGUE_CACHE_SECONDS = int(
+    os.environ.get(
+        "FARM_CATALOGUE_CACHE_SECONDS",
+        "60" if os.environ.get("CACHE_STORE") == "redis" else "0",
+    )
+)
+
+# Revoked tokens and per-user watermarks (users/revocation.py): "memory"
+# (per process) or "redis" (shared by all workers). Like the cache, it is
+# shared when CACHE_STORE=redis; fms/serving.py refuses to start more than
+# one worker with "memory".
+TOKEN_REVOCATION_STORE = os.environ.get(
+    "TOKEN_REVOCATION_STORE",
+    "redis" if os.environ.get("CACHE_STORE") == "redis" else "memory",
+)
+
+# Token bucket rates per scope (fms/ratelimit.py): views name theirs in
+# throttle_scope, the ws-* scopes apply to WebSockets. Buckets are kept
+# per process ("memory") or shared ("redis").
+RATE_LIMITS = {
+    "register": os.environ.get("RATE_LIMIT_REGISTER", "10/hour"),
+    "login": os.environ.get("RATE_LIMIT_LOGIN", "10/min"),
+    "basket": os.environ.get("RATE_LIMIT_BASKET", "120/min"),
+    "ws-connect": os.environ.get("RATE_LIMIT_WS_CONNECT", "30/min"),
+    "ws-message": os.environ.get("RATE_LIMIT_WS_MESSAGE", "10/s"),
+}
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory")
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "FMS REST API",
     "DESCRIPTION": "API for managing and facilitating farmer marketing activities, including product listings, orders, and transactions.",
@@ -110,34 +168,99 @@ ASGI_APPLICATION = "fms.asgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# Configured from the environment, see fms/databases.py. SQLite is used
+# unless DB_ENGINE=postgres.
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    },
-    # "chat": {
-    #     "ENGINE": "djongo",
-    #     "NAME": "chat_messages",  # MongoDB database name
-    #     "CLIENT": {
-    #         "host": "mongodb://mongo:27017",  # MongoDB connection URI
-    #     },
-    # },
-}
+DATABASES, DATABASE_REPLICAS = build_databases(BASE_DIR)
+
+DATABASE_ROUTERS = [
+    "chat.db_router.ChatDatabaseRouter",
+    "fms.db_router.PrimaryReplicaRouter",
+]
+
+# "tuned" enables WAL and the single-writer lock for SQLite (fms/sqlite.py)
+SQLITE_PROFILE = os.environ.get("DB_SQLITE_PROFILE", "default")
 
-# DATABASE_ROUTERS = ["chat.db_router.ChatDatabaseRouter"]
+# Seconds a user's reads stay on the primary after they write
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "5"))
 
 
+# Shared by every ASGI worker process, see fms/serving.py
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("redis", 6379)],
+            "hosts": [REDIS_URL],
+        },
+    },
+}
+
+# Chat presence and typing indicators (seconds). Clients should send a
+# {"type": "heartbeat"} frame more often than CHAT_PRESENCE_TIMEOUT.
+CHAT_PRESENCE_TIMEOUT = 60
+CHAT_TYPING_INTERVAL = 3
+
+# Events buffered per notification socket before the oldest are dropped
+NOTIFICATION_QUEUE_SIZE = 100
+
+# Defaults of the archive_messages and archive_orders commands
+ARCHIVE_MESSAGES_AFTER_DAYS = 90
+ARCHIVE_ORDERS_AFTER_MONTHS = 12
+
+
+# Logging
+# JSON lines on stderr, written from a background thread. Debug records of
+# the per-message WebSocket path are sampled at LOG_SAMPLE_RATE.
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "fms.log.JsonFormatter"},
+    },
+    "filters": {
+        "sample_hot_paths": {
+            "()": "fms.log.SamplingFilter",
+            "rate": LOG_SAMPLE_RATE,
+            "loggers": ["chat.consumers.messages"],
         },
     },
+    "handlers": {
+        "default": {
+            "()": "fms.log.NonBlockingHandler",
+            "formatter": "json",
+            "filters": ["sample_hot_paths"],
+        },
+    },
+    "root": {
+        "handlers": ["default"],
+        "level": LOG_LEVEL,
+    },
 }
 
 
+# Serve safe requests of AsyncReadMixin views concurrently on pooled
+# threads under ASGI (fms/async_views.py)
+ASYNC_READ_VIEWS = os.environ.get("ASYNC_READ_VIEWS", "1") == "1"
+
+# Profiling (perf/profiling.py), off by default. Admins, and clients whose
+# PROFILE_HEADER header carries PROFILE_SECRET, can ask for a profile and
+# get a Server-Timing header; a PROFILE_SAMPLE_RATE fraction of all
+# requests is profiled too. Both feed the histograms at
+# /api/v1/perf/profiles/.
+PROFILE_HEADER = os.environ.get("PROFILE_HEADER", "")
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+
+
+# Prometheus scrape endpoint at /metrics (fms/metrics.py). When set,
+# scrapers must send "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -157,6 +280,41 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing (users/hashers.py). New passwords are encoded with the
+# PASSWORD_HASHER_PROFILE hasher and its parameters below; other hashes
+# still verify and are re-encoded on the next login.
+PASSWORD_HASHER_PROFILE = os.environ.get("PASSWORD_HASHER_PROFILE", "argon2")
+PASSWORD_ARGON2 = {
+    "time_cost": int(os.environ.get("ARGON2_TIME_COST", "2")),
+    "memory_cost": int(os.environ.get("ARGON2_MEMORY_COST", "19456")),  # KiB
+    "parallelism": int(os.environ.get("ARGON2_PARALLELISM", "1")),
+}
+PASSWORD_SCRYPT = {
+    "n": int(os.environ.get("SCRYPT_N", str(2**14))),
+    "r": int(os.environ.get("SCRYPT_R", "8")),
+    "p": int(os.environ.get("SCRYPT_P", "1")),
+}
+PASSWORD_HASHER_PROFILES = {
+    "argon2": "users.hashers.Argon2PasswordHasher",
+    "scrypt": "users.hashers.ScryptPasswordHasher",
+}
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE],
+    *(
+        hasher
+        for profile, hasher in PASSWORD_HASHER_PROFILES.items()
+        if profile != PASSWORD_HASHER_PROFILE
+    ),
+    # Hashes from before the profiles
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+
+# Processes hashing passwords (users/passwords.py), per server process;
+# 0 hashes in the calling thread
+PASSWORD_HASHING_WORKERS = int(os.environ.get("PASSWORD_HASHING_WORKERS", "2"))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -0,0 +1,82 @@
+"""
+SQLite performance profile for single-node deployments.
+
+With SQLITE_PROFILE = "tuned" every new SQLite connection switches to WAL
+journaling (readers never block the writer and vice versa), relaxes fsync
+to synchronous=NORMAL (safe in WAL mode) and memory-maps the database.
+Busy waiting is configured through DB_SQLITE_BUSY_TIMEOUT in
+fms/databases.py.
+
+SQLite still allows a single writer at a time, so write transactions of
+the hot paths go through write_transaction(), which queues writers of
+this process on a lock instead of letting them race for the file lock and
+fail with "database is locked".
+
+The pragmas are applied to connections as they are opened; the receiver
+is connected when this module is imported, which the models of the apps
+using write_transaction() do.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",  # 64 MiB
+]
+
+write_locks = {}
+write_locks_guard = threading.Lock()
+
+
+def profile_enabled():
+    return settings.SQLITE_PROFILE == "tuned"
+
+
+def apply_pragmas(cursor):
+    for pragma in PRAGMAS:
+        cursor.execute(pragma)
+
+
+@receiver(connection_created)
+def apply_sqlite_profile(sender, connection, **kwargs):
+    if connection.vendor == "sqlite" and profile_enabled():
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor)
+
+
+def write_lock(using):
+    with write_locks_guard:
+        return write_locks.setdefault(using, threading.Lock())
+
+
+@contextmanager
+def write_transaction(using=None, model=None):
+    """
+    transaction.atomic() that, under the tuned SQLite profile, first waits
+    for this process's single-writer lock on the database.
+    """
+    if using is None:
+        using = router.db_for_write(model) if model is not None else "default"
+    if connections[using].vendor != "sqlite" or not profile_enabled():
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Nested calls already hold the lock through the outer transaction
+    if connections[using].in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    with write_lock(using):
+        with transaction.atomic(using=using):
+            yield
@@ -0,0 +1,614 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+from pathlib import Path
+from unittest import mock
+
+import fakeredis
+import redis
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import (
+    AsyncClient,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from fms import metrics
+from fms.async_views import rendered
+from fms.cache import RedisCache, build_caches
+from fms.databases import build_databases
+from fms.db_router import (
+    PrimaryReplicaRouter,
+    ReplicaReadMixin,
+    pin_to_primary,
+    primary_pin_key,
+    use_replica,
+)
+from fms.log import JsonFormatter, NonBlockingHandler, SamplingFilter, request_id
+from fms.ratelimit import (
+    RedisStore,
+    TokenBucket,
+    WebSocketRateLimitMiddleware,
+    get_store,
+)
+from fms.serving import on_starting, pool_settings
+from fms.sqlite import apply_pragmas, write_lock, write_transaction
+from perf import factories, profiling
+from users import passwords
+from users.choices import Role
+from users.models import User
+from users.views import ProfileView
+
+
+class StructuredLoggingTestCase(SimpleTestCase):
+    def make_logger(self, name, rate=1.0):
+        stream = io.StringIO()
+        handler = NonBlockingHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(SamplingFilter(rate=rate, loggers=[f"{name}.hot"]))
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        self.addCleanup(handler.close)
+        return logger, handler, stream
+
+    def test_records_are_json_with_context_ids(self):
+        logger, handler, stream = self.make_logger("fms.tests.json")
+        token = request_id.set("abc123")
+        try:
+            logger.info("Order %s created", 7, extra={"order_id": 7})
+        finally:
+            request_id.reset(token)
+        handler.close()
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry["message"], "Order 7 created")
+        self.assertEqual(entry["request_id"], "abc123")
+        self.assertEqual(entry["order_id"], 7)
+        self.assertNotIn("connection_id", entry)
+
+    def test_hot_path_records_are_sampled_but_warnings_kept(self):
+        logger, handler, stream = self.make_logger("fms.tests.sampling", rate=0)
+        hot_logger = logging.getLogger("fms.tests.sampling.hot")
+        for _ in range(10):
+            hot_logger.debug("Received message")
+        hot_logger.warning("Channel layer is slow")
+        logger.debug("Not a hot path")
+        handler.close()
+
+        messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+        self.assertEqual(messages, ["Channel layer is slow", "Not a hot path"])
+
+
+class RequestIdMiddlewareTestCase(TestCase):
+    def test_request_id_is_echoed(self):
+        response = self.client.get("/api/v1/products/", HTTP_X_REQUEST_ID="req-1")
+        self.assertEqual(response["X-Request-ID"], "req-1")
+        self.assertTrue(self.client.get("/api/v1/products/")["X-Request-ID"])
+
+
+class DatabaseConfigTestCase(SimpleTestCase):
+    def test_sqlite_is_the_default(self):
+        databases, replicas = build_databases(Path("/srv"), {})
+        self.assertEqual(databases["default"]["ENGINE"], "django.db.backends.sqlite3")
+        self.assertEqual(replicas, [])
+
+    def test_postgres_with_replicas(self):
+        databases, replicas = build_databases(
+            Path("/srv"),
+            {
+                "DB_ENGINE": "postgres",
+                "DB_HOST": "primary",
+                "DB_REPLICA_HOSTS": "replica-a, replica-b",
+            },
+        )
+        self.assertEqual(replicas, ["replica_1", "replica_2"])
+        self.assertEqual(databases["default"]["HOST"], "primary")
+        self.assertEqual(databases["default"]["CONN_MAX_AGE"], 60)
+        self.assertEqual(databases["replica_2"]["HOST"], "replica-b")
+        self.assertEqual(databases["replica_1"]["TEST"], {"MIRROR": "default"})
+
+
+class SQLiteProfileTestCase(TransactionTestCase):
+    def test_pragmas_enable_wal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            connection = sqlite3.connect(Path(directory) / "profile.sqlite3")
+            try:
+                apply_pragmas(connection.cursor())
+                journal_mode = connection.execute("PRAGMA journal_mode").fetchone()
+                synchronous = connection.execute("PRAGMA synchronous").fetchone()
+            finally:
+                connection.close()
+        self.assertEqual(journal_mode, ("wal",))
+        self.assertEqual(synchronous, (1,))  # NORMAL
+
+    @override_settings(SQLITE_PROFILE="tuned")
+    def test_write_transaction_holds_single_writer_lock(self):
+        lock = write_lock("default")
+        with write_transaction():
+            self.assertTrue(lock.locked())
+            # Nested write transactions reuse the outer lock
+            with write_transaction():
+                pass
+        self.assertFalse(lock.locked())
+
+    def test_write_transaction_skips_lock_without_profile(self):
+        with mock.patch("fms.sqlite.write_lock") as lock:
+            with write_transaction():
+                pass
+        lock.assert_not_called()
+
+
+class CacheConfigTestCase(SimpleTestCase):
+    def test_memory_is_the_default(self):
+        caches = build_caches({}, "redis://redis:6379")
+        self.assertIn("LocMemCache", caches["default"]["BACKEND"])
+
+    def test_redis_is_shared(self):
+        caches = build_caches({"CACHE_STORE": "redis"}, "redis://redis:6379")
+        self.assertEqual(caches["default"]["BACKEND"], "fms.cache.RedisCache")
+        self.assertEqual(caches["default"]["LOCATION"], "redis://redis:6379")
+        with self.assertRaises(ValueError):
+            build_caches({"CACHE_STORE": "disk"}, "")
+
+
+class RedisCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.cache = self.make_cache("cache")
+
+    def make_cache(self, prefix):
+        client = fakeredis.FakeRedis(server=self.server)
+        with mock.patch.object(redis.Redis, "from_url", return_value=client):
+            return RedisCache("redis://redis:6379", {"KEY_PREFIX": prefix})
+
+    def test_values_round_trip(self):
+        values = {"count": 3, "flag": True, "name": "x", "user": {"id": 1}}
+        for key, value in values.items():
+            self.cache.set(key, value)
+
+        for key, value in values.items():
+            self.assertEqual(self.cache.get(key), value)
+        self.assertIs(self.cache.get("flag"), True)
+        # Integers are stored plain, everything else pickled
+        self.assertEqual(self.cache.client.get("cache:1:count"), b"3")
+        self.assertEqual(self.cache.get("missing", "default"), "default")
+
+    def test_timeouts(self):
+        self.cache.set("default", 1)
+        self.cache.set("forever", 1, timeout=None)
+        self.cache.set("gone", 1)
+        self.cache.set("gone", 2, timeout=0)
+
+        self.assertEqual(self.cache.client.ttl("cache:1:default"), 300)
+        self.assertEqual(self.cache.client.ttl("cache:1:forever"), -1)
+        self.assertIsNone(self.cache.get("gone"))
+        self.assertTrue(self.cache.add("new", 1, timeout=0))
+        self.assertFalse(self.cache.has_key("new"))
+        self.assertFalse(self.cache.add("default", 2))
+        self.assertTrue(self.cache.touch("default", None))
+        self.assertEqual(self.cache.client.ttl("cache:1:default"), -1)
+
+    def test_many(self):
+        self.cache.set_many({"a": 1, "b": [2], "c": "3"})
+        self.assertEqual(
+            self.cache.get_many(["a", "b", "missing"]), {"a": 1, "b": [2]}
+        )
+
+        self.cache.delete_many(["a", "b"])
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]), {"c": "3"})
+        self.assertTrue(self.cache.delete("c"))
+        self.assertFalse(self.cache.delete("c"))
+
+    def test_incr(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr("hits")
+        self.cache.set("hits", 1)
+
+        self.assertEqual(self.cache.incr("hits", 2), 3)
+        self.assertEqual(self.cache.get("hits"), 3)
+
+    def test_clear_only_drops_its_own_keys(self):
+        other = self.make_cache("other")
+        other.set("a", 1)
+        self.cache.set("a", 2)
+        self.cache.client.set("ratelimit:login:ip:1", 1)
+
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(other.get("a"), 1)
+        self.assertTrue(self.cache.client.exists("ratelimit:login:ip:1"))
+
+
+class ServingConfigTestCase(SimpleTestCase):
+    def test_pools_are_sized_from_the_cpu_count(self):
+        api = pool_settings("api", {}, cpu_count=4)
+        chat = pool_settings("chat", {}, cpu_count=4)
+        self.assertEqual((api["workers"], chat["workers"]), (9, 4))
+        self.assertEqual(api["bind"], ["0.0.0.0:8000"])
+        self.assertEqual(chat["worker_class"], "fms.workers.ChatWorker")
+        self.assertTrue(api["preload_app"] and chat["preload_app"])
+        self.assertEqual(chat["max_requests"], 0)
+
+    def test_environment_overrides(self):
+        settings = pool_settings(
+            "chat", {"WEB_CONCURRENCY": "3", "PORT": "9000"}, cpu_count=4
+        )
+        self.assertEqual(settings["workers"], 3)
+        self.assertEqual(settings["bind"], ["0.0.0.0:9000"])
+        with self.assertRaises(ValueError):
+            pool_settings("admin", {})
+
+    def test_workers_need_shared_token_revocation(self):
+        with override_settings(TOKEN_REVOCATION_STORE="memory"):
+            on_starting(mock.Mock(num_workers=1))
+            with self.assertRaises(RuntimeError):
+                on_starting(mock.Mock(num_workers=9))
+        with override_settings(TOKEN_REVOCATION_STORE="redis"):
+            on_starting(mock.Mock(num_workers=9))
+
+
+class CookieView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        response = Response({"ok": True})
+        response.set_cookie("seen", "1", httponly=True)
+        return response
+
+
+class RenderedResponseTestCase(SimpleTestCase):
+    def test_rendering_keeps_headers_and_cookies(self):
+        response = rendered(CookieView.as_view()(APIRequestFactory().get("/")))
+
+        self.assertEqual(response.content, b'{"ok":true}')
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.cookies["seen"].value, "1")
+        self.assertTrue(response.cookies["seen"]["httponly"])
+
+
+class ReplicaProbeView(ReplicaReadMixin, APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response({"db": PrimaryReplicaRouter().db_for_read(None)})
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRoutingTestCase(SimpleTestCase):
+    def probe(self, user):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user)
+        return ReplicaProbeView.as_view()(request).data["db"]
+
+    def test_reads_go_to_replica_until_user_writes(self):
+        user = mock.Mock(id=1001, is_authenticated=True)
+        self.assertEqual(self.probe(user), "replica_1")
+        self.assertFalse(use_replica.get())
+
+        pin_to_primary(user.id)
+        self.addCleanup(cache.delete, primary_pin_key(user.id))
+        self.assertIsNone(self.probe(user))
+
+    def test_pins_set_in_another_process_are_seen(self):
+        # A file cache stands in for Redis: shared, but not process-local
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": location,
+            }
+        }
+        script = textwrap.dedent(
+            f"""
+            import django
+            django.setup()
+            from django.test.utils import override_settings
+            from fms.db_router import pin_to_primary
+            with override_settings(
+                CACHES={caches!r}, DATABASE_REPLICAS=["replica_1"]
+            ):
+                pin_to_primary(1002)
+            """
+        )
+        subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=Path(__file__).resolve().parent.parent,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "fms.settings"},
+            check=True,
+        )
+
+        user = mock.Mock(id=1002, is_authenticated=True)
+        with self.settings(CACHES=caches):
+            self.assertIsNone(self.probe(user))
+        # The per-process cache never saw it
+        self.assertEqual(self.probe(user), "replica_1")
+
+
+class AsyncReadViewTestCase(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="async@example.com", password="x")
+        self.headers = {"authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def get_profiles(self, count):
+        client = AsyncClient()
+
+        async def requests():
+            return await asyncio.gather(
+                *(client.get("/api/v1/profile/", **self.headers) for _ in range(count))
+            )
+
+        return async_to_sync(requests)()
+
+    def test_reads_are_served_concurrently(self):
+        # Passes only if all three requests are inside the view at once
+        barrier = threading.Barrier(3, timeout=5)
+        get = ProfileView.get
+
+        def blocking_get(view, request):
+            barrier.wait()
+            return get(view, request)
+
+        with mock.patch.object(ProfileView, "get", blocking_get):
+            responses = self.get_profiles(3)
+
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertEqual(response.json()["email"], "async@example.com")
+
+    def test_logins_are_served_concurrently(self):
+        # Logins wait for the password pool off the sync thread
+        get_store().clear()
+        barrier = threading.Barrier(3, timeout=5)
+        check_password = passwords.check_password
+
+        def blocking_check_password(password, encoded):
+            barrier.wait()
+            return check_password(password, encoded)
+
+        client = AsyncClient()
+        credentials = json.dumps({"email": "async@example.com", "password": "x"})
+
+        async def logins():
+            return await asyncio.gather(
+                *(
+                    client.post(
+                        "/api/v1/token/", credentials, content_type="application/json"
+                    )
+                    for _ in range(3)
+                )
+            )
+
+        with mock.patch.object(passwords, "check_password", blocking_check_password):
+            responses = async_to_sync(logins)()
+
+        self.assertEqual([r.status_code for r in responses], [200] * 3)
+        self.assertIn("access", responses[0].json())
+
+    @override_settings(PROFILE_HEADER="X-Profile", PROFILE_SECRET="s3cret")
+    def test_profiled_reads_count_their_queries(self):
+        profiling.enable()
+        self.headers["x-profile"] = "s3cret"
+        (response,) = self.get_profiles(1)
+        self.headers["x-profile"] = "1"
+        (ignored,) = self.get_profiles(1)
+
+        self.assertNotIn("Server-Timing", ignored)
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+
+    @override_settings(ASYNC_READ_VIEWS=False)
+    def test_reads_share_the_sync_thread_when_disabled(self):
+        threads = set()
+        get = ProfileView.get
+
+        def recording_get(view, request):
+            threads.add(threading.get_ident())
+            return get(view, request)
+
+        with mock.patch.object(ProfileView, "get", recording_get):
+            responses = self.get_profiles(3)
+
+        self.assertEqual([r.status_code for r in responses], [200] * 3)
+        self.assertEqual(len(threads), 1)
+
+
+class EchoConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept()
+
+    async def receive(self, text_data):
+        await self.send(text_data=text_data)
+
+
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        get_store().clear()
+
+    def test_token_bucket_bursts_then_refills(self):
+        bucket = TokenBucket("2/s")
+        now = bucket.updated
+
+        self.assertEqual([bucket.take(now), bucket.take(now)], [0, 0])
+        self.assertAlmostEqual(bucket.take(now), 0.5)
+        self.assertEqual(bucket.take(now + 0.5), 0)
+
+    def test_redis_buckets_burst_then_refill(self):
+        client = fakeredis.FakeRedis()
+        with mock.patch.object(redis.Redis, "from_url", return_value=client):
+            store = RedisStore("redis://redis:6379")
+        # The script reads the server clock, which fakeredis takes from here
+        clock = [1000.0]
+
+        with mock.patch("time.time", lambda: clock[0]):
+            burst = [store.take("login:ip:1", "2/s") for _ in range(3)]
+            clock[0] += 0.25
+            waiting = store.take("login:ip:1", "2/s")
+            clock[0] += 0.25
+            refilled = store.take("login:ip:1", "2/s")
+            other = store.take("login:ip:2", "2/s")
+            ttl = client.ttl("ratelimit:login:ip:1")
+            client.set("revoked:jti:x", 1)
+            store.clear()
+            left = client.keys()
+
+        self.assertEqual(burst[:2], [0, 0])
+        self.assertAlmostEqual(burst[2], 0.5)
+        self.assertAlmostEqual(waiting, 0.25)
+        self.assertEqual((refilled, other), (0, 0))
+        self.assertEqual(ttl, 2)
+        self.assertEqual(left, [b"revoked:jti:x"])
+
+    @override_settings(RATE_LIMITS={"login": "2/min"})
+    def test_login_is_throttled_per_ip_without_queries(self):
+        client = APIClient()
+        credentials = {"email": "nobody@example.com", "password": "wrong"}
+        for _ in range(2):
+            response = client.post("/api/v1/token/", credentials)
+            self.assertEqual(response.status_code, 401)
+
+        with self.assertNumQueries(0):
+            response = client.post("/api/v1/token/", credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
+
+    @override_settings(RATE_LIMITS={"basket": "1/min"})
+    def test_basket_is_throttled_per_user(self):
+        def basket_request(email):
+            user = User.objects.create_user(
+                email=email, password="password123", role=Role.Buyer
+            )
+            client = APIClient()
+            client.credentials(
+                HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+            )
+            return lambda: client.get("/api/v1/basket-items/").status_code
+
+        first = basket_request("first@example.com")
+        second = basket_request("second@example.com")
+
+        self.assertNotEqual(first(), 429)
+        self.assertEqual(first(), 429)
+        self.assertNotEqual(second(), 429)
+
+    def communicator(self):
+        return WebsocketCommunicator(
+            WebSocketRateLimitMiddleware(EchoConsumer.as_asgi()), "/ws/echo/"
+        )
+
+    @override_settings(RATE_LIMITS={"ws-message": "2/min"})
+    def test_websocket_frames_over_the_rate_are_dropped(self):
+        async def exchange():
+            communicator = self.communicator()
+            await communicator.connect()
+            replies = []
+            for text in ["one", "two", "three"]:
+                await communicator.send_to(text_data=text)
+                replies.append(await communicator.receive_from())
+            await communicator.disconnect()
+            return replies
+
+        replies = async_to_sync(exchange)()
+
+        self.assertEqual(replies[:2], ["one", "two"])
+        self.assertEqual(json.loads(replies[2])["error"], "rate_limited")
+
+    @override_settings(RATE_LIMITS={"ws-connect": "1/min"})
+    def test_websocket_handshakes_over_the_rate_are_refused(self):
+        async def connect():
+            communicator = self.communicator()
+            connected, _ = await communicator.connect()
+            if connected:
+                await communicator.disconnect()
+            return connected
+
+        self.assertEqual([async_to_sync(connect)() for _ in range(2)], [True, False])
+
+
+class MetricsTestCase(TestCase):
+    databases = "__all__"
+
+    def test_counter_sums_thread_shards(self):
+        counter = metrics.Counter("test_events_total", "Test.", ["kind"])
+        self.addCleanup(metrics.REGISTRY.remove, counter)
+
+        def work():
+            for _ in range(100):
+                counter.inc("a")
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc("b", amount=2)
+
+        self.assertEqual(counter.collect(), {("a",): 400, ("b",): 2})
+        # Shards of finished threads are folded away, not lost
+        self.assertEqual(len(counter.shards), 1)
+
+    def test_histogram_exposition(self):
+        histogram = metrics.Histogram("test_seconds", "Test.", buckets=(0.1, 1))
+        self.addCleanup(metrics.REGISTRY.remove, histogram)
+        for value in (0.05, 0.5, 0.5, 3):
+            histogram.observe(value)
+
+        self.assertEqual(
+            histogram.render(),
+            [
+                "# HELP test_seconds Test.",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{le="0.1"} 1',
+                'test_seconds_bucket{le="1"} 3',
+                'test_seconds_bucket{le="+Inf"} 4',
+                "test_seconds_sum 4.05",
+                "test_seconds_count 4",
+            ],
+        )
+
+    def test_endpoint_exposes_http_and_checkout_metrics(self):
+        dataset = factories.seed(farms=1, buyers=1, messages_per_room=1)
+        dataset.buyer.basket.clear()
+        client = APIClient()
+        client.force_authenticate(dataset.buyer)
+        client.post("/api/v1/orders/")
+
+        body = self.client.get("/metrics").content.decode()
+
+        self.assertIn(
+            'http_requests_total{view="order-list",method="POST",status="400"}', body
+        )
+        self.assertIn('checkout_failures_total{reason="empty_basket"}', body)
+        self.assertIn('checkout_duration_seconds_count{outcome="failed"}', body)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_endpoint_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secre")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
@@ -24,9 +24,11 @@ from drf_spectacular.views import (
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
+from fms.metrics import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "api/docs/swagger/",
@@ -40,4 +42,5 @@ urlpatterns = [
     path("api/v1/", include("farms.urls")),
     path("api/v1/", include("market.urls")),
     path("api/v1/chat/", include("chat.urls")),
+    path("api/v1/perf/", include("perf.urls")),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
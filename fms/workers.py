@@ -0,0 +1,22 @@
+"""
+Uvicorn worker classes of the serving pools, see fms/serving.py.
+"""
+
+from uvicorn_worker import UvicornWorker
+
+
+class ApiWorker(UvicornWorker):
+    # Django's ASGI handler and channels' router do not speak the lifespan
+    # protocol, and WebSockets belong to the chat pool
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "lifespan": "off", "ws": "none"}
+
+
+class ChatWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "lifespan": "off",
+        "ws": "websockets",
+        # Pings notice dead peers; clients also send heartbeat frames
+        "ws_ping_interval": 20.0,
+        "ws_ping_timeout": 20.0,
+    }
@@ -0,0 +1,59 @@
+from django.db.models import Prefetch
+
+from fms.sqlite import write_transaction
+from market.models import ArchivedOrder, Order, OrderItem, OrderStatus
+from market.serializers import OrderItemSerializer
+
+ARCHIVABLE_STATUSES = [OrderStatus.Completed, OrderStatus.Canceled]
+
+
+def snapshot_items(order):
+    # As OrderSerializer shows them, so archived orders keep the same shape
+    return OrderItemSerializer(order.items.all(), many=True).data
+
+
+def archive_orders(older_than, batch_size=1000):
+    """
+    Move completed and cancelled orders created before `older_than` (with
+    their items) into ArchivedOrder, one write transaction per batch.
+    Returns the number of archived orders.
+    """
+    candidates = (
+        Order.objects.filter(
+            created_at__lt=older_than, status__in=ARCHIVABLE_STATUSES
+        )
+        .order_by("id")
+        .prefetch_related(
+            Prefetch(
+                "items",
+                queryset=OrderItem.objects.select_related(
+                    "product__farm", "product__category"
+                ),
+            )
+        )
+    )
+
+    archived = 0
+    while True:
+        with write_transaction(model=Order):
+            batch = list(candidates[:batch_size])
+            if not batch:
+                return archived
+            # ignore_conflicts makes a retried batch harmless
+            ArchivedOrder.objects.bulk_create(
+                [
+                    ArchivedOrder(
+                        id=order.id,
+                        buyer_id=order.buyer_id,
+                        farm_id=order.farm_id,
+                        total_price=order.total_price,
+                        status=order.status,
+                        items=snapshot_items(order),
+                        created_at=order.created_at,
+                    )
+                    for order in batch
+                ],
+                ignore_conflicts=True,
+            )
+            Order.objects.filter(id__in=[order.id for order in batch]).delete()
+        archived += len(batch)
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from market.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed and cancelled orders older than --months "
+        "into the archive table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=settings.ARCHIVE_ORDERS_AFTER_MONTHS
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(days=30 * options["months"])
+        archived = archive_orders(older_than, batch_size=options["batch_size"])
+        self.stdout.write(f"Archived {archived} orders created before {older_than}.")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from market.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Find products whose is_visible flag disagrees with their farm's "
+        "verification and their stock, and fix them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report drift without fixing it."
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            drifted = Product.objects.drifted().count()
+            self.stdout.write(f"{drifted} products have drifted.")
+            return
+        fixed = Product.objects.update_visibility()
+        self.stdout.write(f"Fixed the visibility of {fixed} products.")
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.12 on 2026-10-19 15:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_basket_items(apps, schema_editor):
+    """
+    Fold repeated (basket, product) lines into the oldest one so the
+    unique constraint can be added.
+    """
+    BasketItem = apps.get_model("market", "BasketItem")
+    duplicates = (
+        BasketItem.objects.values("basket", "product")
+        .annotate(lines=Count("id"), keep=Min("id"), total=Sum("quantity"))
+        .filter(lines__gt=1)
+    )
+    for duplicate in duplicates:
+        items = BasketItem.objects.filter(
+            basket=duplicate["basket"], product=duplicate["product"]
+        )
+        items.filter(id=duplicate["keep"]).update(quantity=duplicate["total"])
+        items.exclude(id=duplicate["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0007_archivedorder'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_basket_items, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['buyer', '-created_at'], name='order_buyer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['farm', 'status', '-created_at'], name='order_farm_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='basketitem',
+            constraint=models.UniqueConstraint(fields=('basket', 'product'), name='unique_basket_product'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.12 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+def backfill_is_visible(apps, schema_editor):
+    Product = apps.get_model("market", "Product")
+    db = schema_editor.connection.alias
+    Product.objects.using(db).filter(
+        farm__is_verified=True, stock_quantity__gt=0
+    ).update(is_visible=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_visible',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_visible'], name='product_visible_idx'),
+        ),
+        migrations.RunPython(backfill_is_visible, migrations.RunPython.noop),
+    ]
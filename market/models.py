@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from farms.models import Farm
+from fms import metrics
 from users.models import User
 
 
@@ -18,6 +22,33 @@ class Category(models.Model):
         return f"{self.name} - {self.description}"
 
 
+# When a product is shown in the catalogue; Product.is_visible stores it
+VISIBLE = Q(farm__is_verified=True, stock_quantity__gt=0)
+
+
+class ProductQuerySet(models.QuerySet):
+    def visible(self):
+        return self.filter(is_visible=True)
+
+    def drifted(self):
+        """
+        The products whose is_visible disagrees with their farm and stock.
+        """
+        return self.filter(
+            (VISIBLE & Q(is_visible=False)) | (~VISIBLE & Q(is_visible=True))
+        )
+
+    def update_visibility(self):
+        """
+        Recompute is_visible for the products with two set-based UPDATEs
+        that only touch the products whose flag is wrong. Returns the
+        number of products fixed.
+        """
+        shown = self.filter(VISIBLE, is_visible=False).update(is_visible=True)
+        hidden = self.exclude(VISIBLE).filter(is_visible=True).update(is_visible=False)
+        return shown + hidden
+
+
 class Product(models.Model):
     farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name="products")
     category = models.ForeignKey(
@@ -28,14 +59,41 @@ class Product(models.Model):
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock_quantity = models.PositiveIntegerField()
+    # Denormalized VISIBLE, so catalogue queries need not join farms. Kept
+    # by save(), Farm saves and application reviews; check_catalogue
+    # repairs drift.
+    is_visible = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["is_visible"], name="product_visible_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.stock_quantity:
+            self.is_visible = False
+        else:
+            # Read from the table: this instance, or its cached farm, may
+            # predate a review that hid the product with update_visibility()
+            self.is_visible = Farm.objects.filter(
+                pk=self.farm_id, is_verified=True
+            ).exists()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "stock_quantity" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "is_visible"}
+        super().save(*args, **kwargs)
+
     def decrease_stock(self, quantity):
         if self.stock_quantity < quantity:
             raise ValueError("Not enough stock")
         self.stock_quantity -= quantity
         self.save()
+        if self.stock_quantity == 0:
+            transaction.on_commit(metrics.stock_outs.inc)
 
     def __str__(self):
         return f"{self.name} - {self.farm.name} - {self.price}"
@@ -66,6 +124,13 @@ class BasketItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="items")
     quantity = models.PositiveIntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["basket", "product"], name="unique_basket_product"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - Qty: {self.quantity}"
 
@@ -90,10 +155,54 @@ class Order(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["buyer", "-created_at"], name="order_buyer_created_idx"),
+            models.Index(
+                fields=["farm", "status", "-created_at"], name="order_farm_status_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Date: {self.created_at} | Order {self.id} - Buyer: {self.buyer.email} - Status: {self.status} - Total: {self.total_price}"
 
 
+class ArchivedOrder(models.Model):
+    """
+    A completed or cancelled order moved out of the hot Order/OrderItem
+    tables by archive_orders. Items are kept as a JSON snapshot of
+    OrderItemSerializer.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    buyer = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="archived_orders"
+    )
+    farm = models.ForeignKey(
+        Farm,
+        on_delete=models.SET_NULL,
+        related_name="archived_orders",
+        null=True,
+        blank=True,
+    )
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=OrderStatus.choices)
+    items = models.JSONField(default=list)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["buyer", "-created_at"], name="archived_order_buyer_idx"
+            ),
+            models.Index(fields=["farm", "-created_at"], name="archived_order_farm_idx"),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id} - Buyer: {self.buyer_id} - Status: {self.status}"
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(
@@ -104,3 +213,10 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} - Qty: {self.quantity}"
+
+
+@receiver(post_save, sender=Farm)
+def update_product_visibility(sender, instance, created, **kwargs):
+    # Queryset updates of Farm.is_verified do the same, see farms/service.py
+    if not created:
+        instance.products.update_visibility()
@@ -0,0 +1,95 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class OrderHistoryPagination(BasePagination):
+    """
+    Keyset pagination of an order history, newest first: the live orders,
+    then the archived ones. The cursor holds the source, creation time and
+    id of the last order shown, so deep pages cost the same as the first
+    and no COUNT query is issued.
+    """
+
+    page_size = 50
+    page_size_query_param = "limit"
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_querysets(self, live, archived, request):
+        """
+        The page as a list of live orders and a list of archived ones.
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        source, position = self.decode_cursor(request)
+        live_page = []
+        if source == "live":
+            live_page = list(self.after(live, position)[: size + 1])
+            position = None
+        archived_page = []
+        if len(live_page) <= size:
+            archived_page = list(
+                self.after(archived, position)[: size + 1 - len(live_page)]
+            )
+
+        self.next_position = None
+        if len(live_page) + len(archived_page) > size:
+            if archived_page:
+                archived_page = archived_page[: size - len(live_page)]
+            else:
+                live_page = live_page[:size]
+            last = archived_page[-1] if archived_page else live_page[-1]
+            source = "archive" if archived_page else "live"
+            self.next_position = (source, last.created_at, last.id)
+        return live_page, archived_page
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def after(self, queryset, position):
+        queryset = queryset.order_by("-created_at", "-id")
+        if position is None:
+            return queryset
+        created_at, pk = position
+        return queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        source, created_at, pk = self.next_position
+        cursor = json.dumps([source, created_at.isoformat(), pk])
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            b64encode(cursor.encode()).decode(),
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return "live", None
+        try:
+            source, created_at, pk = json.loads(b64decode(encoded.encode()))
+            position = parse_datetime(created_at), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if source not in ("live", "archive") or position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return source, position
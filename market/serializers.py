@@ -3,7 +3,15 @@ from rest_framework import serializers
 from farms.models import Farm
 from farms.serializers import BriefFarmSerializer
 from users.serializers import BuyerSerializer
-from market.models import Basket, BasketItem, Category, Order, OrderItem, Product
+from market.models import (
+    ArchivedOrder,
+    Basket,
+    BasketItem,
+    Category,
+    Order,
+    OrderItem,
+    Product,
+)
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -124,3 +132,22 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def get_total_price(self, obj):
         return obj.total_price
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """
+    An archived order in the shape OrderSerializer gives a live one; items
+    are the snapshot archive_orders took with OrderItemSerializer.
+    """
+
+    total_price = serializers.SerializerMethodField()
+    buyer = BuyerSerializer(read_only=True)
+    farm = BriefFarmSerializer(read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = OrderSerializer.Meta.fields
+        read_only_fields = fields
+
+    def get_total_price(self, obj):
+        return obj.total_price
@@ -1,3 +1,224 @@
+import io
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from farms.models import Application, Farm
+from farms.service import review_applications
+from users.models import User
+from .archive import archive_orders
+from .models import (
+    ArchivedOrder,
+    BasketItem,
+    Category,
+    Order,
+    OrderItem,
+    OrderStatus,
+    Product,
+)
+
+
+class MarketTestCase(TestCase):
+    def setUp(self):
+        self.farmer = User.objects.create_user(
+            email="farmer@example.com", password="password123", role="Farmer"
+        )
+        self.buyer = User.objects.create_user(
+            email="buyer@example.com", password="password123", role="Buyer"
+        )
+        self.farm = Farm.objects.create(
+            farmer=self.farmer,
+            name="Test Farm",
+            address="123 Green Lane",
+            size="20 acres",
+            crop_types="Corn",
+            is_verified=True,
+        )
+        self.category = Category.objects.create(name="Vegetables")
+        self.product = Product.objects.create(
+            farm=self.farm,
+            category=self.category,
+            name="Corn",
+            price=2,
+            stock_quantity=100,
+        )
+        self.client = APIClient()
+
+    def create_order(self, status, age):
+        order = Order.objects.create(
+            buyer=self.buyer, farm=self.farm, total_price=4, status=status
+        )
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=2, price=2
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - age)
+        return order
+
+
+class OrderArchiveTestCase(MarketTestCase):
+    def test_only_old_finished_orders_are_archived(self):
+        old_completed = self.create_order(OrderStatus.Completed, timedelta(days=400))
+        old_pending = self.create_order(OrderStatus.Pending, timedelta(days=400))
+        recent_completed = self.create_order(OrderStatus.Completed, timedelta(days=1))
+
+        archived = archive_orders(timezone.now() - timedelta(days=360))
+
+        self.assertEqual(archived, 1)
+        self.assertEqual(
+            set(Order.objects.values_list("id", flat=True)),
+            {old_pending.id, recent_completed.id},
+        )
+        archived_order = ArchivedOrder.objects.get()
+        self.assertEqual(archived_order.id, old_completed.id)
+        self.assertEqual(archived_order.items[0]["product"]["name"], "Corn")
+
+    def test_archived_orders_are_read_through(self):
+        order = self.create_order(OrderStatus.Completed, timedelta(days=400))
+        recent = self.create_order(OrderStatus.Pending, timedelta(days=1))
+        archive_orders(timezone.now() - timedelta(days=360))
+
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get("/api/v1/orders/")
+        live, archived = response.data["results"]
+        self.assertEqual([live["id"], archived["id"]], [recent.id, order.id])
+        self.assertEqual(live.keys(), archived.keys())
+        self.assertEqual(
+            live["items"][0]["product"].keys(), archived["items"][0]["product"].keys()
+        )
+        self.assertEqual(archived["total_price"], live["total_price"])
+        response = self.client.get(f"/api/v1/orders/{order.id}/")
+        self.assertEqual(response.data["status"], OrderStatus.Completed)
+
+        self.client.force_authenticate(self.farmer)
+        response = self.client.get("/api/v1/farmer-orders/", {"status": "completed"})
+        self.assertEqual([o["id"] for o in response.data["results"]], [order.id])
+
+    def test_order_history_is_paginated(self):
+        archived = [
+            self.create_order(OrderStatus.Completed, timedelta(days=400 + days))
+            for days in range(3)
+        ]
+        live = [
+            self.create_order(OrderStatus.Pending, timedelta(days=days))
+            for days in range(2)
+        ]
+        archive_orders(timezone.now() - timedelta(days=360))
+
+        self.client.force_authenticate(self.buyer)
+        ids = []
+        response = self.client.get("/api/v1/orders/", {"limit": 2})
+        while True:
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids += [o["id"] for o in response.data["results"]]
+            if response.data["next"] is None:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(ids, [order.id for order in live + archived])
+        response = self.client.get("/api/v1/orders/", {"cursor": "nonsense"})
+        self.assertEqual(response.status_code, 404)
+
+
+class BasketItemTestCase(MarketTestCase):
+    def test_adding_a_product_twice_merges_the_line(self):
+        self.client.force_authenticate(self.buyer)
+        first = self.client.post(
+            "/api/v1/basket-items/", {"product": self.product.id, "quantity": 2}
+        )
+        second = self.client.post(
+            "/api/v1/basket-items/", {"product": self.product.id, "quantity": "3"}
+        )
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data["id"], first.data["id"])
+        self.assertEqual(second.data["quantity"], 5)
+        self.assertEqual(BasketItem.objects.filter(product=self.product).count(), 1)
+
+
+class ProductVisibilityTestCase(MarketTestCase):
+    def assertVisible(self, visible):
+        self.product.refresh_from_db()
+        self.assertIs(self.product.is_visible, visible)
+
+    def test_catalogue_reads_products_without_joining_farms(self):
+        Product.objects.create(
+            farm=self.farm,
+            category=self.category,
+            name="Sold out",
+            price=2,
+            stock_quantity=0,
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.buyer)}"
+        )
+        self.client.get("/api/v1/products/")  # Caches the user
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/products/")
+
+        self.assertEqual([p["id"] for p in response.data], [self.product.id])
+        self.assertEqual(response.data[0]["farm"]["id"], self.farm.id)
+        product_query = queries.captured_queries[0]["sql"]
+        self.assertIn('"is_visible"', product_query)
+        self.assertNotIn("JOIN", product_query)
+
+    def test_stock_changes_update_visibility(self):
+        self.assertVisible(True)
+        self.product.decrease_stock(100)
+        self.assertVisible(False)
+
+        self.product.stock_quantity = 5
+        self.product.save()
+        self.assertVisible(True)
+
+    def test_hidden_products_can_still_be_opened(self):
+        self.product.decrease_stock(100)
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get("/api/v1/products/").data, [])
+        response = self.client.get(f"/api/v1/products/{self.product.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["stock_quantity"], 0)
+
+        Farm.objects.filter(id=self.farm.id).update(is_verified=False)
+        response = self.client.get(f"/api/v1/products/{self.product.id}/")
+        self.assertEqual(response.status_code, 404)
+        self.client.force_authenticate(self.farmer)
+        response = self.client.get(f"/api/v1/products/{self.product.id}/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_reviews_update_visibility_in_bulk(self):
+        application = Application.objects.get(farm=self.farm)
+        review_applications([application.id], "rejected", "Unverified address")
+        self.assertVisible(False)
+
+        review_applications([application.id], "approved")
+        self.assertVisible(True)
+
+    def test_stale_instances_do_not_show_hidden_products(self):
+        product = Product.objects.select_related("farm").get(pk=self.product.pk)
+        application = Application.objects.get(farm=self.farm)
+        review_applications([application.id], "rejected", "Unverified address")
+
+        product.decrease_stock(1)
+        self.assertVisible(False)
+        self.assertEqual(self.product.stock_quantity, 99)
+
+    def test_check_catalogue_repairs_drift(self):
+        Product.objects.update(is_visible=False)
+        out = io.StringIO()
+
+        call_command("check_catalogue", "--dry-run", stdout=out)
+        self.assertIn("1 products have drifted", out.getvalue())
+        self.assertVisible(False)
 
-# Create your tests here.
+        call_command("check_catalogue", stdout=out)
+        self.assertIn("Fixed the visibility of 1 products", out.getvalue())
+        self.assertVisible(True)
+        self.assertFalse(Product.objects.drifted().exists())
@@ -1,7 +1,10 @@
+import logging
+import time
 from collections import defaultdict
 from farms.models import Application, Farm
 from farms.serializers import ApplicationSerializer, FarmSerializer
 from market.models import (
+    ArchivedOrder,
     Basket,
     BasketItem,
     Category,
@@ -10,7 +13,9 @@ from market.models import (
     OrderStatus,
     Product,
 )
+from market.pagination import OrderHistoryPagination
 from market.serializers import (
+    ArchivedOrderSerializer,
     BasketItemCreateSerializer,
     BasketItemSerializer,
     BasketSerializer,
@@ -28,12 +33,22 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
-from django.db import transaction
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from fms import metrics
+from fms.sqlite import write_transaction
+from chat.realtime import notify_user
+from fms.async_views import AsyncReadMixin
+from fms.db_router import ReplicaReadMixin
 
+logger = logging.getLogger(__name__)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+
+class CategoryViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
 
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -62,7 +77,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(AsyncReadMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for creating, retrieving, listing, updating, and deleting products.
     """
@@ -72,7 +87,18 @@ class ProductViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Product.objects.filter(farm__is_verified=True)
+        if self.action == "list":
+            # Farms and categories are fetched by id rather than joined, so
+            # the catalogue itself is read from the product table alone
+            return Product.objects.visible().prefetch_related("farm", "category")
+        if self.request.method not in SAFE_METHODS:
+            # Owners still manage their products when out of stock
+            return Product.objects.filter(farm__is_verified=True)
+        # Sold-out products can still be opened, and farmers see their own
+        # before their farm is verified
+        return Product.objects.filter(
+            Q(farm__is_verified=True) | Q(farm__farmer=self.request.user)
+        ).prefetch_related("farm", "category")
 
     def perform_create(self, serializer):
         serializer = ProductCreateSerializer(data=self.request.data)
@@ -174,6 +200,7 @@ class BasketItemViewSet(viewsets.ModelViewSet):
     queryset = BasketItem.objects.all()
     serializer_class = BasketItemSerializer
     permission_classes = [IsAuthenticated, IsBuyer]
+    throttle_scope = "basket"
 
     def get_queryset(self):
         """
@@ -199,31 +226,48 @@ class BasketItemViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Product and quantity are required.")
 
         product = Product.objects.get(id=product_id)
+        quantity = int(quantity)
 
-        if product.stock_quantity < int(quantity):
+        if product.stock_quantity < quantity:
             raise PermissionDenied("Not enough stock available.")
 
-        basket_item = BasketItem.objects.filter(basket=basket, product=product).first()
+        # (basket, product) is unique, so merging is a single UPDATE and a
+        # concurrent duplicate insert fails instead of adding a second line
+        basket_item = self.merge_item(basket, product, quantity)
         if basket_item:
-            print(
-                f"You have {basket_item.quantity} of this item in your basket. Adding {quantity} more."
-            )
-            basket_item.quantity += quantity
-            basket_item.save()
             return Response(
                 BasketItemSerializer(basket_item).data, status=status.HTTP_200_OK
             )
 
         if serializer.is_valid():
-            basket_item = serializer.save(
-                basket=basket, product=product, quantity=quantity
-            )
+            try:
+                with transaction.atomic():
+                    basket_item = serializer.save(
+                        basket=basket, product=product, quantity=quantity
+                    )
+            except IntegrityError:
+                basket_item = self.merge_item(basket, product, quantity)
+                return Response(
+                    BasketItemSerializer(basket_item).data, status=status.HTTP_200_OK
+                )
             return Response(
                 BasketItemSerializer(basket_item).data, status=status.HTTP_201_CREATED
             )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def merge_item(self, basket, product, quantity):
+        """
+        Add quantity to the basket's existing line for product, if any.
+        """
+        items = BasketItem.objects.filter(basket=basket, product=product)
+        if items.update(quantity=F("quantity") + quantity):
+            logger.debug(
+                "Added %s of product %s to basket %s", quantity, product.id, basket.id
+            )
+            return items.select_related("product").get()
+        return None
+
     def update(self, request, *args, **kwargs):
         basket_item = self.get_object()
         if basket_item.basket.buyer != request.user:
@@ -303,7 +347,48 @@ class BasketItemViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class ArchivedOrdersMixin:
+    """
+    Read-through to ArchivedOrder: listings are one keyset-paginated stream
+    of the user's live orders followed by their archived ones, and
+    retrieving an archived order id still works. Views name the archive's
+    lookup to the user in archived_filter.
+    """
+
+    def get_archived_queryset(self):
+        return ArchivedOrder.objects.filter(
+            **{self.archived_filter: self.request.user}
+        ).select_related("buyer__buyer_info", "farm")
+
+    def list(self, request, *args, **kwargs):
+        paginator = OrderHistoryPagination()
+        live, archived = paginator.paginate_querysets(
+            self.filter_queryset(self.get_queryset()),
+            self.get_archived_queryset(),
+            request,
+        )
+        archived = ArchivedOrderSerializer(
+            archived, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(
+            self.get_serializer(live, many=True).data + archived.data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archived_order = get_object_or_404(
+                self.get_archived_queryset(), pk=kwargs["pk"]
+            )
+            return Response(
+                ArchivedOrderSerializer(
+                    archived_order, context=self.get_serializer_context()
+                ).data
+            )
+
+
+class OrderViewSet(ArchivedOrdersMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing orders.
     """
@@ -311,21 +396,45 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated, IsBuyer]
+    archived_filter = "buyer"
 
     def get_queryset(self):
         """
         Restrict the queryset to the authenticated user's orders.
         """
-        return Order.objects.filter(buyer=self.request.user)
+        return (
+            Order.objects.filter(buyer=self.request.user)
+            .select_related("buyer__buyer_info")
+            .order_by("-created_at")
+        )
 
     def create(self, request):
+        started = time.perf_counter()
+        outcome = "failed"
+        try:
+            response = self.checkout(request)
+            if response.status_code == status.HTTP_201_CREATED:
+                outcome = "created"
+            return response
+        except Exception:
+            metrics.checkout_failures.inc("error")
+            raise
+        finally:
+            metrics.checkout_duration.observe(time.perf_counter() - started, outcome)
+
+    def checkout(self, request):
+        """
+        Turn the basket into one order per farm.
+        """
         basket = Basket.objects.filter(buyer=request.user).first()
         if not basket:
+            metrics.checkout_failures.inc("no_basket")
             return Response(
                 {"detail": "Basket not found."}, status=status.HTTP_404_NOT_FOUND
             )
 
         if not basket.items.exists():
+            metrics.checkout_failures.inc("empty_basket")
             return Response(
                 {"detail": "Basket is empty."}, status=status.HTTP_400_BAD_REQUEST
             )
@@ -342,6 +451,7 @@ class OrderViewSet(viewsets.ModelViewSet):
                 farm_items[product.farm].append(basket_item)
 
         if insufficient_stock_items:
+            metrics.checkout_failures.inc("insufficient_stock")
             return Response(
                 {
                     "detail": f"Insufficient stock for items: {', '.join(insufficient_stock_items)}"
@@ -352,7 +462,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         created_orders = []
 
         # Use a transaction to ensure atomicity
-        with transaction.atomic():
+        with write_transaction(model=Order):
             for farm, items in farm_items.items():
                 # Calculate the total price for the order
                 total_price = sum(item.quantity * item.product.price for item in items)
@@ -383,8 +493,20 @@ class OrderViewSet(viewsets.ModelViewSet):
 
                 created_orders.append(order)
 
-        # Clear the basket after creating all orders
-        basket.clear()
+                # Sent once the transaction commits
+                notify_user(
+                    farm.farmer_id,
+                    "order.created",
+                    {
+                        "order_id": order.id,
+                        "farm_id": farm.id,
+                        "buyer_id": request.user.id,
+                        "total_price": str(order.total_price),
+                    },
+                )
+
+            # Clear the basket in the same write transaction as the orders
+            basket.clear()
 
         return Response(
             {"orders": OrderSerializer(created_orders, many=True).data},
@@ -410,13 +532,29 @@ class OrderViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class FarmerOrderViewSet(viewsets.ModelViewSet):
+class FarmerOrderViewSet(ArchivedOrdersMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated, IsFarmer]
+    archived_filter = "farm__farmer"
 
     def get_queryset(self):
-        return Order.objects.filter(farm__farmer=self.request.user)
+        """
+        The farmer's orders, newest first, optionally narrowed to ?status=.
+        """
+        orders = Order.objects.filter(farm__farmer=self.request.user).select_related(
+            "buyer__buyer_info"
+        )
+        return self.filter_status(orders).order_by("-created_at")
+
+    def get_archived_queryset(self):
+        return self.filter_status(super().get_archived_queryset())
+
+    def filter_status(self, orders):
+        status_filter = self.request.query_params.get("status")
+        if status_filter in OrderStatus.values:
+            orders = orders.filter(status=status_filter)
+        return orders
 
     def update(self, request, *args, **kwargs):
         """
@@ -441,6 +579,12 @@ class FarmerOrderViewSet(viewsets.ModelViewSet):
         order.status = new_status
         order.save()
 
+        notify_user(
+            order.buyer_id,
+            "order.status",
+            {"order_id": order.id, "farm_id": order.farm_id, "status": order.status},
+        )
+
         return Response(
             {"detail": "Order status updated successfully.", "status": order.status},
             status=status.HTTP_200_OK,
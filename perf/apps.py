@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class PerfConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'perf'
+
+    def ready(self):
+        from perf import profiling
+
+        if profiling.profiling_enabled():
+            profiling.enable()
@@ -0,0 +1,120 @@
+"""
+Query audit of the hot API endpoints.
+
+Each endpoint is requested as a representative user of a seeded dataset
+(see perf/factories.py). Every SELECT it runs, on any database alias, is
+explained, and plans that read a whole table are flagged. Ordered index
+scans ("SCAN t USING INDEX") are not flagged: they stop at the LIMIT.
+"""
+
+import re
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+# (name, Dataset attribute of the requesting user, path, tables it may scan).
+# The product list returns every visible product and the farm list every
+# verified farm, so a scan is the cheapest plan for them.
+ENDPOINTS = [
+    ("products", "buyer", "/api/v1/products/", {"market_product"}),
+    ("product", "buyer", "/api/v1/products/{d.product.id}/", set()),
+    ("categories", "buyer", "/api/v1/categories/", {"market_category"}),
+    ("farms", "buyer", "/api/v1/farms/", {"farms_farm"}),
+    ("farm-products", "buyer", "/api/v1/farms/{d.farm.id}/products/", set()),
+    ("basket", "buyer", "/api/v1/basket/", set()),
+    ("orders", "buyer", "/api/v1/orders/", set()),
+    ("order", "buyer", "/api/v1/orders/{d.order.id}/", set()),
+    ("farmer-orders", "farmer", "/api/v1/farmer-orders/", set()),
+    ("farmer-queue", "farmer", "/api/v1/farmer-orders/?status=pending", set()),
+    ("pending-applications", "admin", "/api/v1/applications/?status=pending", set()),
+    ("application-queue", "admin", "/api/v1/applications/queue/", set()),
+    ("profile", "buyer", "/api/v1/profile/", set()),
+    ("chat-rooms", "buyer", "/api/v1/chat/rooms/?limit=20", set()),
+    ("chat-history", "buyer", "/api/v1/chat/history/{d.room.name}/", set()),
+    ("chat-unread", "buyer", "/api/v1/chat/unread/", set()),
+]
+
+SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)")
+POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+@dataclass
+class QueryPlan:
+    alias: str
+    sql: str
+    plan: list
+    full_scans: list
+
+
+@dataclass
+class EndpointAudit:
+    name: str
+    path: str
+    status_code: int
+    allowed_scans: set
+    queries: list = field(default_factory=list)
+
+    @property
+    def flagged(self):
+        """
+        Full scans of tables this endpoint is not expected to read whole.
+        """
+        return [
+            (query, table)
+            for query in self.queries
+            for table in query.full_scans
+            if table not in self.allowed_scans
+        ]
+
+
+def explain(connection, sql):
+    """
+    Return the plan of sql as a list of lines.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f"EXPLAIN {sql}")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(vendor, plan):
+    pattern = SQLITE_SCAN if vendor == "sqlite" else POSTGRES_SCAN
+    tables = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match and match.group(1) not in ("CONSTANT", "SUBQUERY"):
+            tables.append(match.group(1))
+    return tables
+
+
+def audit_endpoint(dataset, name, role, path, allowed_scans=()):
+    client = APIClient()
+    client.force_authenticate(getattr(dataset, role))
+    path = path.format(d=dataset)
+
+    with ExitStack() as stack:
+        captured = {
+            alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in connections
+        }
+        response = client.get(path)
+
+    audit = EndpointAudit(name, path, response.status_code, set(allowed_scans))
+    for alias, context in captured.items():
+        connection = connections[alias]
+        for query in context.captured_queries:
+            if not query["sql"].lstrip().upper().startswith("SELECT"):
+                continue
+            plan = explain(connection, query["sql"])
+            scans = full_scans(connection.vendor, plan)
+            audit.queries.append(QueryPlan(alias, query["sql"], plan, scans))
+    return audit
+
+
+def audit_endpoints(dataset, endpoints=ENDPOINTS):
+    return [audit_endpoint(dataset, *endpoint) for endpoint in endpoints]
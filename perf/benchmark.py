@@ -0,0 +1,253 @@
+"""
+Endpoint benchmarks over a seeded dataset.
+
+Each endpoint is requested in-process with the DRF test client, so the
+figures cover routing, authentication, the ORM, serializers and
+rendering but no network or server overhead. Results are plain dicts that
+the benchmark command stores as JSON; compare() checks them against a
+stored baseline.
+
+run_concurrency_benchmarks() instead sends many requests at once through
+the ASGI handler, to compare the async read views with their sync
+serving.
+"""
+
+import asyncio
+import statistics
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from market.models import BasketItem, Product
+from users.choices import Role
+from users.models import User
+
+# Row counts of the full dataset (scale 1.0): 10k farms, 1M products,
+# 1M orders and 10M chat messages. --scale shrinks farms and buyers; the
+# per-farm, per-buyer and per-room counts stay realistic.
+FULL_DATASET = {
+    "farms": 10_000,
+    "products_per_farm": 100,
+    "buyers": 100_000,
+    "orders_per_buyer": 10,
+    "messages_per_room": 100,
+}
+
+
+def dataset_size(scale):
+    size = dict(FULL_DATASET)
+    for key in ("farms", "buyers"):
+        size[key] = max(1, round(size[key] * scale))
+    return size
+
+
+def get(role, path):
+    def request(dataset, iteration):
+        return getattr(dataset, role), "get", path.format(d=dataset)
+
+    return request
+
+
+def checkout(dataset, iteration):
+    """
+    Fill a buyer's basket (not timed) and check it out.
+    """
+    buyers = User.objects.filter(role=Role.Buyer).order_by("id")
+    buyer = buyers[iteration % buyers.count()]
+    product_ids = list(
+        dataset.farm.products.order_by("id").values_list("id", flat=True)[:2]
+    )
+    products = Product.objects.filter(id__in=product_ids)
+    products.update(stock_quantity=10 ** 6)
+    products.update_visibility()
+    BasketItem.objects.bulk_create(
+        [
+            BasketItem(basket=buyer.basket, product_id=product_id, quantity=1)
+            for product_id in product_ids
+        ],
+        ignore_conflicts=True,
+    )
+    return buyer, "post", "/api/v1/orders/"
+
+
+BENCHMARKS = {
+    "product-list": get("buyer", "/api/v1/products/"),
+    "farm-list-distance": get("buyer", "/api/v1/farms/?latitude=43.5&longitude=76.5"),
+    "basket": get("buyer", "/api/v1/basket/"),
+    "checkout": checkout,
+    "farmer-orders": get("farmer", "/api/v1/farmer-orders/"),
+    "chat-inbox": get("buyer", "/api/v1/chat/rooms/?limit=20"),
+    "chat-history": get("buyer", "/api/v1/chat/history/{d.room.name}/"),
+}
+
+
+# Endpoints served through AsyncReadMixin (fms/async_views.py), compared
+# under concurrent load with ASYNC_READ_VIEWS off and on
+CONCURRENT_BENCHMARKS = {
+    "product-list": ("buyer", "/api/v1/products/"),
+    "product-detail": ("buyer", "/api/v1/products/{d.product.id}/"),
+    "farm-list": ("buyer", "/api/v1/farms/"),
+    "chat-inbox": ("buyer", "/api/v1/chat/rooms/?limit=20"),
+    "chat-history": ("buyer", "/api/v1/chat/history/{d.room.name}/"),
+    "profile": ("buyer", "/api/v1/profile/"),
+}
+
+
+def count_queries(client, method, path):
+    with ExitStack() as stack:
+        contexts = [
+            stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in connections
+        ]
+        response = getattr(client, method)(path)
+    return response, sum(len(context) for context in contexts)
+
+
+def run_benchmark(dataset, prepare, repeat=20, warmup=2):
+    """
+    Time repeat requests after warmup ones. Queries are counted on the
+    first warmup request only, so capturing them does not skew timings.
+    """
+    client = APIClient()
+    timings = []
+    queries = None
+    statuses = set()
+    for iteration in range(warmup + repeat):
+        user, method, path = prepare(dataset, iteration)
+        client.force_authenticate(user)
+        if queries is None:
+            response, queries = count_queries(client, method, path)
+        else:
+            started = time.perf_counter()
+            response = getattr(client, method)(path)
+            elapsed = time.perf_counter() - started
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+        statuses.add(response.status_code)
+
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "min_ms": round(timings[0], 3),
+        "queries": queries,
+        "statuses": sorted(statuses),
+    }
+
+
+def run_benchmarks(dataset, names=None, repeat=20, warmup=2):
+    return {
+        name: run_benchmark(dataset, prepare, repeat, max(1, warmup))
+        for name, prepare in BENCHMARKS.items()
+        if not names or name in names
+    }
+
+
+async def request_concurrently(path, headers, requests, concurrency):
+    """
+    Send requests through the ASGI handler with at most concurrency of
+    them in flight.
+    """
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    statuses = set()
+
+    async def request():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path, **headers)
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses.add(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        "requests_per_second": round(requests / elapsed, 1),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+        "p99_ms": round(timings[max(0, int(len(timings) * 0.99) - 1)], 3),
+        "statuses": sorted(statuses),
+    }
+
+
+def simulated_query_latency(seconds):
+    """
+    Sleep before every query, on every thread, to model the network round
+    trips of a remote database. The test database answers from memory, so
+    without this the views are CPU bound and threads cannot overlap them.
+    """
+    execute = CursorWrapper._execute_with_wrappers
+
+    def delayed(self, *args, **kwargs):
+        time.sleep(seconds)
+        return execute(self, *args, **kwargs)
+
+    return mock.patch.object(CursorWrapper, "_execute_with_wrappers", delayed)
+
+
+def run_concurrency_benchmarks(
+    dataset, names=None, requests=200, concurrency=20, query_latency=0.0
+):
+    """
+    Compare throughput and tail latency of the async read views with the
+    same views served the sync way.
+    """
+    results = {}
+    for name, (role, path) in CONCURRENT_BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        token = AccessToken.for_user(getattr(dataset, role))
+        headers = {"authorization": f"Bearer {token}"}
+        path = path.format(d=dataset)
+        results[name] = {}
+        for mode, enabled in [("sync", False), ("async", True)]:
+            with ExitStack() as stack:
+                stack.enter_context(override_settings(ASYNC_READ_VIEWS=enabled))
+                if query_latency:
+                    stack.enter_context(simulated_query_latency(query_latency))
+                # A few sequential requests first to warm caches
+                async_to_sync(request_concurrently)(path, headers, 2, 1)
+                results[name][mode] = async_to_sync(request_concurrently)(
+                    path, headers, requests, concurrency
+                )
+    return results
+
+
+def compare(results, baseline, threshold=0.2, min_delta_ms=1.0):
+    """
+    Return the regressions of results against baseline: a median slower
+    by more than threshold (a fraction) and min_delta_ms, or more queries.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        slower = current["median_ms"] - previous["median_ms"]
+        if (
+            slower > previous["median_ms"] * threshold
+            and slower > min_delta_ms
+        ):
+            regressions.append(
+                f"{name}: median {previous['median_ms']} -> "
+                f"{current['median_ms']} ms "
+                f"(+{slower / previous['median_ms']:.0%})"
+            )
+        if current["queries"] > previous["queries"]:
+            regressions.append(
+                f"{name}: {previous['queries']} -> {current['queries']} queries"
+            )
+    return regressions
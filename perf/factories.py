@@ -0,0 +1,289 @@
+"""
+Bulk factories for a realistic marketplace dataset.
+
+Rows are generated lazily and written with bulk_create one batch at a
+time, so even the full benchmark dataset (millions of messages) seeds
+with bounded memory. Signals do not fire for bulk inserts; the state
+they would maintain (applications, room summaries) is written here
+directly.
+"""
+
+import itertools
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from chat.models import Message, Room
+from farms.models import Application, ApplicationStatus, Farm
+from market.models import (
+    BasketItem,
+    Category,
+    Order,
+    OrderItem,
+    OrderStatus,
+    Product,
+)
+from users.choices import Role
+from users.models import User, user_cache_key
+from users.service import provision_users
+
+EMAIL_DOMAIN = "seed.example.com"
+PASSWORD = "seed-password"
+ADMIN_EMAIL = f"admin@{EMAIL_DOMAIN}"
+
+
+@dataclass
+class Dataset:
+    """
+    Representative rows of a seeded dataset, for building requests.
+    """
+
+    admin: User
+    farmer: User
+    buyer: User
+    farm: Farm
+    product: Product
+    order: Order
+    room: Room
+
+
+def last_id(model):
+    return model.objects.aggregate(last=Max("id"))["last"] or 0
+
+
+def new_rows(model, start):
+    """
+    Rows inserted after start (a last_id value). SQLite does not return
+    primary keys from bulk inserts, so they are read back this way.
+    """
+    return model.objects.filter(id__gt=start).order_by("id")
+
+
+def bulk_insert(model, objects, batch_size):
+    """
+    bulk_create from an iterable, holding one batch in memory at a time.
+    """
+    objects = iter(objects)
+    while True:
+        batch = list(itertools.islice(objects, batch_size))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+
+
+def create_users(count, role, prefix, password, batch_size):
+    start = last_id(User)
+    bulk_insert(
+        User,
+        (
+            User(
+                email=f"{prefix}{number}@{EMAIL_DOMAIN}",
+                first_name=prefix.title(),
+                last_name=str(number),
+                role=role,
+                password=password,
+            )
+            for number in range(count)
+        ),
+        batch_size,
+    )
+    user_ids = list(new_rows(User, start).values_list("id", flat=True))
+    # Ids can be reused after a rollback; drop what the cache holds for them
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+    return user_ids
+
+
+def seed(
+    farms=20,
+    products_per_farm=10,
+    buyers=20,
+    orders_per_buyer=5,
+    messages_per_room=20,
+    batch_size=2000,
+    random_seed=0,
+):
+    """
+    Create one farmer per farm, buyers with orders across farms and a chat
+    room between every buyer and one farmer. Returns a Dataset.
+    """
+    rng = random.Random(random_seed)
+    password = make_password(PASSWORD)
+    now = timezone.now()
+
+    User.objects.create(
+        email=ADMIN_EMAIL,
+        role=Role.Admin,
+        is_staff=True,
+        is_superuser=True,
+        password=password,
+    )
+    farmer_ids = create_users(farms, Role.Farmer, "farmer", password, batch_size)
+    buyer_ids = create_users(buyers, Role.Buyer, "buyer", password, batch_size)
+    provision_users(farmer_ids + buyer_ids, batch_size)
+
+    start = last_id(Farm)
+    # Nine farms in ten are verified; the rest wait in the review queue
+    bulk_insert(
+        Farm,
+        (
+            Farm(
+                farmer_id=farmer_id,
+                name=f"Farm {number}",
+                address=f"{number} Seed Road",
+                latitude=43.0 + rng.random(),
+                longitude=76.0 + rng.random(),
+                size=f"{rng.randint(1, 500)} ha",
+                crop_types="Wheat, Potato",
+                is_verified=number % 10 != 9,
+            )
+            for number, farmer_id in enumerate(farmer_ids)
+        ),
+        batch_size,
+    )
+    farm_rows = list(
+        new_rows(Farm, start).values_list("id", "farmer_id", "is_verified")
+    )
+    bulk_insert(
+        Application,
+        (
+            Application(
+                farmer_id=farmer_id,
+                farm_id=farm_id,
+                status=(
+                    ApplicationStatus.APPROVED
+                    if is_verified
+                    else ApplicationStatus.PENDING
+                ),
+            )
+            for farm_id, farmer_id, is_verified in farm_rows
+        ),
+        batch_size,
+    )
+
+    Category.objects.bulk_create(
+        [Category(name=name) for name in ("Vegetables", "Fruit", "Grain", "Dairy")]
+    )
+    category_ids = list(Category.objects.values_list("id", flat=True))
+    start = last_id(Product)
+    bulk_insert(
+        Product,
+        (
+            Product(
+                farm_id=farm_id,
+                category_id=rng.choice(category_ids),
+                name=f"Product {farm_id}-{number}",
+                price=Decimal(rng.randint(100, 10000)) / 100,
+                stock_quantity=rng.randint(0, 1000),
+            )
+            for farm_id, _, _ in farm_rows
+            for number in range(products_per_farm)
+        ),
+        batch_size,
+    )
+    new_rows(Product, start).update_visibility()
+    # The first few products of each farm go into orders and baskets
+    products_by_farm = {}
+    products = new_rows(Product, start).values_list("id", "farm_id", "price")
+    for product_id, farm_id, price in products.iterator():
+        farm_products = products_by_farm.setdefault(farm_id, [])
+        if len(farm_products) < 3:
+            farm_products.append((product_id, price))
+
+    statuses = [status for status, _ in OrderStatus.choices]
+    start = last_id(Order)
+    bulk_insert(
+        Order,
+        (
+            Order(
+                buyer_id=buyer_id,
+                farm_id=rng.choice(farm_rows)[0],
+                total_price=0,
+                status=rng.choice(statuses),
+            )
+            for buyer_id in buyer_ids
+            for _ in range(orders_per_buyer)
+        ),
+        batch_size,
+    )
+    orders = new_rows(Order, start).values_list("id", "farm_id")
+    bulk_insert(
+        OrderItem,
+        (
+            OrderItem(order_id=order_id, product_id=product_id, quantity=1, price=price)
+            for order_id, farm_id in orders.iterator()
+            for product_id, price in products_by_farm.get(farm_id, [])[:2]
+        ),
+        batch_size,
+    )
+
+    start = last_id(Room)
+    bulk_insert(
+        Room,
+        (
+            Room(
+                name="-".join(map(str, sorted([buyer_id, farmer_id]))),
+                user1_id=min(buyer_id, farmer_id),
+                user2_id=max(buyer_id, farmer_id),
+            )
+            for number, buyer_id in enumerate(buyer_ids)
+            for farmer_id in [farmer_ids[number % len(farmer_ids)]]
+        ),
+        batch_size,
+    )
+    rooms = list(new_rows(Room, start).values_list("id", "user1_id", "user2_id"))
+    bulk_insert(
+        Message,
+        (
+            Message(
+                room_id=room_id,
+                sender_id=user1_id if number % 2 else user2_id,
+                message=f"Seed message {number}",
+                timestamp=now - timedelta(minutes=messages_per_room - number),
+            )
+            for room_id, user1_id, user2_id in rooms
+            for number in range(messages_per_room)
+        ),
+        batch_size,
+    )
+    latest = Message.objects.filter(room=OuterRef("pk")).order_by("-id")
+    new_rows(Room, start).update(
+        last_message=Subquery(latest.values("id")[:1]),
+        last_activity=Subquery(latest.values("timestamp")[:1]),
+    )
+
+    buyer = User.objects.get(id=buyer_ids[0])
+    BasketItem.objects.bulk_create(
+        [
+            BasketItem(basket=buyer.basket, product_id=product_id, quantity=1)
+            for product_id, _ in products_by_farm[farm_rows[0][0]]
+        ]
+    )
+    return load()
+
+
+def load():
+    """
+    Return the Dataset of previously seeded rows, or None if there are none.
+    """
+    admin = User.objects.filter(email=ADMIN_EMAIL).first()
+    if admin is None:
+        return None
+    buyer = User.objects.get(email=f"buyer0@{EMAIL_DOMAIN}")
+    farmer = User.objects.get(email=f"farmer0@{EMAIL_DOMAIN}")
+    farm = Farm.objects.get(farmer=farmer)
+    room_name = "-".join(map(str, sorted([buyer.id, farmer.id])))
+    return Dataset(
+        admin=admin,
+        farmer=farmer,
+        buyer=buyer,
+        farm=farm,
+        product=farm.products.visible().order_by("id").first(),
+        order=Order.objects.filter(buyer=buyer).order_by("id").first(),
+        room=Room.objects.get(name=room_name),
+    )
@@ -0,0 +1,259 @@
+"""
+In-process WebSocket load test of ChatConsumer.
+
+Thousands of authenticated sockets are opened against the ASGI routing
+(no network, one event loop, like a single Daphne process), paired into
+rooms, and fed messages at a fixed rate. Every delivered frame is timed
+from send to receipt, and undelivered ones are counted as lost.
+
+The consumer is instrumented while the test runs, so the report can say
+where server time goes: authentication (token and room checks at
+connect), database writes (saving messages), the channel layer
+(group_send/send) and JSON encoding.
+"""
+
+import asyncio
+import inspect
+import json
+import statistics
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chat import consumers
+from chat.routing import websocket_urlpatterns
+
+PREFIX = "lt"
+
+
+def percentile(values, fraction):
+    """
+    The given percentile of sorted seconds, in milliseconds.
+    """
+    if not values:
+        return None
+    index = min(len(values) - 1, int(len(values) * fraction))
+    return round(values[index] * 1000, 3)
+
+
+class Stages:
+    """
+    Time spent in each instrumented stage, split by test phase.
+    """
+
+    def __init__(self):
+        self.phase = "connect"
+        self.totals = defaultdict(lambda: [0, 0.0])  # (phase, stage) -> calls, s
+
+    def add(self, stage, elapsed):
+        entry = self.totals[self.phase, stage]
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def wrap_async(self, stage, function):
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+
+        return timed
+
+    def wrap(self, stage, function):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+
+        return timed
+
+    def instrument(self, stack, channel_layer):
+        """
+        Patch the consumer and channel layer for the lifetime of stack.
+        """
+        chat = consumers.ChatConsumer
+        for name, stage in [
+            ("get_user_from_token", "auth"),
+            ("is_valid_room", "auth"),
+            ("save_message", "db_write"),
+        ]:
+            # getattr() would bind database_sync_to_async methods to None
+            timed = self.wrap_async(stage, inspect.getattr_static(chat, name))
+            stack.enter_context(mock.patch.object(chat, name, timed))
+        for name in ("group_send", "send"):
+            timed = self.wrap_async("channel_layer", getattr(channel_layer, name))
+            stack.enter_context(mock.patch.object(channel_layer, name, timed))
+        timed_json = mock.Mock(
+            loads=self.wrap("json", json.loads), dumps=self.wrap("json", json.dumps)
+        )
+        stack.enter_context(mock.patch.object(consumers, "json", timed_json))
+
+    def report(self, phase, divisor):
+        stages = {
+            stage: {
+                "calls": calls,
+                "total_s": round(total, 4),
+                "per_unit_ms": round(total * 1000 / max(divisor, 1), 4),
+            }
+            for (stage_phase, stage), (calls, total) in self.totals.items()
+            if stage_phase == phase
+        }
+        measured = sum(stage["total_s"] for stage in stages.values())
+        for stage in stages.values():
+            stage["share"] = round(stage["total_s"] / measured, 3) if measured else 0
+        bottleneck = max(stages, key=lambda s: stages[s]["total_s"], default=None)
+        return {"stages": stages, "bottleneck": bottleneck}
+
+
+@dataclass
+class Socket:
+    user_id: int
+    room_name: str
+    communicator: WebsocketCommunicator
+    received: int = 0
+    closed: bool = False
+
+
+@dataclass
+class LoadTest:
+    pairs: list  # [(user1_id, user2_id)]
+    rate: float = 100.0  # messages per second across all rooms
+    duration: float = 10.0
+    connect_concurrency: int = 100
+    drain_timeout: float = 5.0
+    latencies: list = field(default_factory=list)
+    stages: Stages = field(default_factory=Stages)
+
+    def socket(self, user_id, room_name):
+        token = AccessToken()
+        token["user_id"] = user_id
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/chat/{room_name}/?token={token}"
+        )
+        return Socket(user_id, room_name, communicator)
+
+    async def connect_all(self, sockets):
+        semaphore = asyncio.Semaphore(self.connect_concurrency)
+        timings = []
+
+        async def connect(socket):
+            async with semaphore:
+                started = time.perf_counter()
+                connected, _ = await socket.communicator.connect(timeout=30)
+                timings.append(time.perf_counter() - started)
+                return connected
+
+        results = await asyncio.gather(*(connect(socket) for socket in sockets))
+        return [s for s, ok in zip(sockets, results) if ok], timings
+
+    async def listen(self, socket):
+        # Read the output queue directly: receive_from() cancels the
+        # application when it times out
+        while True:
+            frame = await socket.communicator.output_queue.get()
+            if frame["type"] == "websocket.close":
+                socket.closed = True
+                return
+            data = json.loads(frame.get("text") or "{}")
+            if data.get("type") != "message":
+                continue  # Presence and typing frames
+            prefix, _, sent = data["message"].partition(" ")
+            if prefix == PREFIX:
+                self.latencies.append(time.perf_counter() - float(sent))
+                socket.received += 1
+
+    async def send_all(self, rooms):
+        total = int(self.rate * self.duration)
+        started = time.perf_counter()
+        for number in range(total):
+            delay = started + number / self.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sender = rooms[number % len(rooms)][number // len(rooms) % 2]
+            await sender.communicator.send_to(
+                text_data=json.dumps({"message": f"{PREFIX} {time.perf_counter()}"})
+            )
+        return total, time.perf_counter() - started
+
+    async def run(self):
+        channel_layer = get_channel_layer()
+        with ExitStack() as stack:
+            self.stages.instrument(stack, channel_layer)
+
+            sockets = []
+            for user1_id, user2_id in self.pairs:
+                room_name = f"{user1_id}-{user2_id}"
+                sockets += [
+                    self.socket(user1_id, room_name),
+                    self.socket(user2_id, room_name),
+                ]
+            started = time.perf_counter()
+            connected, connect_timings = await self.connect_all(sockets)
+            connect_elapsed = time.perf_counter() - started
+
+            by_room = defaultdict(list)
+            for socket in connected:
+                by_room[socket.room_name].append(socket)
+            rooms = [pair for pair in by_room.values() if len(pair) == 2]
+            listeners = [asyncio.ensure_future(self.listen(s)) for s in connected]
+
+            self.stages.phase = "messages"
+            started = time.perf_counter()
+            sent, send_elapsed = await self.send_all(rooms) if rooms else (0, 0.0)
+            expected = sent * 2  # Both participants receive every message
+            deadline = time.perf_counter() + self.drain_timeout
+            while len(self.latencies) < expected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            message_elapsed = time.perf_counter() - started
+
+            for listener in listeners:
+                listener.cancel()
+            await asyncio.gather(*listeners, return_exceptions=True)
+            await asyncio.gather(
+                *(s.communicator.disconnect() for s in connected),
+                return_exceptions=True,
+            )
+
+        latencies = sorted(self.latencies)
+        connect_timings.sort()
+        delivered = len(latencies)
+        return {
+            "connections": {
+                "attempted": len(sockets),
+                "open": len(connected),
+                "closed_by_server": sum(s.closed for s in connected),
+                "per_second": round(len(connected) / connect_elapsed, 1),
+                "p50_ms": percentile(connect_timings, 0.5),
+                "p95_ms": percentile(connect_timings, 0.95),
+            },
+            "messages": {
+                "sent": sent,
+                "send_rate": round(sent / send_elapsed, 1) if send_elapsed else 0,
+                "expected_deliveries": expected,
+                "delivered": delivered,
+                "lost": expected - delivered,
+                "loss_ratio": round(1 - delivered / expected, 4) if expected else 0,
+                "delivered_per_second": round(delivered / message_elapsed, 1),
+            },
+            "latency_ms": {
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": percentile(latencies, 1),
+                "mean": (
+                    round(statistics.mean(latencies) * 1000, 3) if latencies else None
+                ),
+            },
+            "connect_phase": self.stages.report("connect", len(connected)),
+            "message_phase": self.stages.report("messages", sent),
+        }
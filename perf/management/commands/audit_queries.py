@@ -0,0 +1,86 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from perf import factories
+from perf.audit import audit_endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "Request the hot API endpoints against a seeded throwaway database, "
+        "record their SQL and query plans, and flag full table scans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", type=int, default=1, help="Multiply the seeded row counts."
+        )
+        parser.add_argument(
+            "--sql", action="store_true", help="Print every query and its plan."
+        )
+        parser.add_argument("--output", help="Also write the results as JSON.")
+        parser.add_argument(
+            "--fail-on-scan",
+            action="store_true",
+            help="Exit with an error when an unexpected full scan is found.",
+        )
+
+    def handle(self, *args, **options):
+        scale = options["scale"]
+        # The test databases keep the audit away from real data
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            dataset = factories.seed(
+                farms=50 * scale,
+                products_per_farm=20,
+                buyers=200 * scale,
+                orders_per_buyer=10,
+                messages_per_room=50,
+            )
+            audits = audit_endpoints(dataset)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.report(audits, options["sql"])
+        if options["output"]:
+            Path(options["output"]).write_text(
+                json.dumps([self.as_dict(audit) for audit in audits], indent=2)
+            )
+
+        flagged = sum(len(audit.flagged) for audit in audits)
+        if flagged and options["fail_on_scan"]:
+            raise CommandError(f"{flagged} unexpected full table scan(s).")
+
+    def report(self, audits, show_sql):
+        self.stdout.write(f"{'endpoint':<24}{'status':>8}{'queries':>9}  full scans")
+        for audit in audits:
+            scans = ", ".join(table for _, table in audit.flagged) or "-"
+            self.stdout.write(
+                f"{audit.name:<24}{audit.status_code:>8}"
+                f"{len(audit.queries):>9}  {scans}"
+            )
+            if show_sql:
+                for query in audit.queries:
+                    self.stdout.write(f"    [{query.alias}] {query.sql}")
+                    for line in query.plan:
+                        self.stdout.write(f"        {line}")
+
+    def as_dict(self, audit):
+        return {
+            "endpoint": audit.name,
+            "path": audit.path,
+            "status": audit.status_code,
+            "queries": [
+                {
+                    "alias": query.alias,
+                    "sql": query.sql,
+                    "plan": query.plan,
+                    "full_scans": query.full_scans,
+                }
+                for query in audit.queries
+            ],
+            "flagged": [table for _, table in audit.flagged],
+        }
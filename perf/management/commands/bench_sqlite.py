@@ -0,0 +1,165 @@
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from chat.models import Message
+from farms.models import Farm
+from market.models import Category, Product
+from users.models import User
+from users.service import create_if_not_exists
+
+PROFILES = ["default", "tuned"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare SQLite throughput with and without the tuned profile "
+        "(DB_SQLITE_PROFILE=tuned) on the checkout and chat-save paths. "
+        "Runs against throwaway database files, never the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--duration", type=float, default=5.0, help="Seconds per workload."
+        )
+        parser.add_argument("--output", help="Also write the results as JSON.")
+
+    def handle(self, *args, **options):
+        database = connections.databases["default"]
+        if database["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("bench_sqlite only runs on SQLite.")
+
+        original_name = database["NAME"]
+        results = {}
+        try:
+            for profile in PROFILES:
+                with tempfile.TemporaryDirectory() as directory, override_settings(
+                    SQLITE_PROFILE=profile
+                ):
+                    self.use_database(database, Path(directory) / "bench.sqlite3")
+                    fixtures = self.seed(options["threads"])
+                    results[profile] = {
+                        "checkout": self.run(
+                            self.checkout, fixtures, options["duration"]
+                        ),
+                        "chat_save": self.run(
+                            self.chat_save, fixtures, options["duration"]
+                        ),
+                    }
+                    connections.close_all()
+        finally:
+            self.use_database(database, original_name, migrate=False)
+
+        self.report(results)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+
+    def use_database(self, database, name, migrate=True):
+        connections.close_all()
+        database["NAME"] = name
+        if migrate:
+            call_command("migrate", verbosity=0)
+
+    def seed(self, threads):
+        farmer = User.objects.create_user(
+            email="bench-farmer@example.com", password="bench", role="Farmer"
+        )
+        farm = Farm.objects.create(
+            farmer=farmer,
+            name="Bench Farm",
+            address="Bench",
+            size="1",
+            crop_types="Bench",
+            is_verified=True,
+        )
+        category = Category.objects.create(name="Bench")
+
+        fixtures = []
+        for number in range(threads):
+            buyer = User.objects.create_user(
+                email=f"bench-buyer{number}@example.com", password="bench"
+            )
+            create_if_not_exists(buyer)
+            # One product per worker so stock updates do not race each other
+            product = Product.objects.create(
+                farm=farm,
+                category=category,
+                name=f"Bench product {number}",
+                price=1,
+                stock_quantity=10 ** 9,
+            )
+            user1_id, user2_id = sorted([buyer.id, farmer.id])
+            fixtures.append((buyer, product, f"{user1_id}-{user2_id}"))
+        return fixtures
+
+    def checkout(self, buyer, product, room_name):
+        client = APIClient()
+        client.force_authenticate(buyer)
+        client.post(
+            "/api/v1/basket-items/",
+            {"product": product.id, "quantity": 1},
+            format="json",
+        )
+        response = client.post("/api/v1/orders/")
+        return response.status_code == 201
+
+    def chat_save(self, buyer, product, room_name):
+        Message.objects.create_in_room(room_name, buyer.id, "Benchmark message")
+        return True
+
+    def run(self, operation, fixtures, duration):
+        counters = {"ok": 0, "failed": 0, "locked": 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker(fixture):
+            ok = failed = locked = 0
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        if operation(*fixture):
+                            ok += 1
+                        else:
+                            failed += 1
+                    except OperationalError as error:
+                        if "locked" not in str(error):
+                            raise
+                        locked += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    counters["ok"] += ok
+                    counters["failed"] += failed
+                    counters["locked"] += locked
+
+        started = time.monotonic()
+        workers = [threading.Thread(target=worker, args=(f,)) for f in fixtures]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        counters["per_second"] = round(counters["ok"] / elapsed, 1)
+        return counters
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'profile':<10}{'workload':<12}{'ops/s':>10}{'ok':>10}"
+            f"{'failed':>10}{'locked':>10}"
+        )
+        for profile, workloads in results.items():
+            for workload, result in workloads.items():
+                self.stdout.write(
+                    f"{profile:<10}{workload:<12}{result['per_second']:>10}"
+                    f"{result['ok']:>10}{result['failed']:>10}{result['locked']:>10}"
+                )
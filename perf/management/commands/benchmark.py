@@ -0,0 +1,190 @@
+import json
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from farms.models import Farm
+from perf import factories
+from perf.benchmark import (
+    BENCHMARKS,
+    CONCURRENT_BENCHMARKS,
+    compare,
+    dataset_size,
+    run_benchmarks,
+    run_concurrency_benchmarks,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main API endpoints against a seeded throwaway database and "
+        "optionally fail on regressions against a baseline results file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=float,
+            default=0.001,
+            help="Fraction of the full dataset (10k farms, 1M products, "
+            "1M orders, 10M messages) to seed.",
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            choices=sorted({*BENCHMARKS, *CONCURRENT_BENCHMARKS}),
+            help="Benchmarks to run.",
+        )
+        parser.add_argument("--output", help="Write the results as JSON.")
+        parser.add_argument("--baseline", help="Results JSON to compare against.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=20.0,
+            help="Allowed median slowdown against the baseline, in percent.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=0,
+            help="Also compare the async read views with sync serving at this "
+            "many requests in flight.",
+        )
+        parser.add_argument(
+            "--concurrent-requests",
+            type=int,
+            default=200,
+            help="Requests per endpoint and mode of the --concurrency run.",
+        )
+        parser.add_argument(
+            "--query-latency-ms",
+            type=float,
+            default=0.0,
+            help="Simulated round trip added to every query of the --concurrency "
+            "run, as with a database on another host.",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the seeded database for the next run at the same scale.",
+        )
+
+    def handle(self, *args, **options):
+        size = dataset_size(options["scale"])
+        if options["keepdb"]:
+            self.persist_sqlite_databases(options["scale"])
+
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options["keepdb"]
+        )
+        try:
+            with override_settings(DEBUG=False):
+                dataset = self.dataset(size)
+                results = run_benchmarks(
+                    dataset, options["only"], options["repeat"], options["warmup"]
+                )
+                concurrency = None
+                if options["concurrency"]:
+                    concurrency = run_concurrency_benchmarks(
+                        dataset,
+                        options["only"],
+                        options["concurrent_requests"],
+                        options["concurrency"],
+                        options["query_latency_ms"] / 1000,
+                    )
+            vendor = connections["default"].vendor
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options["keepdb"])
+
+        report = {
+            "meta": {
+                "commit": self.commit(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "database": vendor,
+                "scale": options["scale"],
+                "dataset": size,
+                "repeat": options["repeat"],
+            },
+            "results": results,
+        }
+        self.report(results)
+        if concurrency is not None:
+            report["concurrency"] = concurrency
+            self.report_concurrency(concurrency, options["concurrency"])
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(report, indent=2))
+
+        if options["baseline"]:
+            baseline = json.loads(Path(options["baseline"]).read_text())
+            regressions = compare(
+                results, baseline["results"], options["threshold"] / 100
+            )
+            if regressions:
+                raise CommandError(
+                    "Performance regressions:\n  " + "\n  ".join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def persist_sqlite_databases(self, scale):
+        # SQLite test databases live in memory unless given a file name
+        for alias in connections:
+            database = connections.databases[alias]
+            if database["ENGINE"] == "django.db.backends.sqlite3":
+                name = f"fms-benchmark-{alias}-{scale}.sqlite3"
+                database.setdefault("TEST", {})
+                database["TEST"]["NAME"] = str(Path(tempfile.gettempdir()) / name)
+
+    def dataset(self, size):
+        dataset = factories.load()
+        if dataset is None:
+            self.stdout.write(f"Seeding {size} ...")
+            return factories.seed(**size)
+        if Farm.objects.count() != size["farms"]:
+            raise CommandError(
+                "The kept database was seeded at another scale; "
+                "run once without --keepdb."
+            )
+        return dataset
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'benchmark':<22}{'median ms':>11}{'p95 ms':>10}{'queries':>9}  status"
+        )
+        for name, result in results.items():
+            statuses = ",".join(map(str, result["statuses"]))
+            self.stdout.write(
+                f"{name:<22}{result['median_ms']:>11}{result['p95_ms']:>10}"
+                f"{result['queries']:>9}  {statuses}"
+            )
+
+    def report_concurrency(self, results, concurrency):
+        self.stdout.write(f"\n{concurrency} concurrent requests, sync vs async views:")
+        self.stdout.write(
+            f"{'endpoint':<22}{'mode':>6}{'req/s':>9}{'median ms':>11}"
+            f"{'p95 ms':>10}{'p99 ms':>10}"
+        )
+        for name, modes in results.items():
+            for mode, result in modes.items():
+                self.stdout.write(
+                    f"{name:<22}{mode:>6}{result['requests_per_second']:>9}"
+                    f"{result['median_ms']:>11}{result['p95_ms']:>10}"
+                    f"{result['p99_ms']:>10}"
+                )
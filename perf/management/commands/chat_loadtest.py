@@ -0,0 +1,143 @@
+import json
+import logging
+import tempfile
+from pathlib import Path
+
+import redis
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from perf import factories
+from perf.loadtest import LoadTest
+from users.choices import Role
+
+LAYERS = {
+    "memory": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+    "redis": {"BACKEND": "channels_redis.core.RedisChannelLayer"},
+}
+
+ADVICE = {
+    "auth": "token and room validation dominate; cache the user lookup",
+    "db_write": "saving messages dominates; batch writes or use a faster database",
+    "channel_layer": "group_send dominates; check Redis latency or shard the layer",
+    "json": "JSON encoding dominates; shrink frames or use a faster encoder",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many authenticated ChatConsumer sockets in-process, send messages "
+        "at a fixed rate and report fan-out latency, loss and the bottleneck. "
+        "Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--connections", type=int, default=1000, help="Sockets, two per room."
+        )
+        parser.add_argument(
+            "--rate", type=float, default=200, help="Messages per second overall."
+        )
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument("--layer", choices=list(LAYERS), default="memory")
+        parser.add_argument(
+            "--redis-url",
+            default="redis://localhost:6379",
+            help="Redis server for --layer=redis.",
+        )
+        parser.add_argument("--connect-concurrency", type=int, default=100)
+        parser.add_argument("--drain-timeout", type=float, default=5)
+        parser.add_argument("--output", help="Also write the report as JSON.")
+
+    def handle(self, *args, **options):
+        pairs_count = options["connections"] // 2
+        if pairs_count < 1:
+            raise CommandError("--connections must be at least 2.")
+        layer = dict(LAYERS[options["layer"]])
+        if options["layer"] == "redis":
+            layer["CONFIG"] = {"hosts": [options["redis_url"]]}
+            self.check_redis(options["redis_url"])
+
+        self.use_database_files()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        # One INFO record per join and leave would drown the results
+        chat_logger = logging.getLogger("chat")
+        level = chat_logger.level
+        chat_logger.setLevel(logging.WARNING)
+        try:
+            with override_settings(DEBUG=False, CHANNEL_LAYERS={"default": layer}):
+                password = make_password(factories.PASSWORD)
+                farmers = factories.create_users(
+                    pairs_count, Role.Farmer, "farmer", password, 2000
+                )
+                buyers = factories.create_users(
+                    pairs_count, Role.Buyer, "buyer", password, 2000
+                )
+                load_test = LoadTest(
+                    pairs=[tuple(sorted(pair)) for pair in zip(farmers, buyers)],
+                    rate=options["rate"],
+                    duration=options["duration"],
+                    connect_concurrency=options["connect_concurrency"],
+                    drain_timeout=options["drain_timeout"],
+                )
+                report = async_to_sync(load_test.run)()
+        finally:
+            chat_logger.setLevel(level)
+            teardown_databases(old_config, verbosity=0)
+
+        report["layer"] = options["layer"]
+        self.report(report)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(report, indent=2))
+
+    def check_redis(self, url):
+        try:
+            redis.Redis.from_url(url, socket_connect_timeout=2).ping()
+        except redis.RedisError as error:
+            raise CommandError(f"Redis at {url} is not reachable: {error}")
+
+    def use_database_files(self):
+        # Consumers write from a worker thread; a file avoids the table
+        # locks of SQLite's shared in-memory test database
+        directory = tempfile.mkdtemp(prefix="fms-loadtest-")
+        for alias in connections:
+            database = connections.databases[alias]
+            if database["ENGINE"] == "django.db.backends.sqlite3":
+                database.setdefault("TEST", {})
+                database["TEST"]["NAME"] = str(Path(directory) / f"{alias}.sqlite3")
+
+    def report(self, report):
+        connections_ = report["connections"]
+        messages = report["messages"]
+        latency = report["latency_ms"]
+        self.stdout.write(
+            f"Connections: {connections_['open']}/{connections_['attempted']} open "
+            f"({connections_['per_second']}/s, p50 {connections_['p50_ms']} ms, "
+            f"p95 {connections_['p95_ms']} ms), "
+            f"{connections_['closed_by_server']} closed by the server"
+        )
+        self.stdout.write(
+            f"Messages: {messages['sent']} sent at {messages['send_rate']}/s, "
+            f"{messages['delivered']}/{messages['expected_deliveries']} delivered "
+            f"({messages['delivered_per_second']}/s), {messages['lost']} lost"
+        )
+        self.stdout.write(
+            f"Fan-out latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+            f"p99 {latency['p99']} ms, max {latency['max']} ms"
+        )
+        for phase, unit in [("connect_phase", "socket"), ("message_phase", "msg")]:
+            self.stdout.write(f"{phase.replace('_', ' ').capitalize()}:")
+            for stage, figures in sorted(report[phase]["stages"].items()):
+                self.stdout.write(
+                    f"  {stage:<14}{figures['calls']:>8} calls"
+                    f"{figures['per_unit_ms']:>10} ms/{unit}"
+                    f"{figures['share']:>8.0%}"
+                )
+        bottleneck = report["message_phase"]["bottleneck"]
+        if bottleneck:
+            self.stdout.write(
+                self.style.WARNING(f"Bottleneck: {bottleneck} ({ADVICE[bottleneck]})")
+            )
@@ -0,0 +1,319 @@
+"""
+Opt-in request profiling.
+
+A request is profiled when it asks to be, or is picked at
+PROFILE_SAMPLE_RATE. Asking means sending the PROFILE_HEADER header (off
+when empty, the default) with the PROFILE_SECRET value or with an admin's
+access token; anyone else's header is ignored, so clients cannot move
+their requests off the concurrent path (fms/async_views.py), fill the
+logs or read timings. For profiled requests ProfilingMiddleware records
+the queries run on every database alias (count, total time and
+statements repeated within the request, the N+1 pattern), the time spent
+in serializers and in rendering. The figures are added to per-view
+histograms, which admins read from ProfileStatsView, and returned in a
+Server-Timing header to requests that asked. Histograms are kept per
+process.
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.crypto import constant_time_compare
+from rest_framework.exceptions import APIException
+from rest_framework.serializers import BaseSerializer
+
+from users.authentication import CachedJWTAuthentication
+from users.choices import Role
+
+logger = logging.getLogger(__name__)
+
+current = contextvars.ContextVar("profile", default=None)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# A statement run this many times in one request is reported as N+1
+DUPLICATE_THRESHOLD = 3
+
+
+def profiling_enabled():
+    return bool(settings.PROFILE_HEADER) or settings.PROFILE_SAMPLE_RATE > 0
+
+
+def asks_for_profile(request):
+    header = settings.PROFILE_HEADER
+    return bool(header and request.headers.get(header))
+
+
+def may_profile(request):
+    """
+    Whether a request asking for a profile is allowed one: its header
+    carries PROFILE_SECRET, or its access token is an admin's. The role
+    claim is trusted as the role permissions trust it; no query is run.
+    """
+    secret = settings.PROFILE_SECRET
+    if secret and constant_time_compare(
+        request.headers[settings.PROFILE_HEADER], secret
+    ):
+        return True
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return False
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except APIException:
+        return False
+    return token.get("role") == Role.Admin
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.render_started = None
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper. Statements are counted without their
+        parameters, so a query repeated per row shows up as a duplicate.
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def rendered(self, response):
+        self.render_time = time.perf_counter() - self.render_started
+
+    @property
+    def duplicates(self):
+        return {
+            sql: count
+            for sql, count in self.statements.items()
+            if count >= DUPLICATE_THRESHOLD
+        }
+
+    def server_timing(self, total):
+        return ", ".join(
+            [
+                f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+                f"serialize;dur={self.serializer_time * 1000:.1f}",
+                f"render;dur={self.render_time * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            ]
+        )
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total_ms = 0.0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.render_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.n_plus_one = 0
+
+    def add(self, profile, total):
+        total_ms = total * 1000
+        bucket = next(
+            (i for i, bound in enumerate(LATENCY_BUCKETS) if total_ms <= bound),
+            len(LATENCY_BUCKETS),
+        )
+        self.requests += 1
+        self.latency[bucket] += 1
+        self.total_ms += total_ms
+        self.db_ms += profile.db_time * 1000
+        self.serializer_ms += profile.serializer_time * 1000
+        self.render_ms += profile.render_time * 1000
+        self.queries += profile.queries
+        self.max_queries = max(self.max_queries, profile.queries)
+        self.n_plus_one += bool(profile.duplicates)
+
+    def as_dict(self):
+        def mean(value):
+            return round(value / self.requests, 2)
+
+        return {
+            "requests": self.requests,
+            "latency_ms": dict(
+                zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.latency)
+            ),
+            "mean_ms": mean(self.total_ms),
+            "mean_db_ms": mean(self.db_ms),
+            "mean_serializer_ms": mean(self.serializer_ms),
+            "mean_render_ms": mean(self.render_ms),
+            "mean_queries": mean(self.queries),
+            "max_queries": self.max_queries,
+            "n_plus_one_requests": self.n_plus_one,
+        }
+
+
+stats = defaultdict(ViewStats)
+stats_lock = threading.Lock()
+
+
+def record(view, profile, total):
+    with stats_lock:
+        stats[view].add(profile, total)
+
+
+def snapshot():
+    with stats_lock:
+        return {view: view_stats.as_dict() for view, view_stats in stats.items()}
+
+
+def reset():
+    with stats_lock:
+        stats.clear()
+
+
+def profile_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper of every connection, see install_query_hook().
+    """
+    profile = current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def install_query_hook(sender, connection, **kwargs):
+    """
+    connection_created receiver. The profile travels in a context variable,
+    so queries are attributed to their request whichever thread runs them
+    (async views query from pooled threads).
+    """
+    if profile_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(profile_queries)
+
+
+def enable():
+    """
+    Hook profiling into database connections and serializers; run at
+    startup when profiling_enabled().
+    """
+    connection_created.connect(install_query_hook)
+    for connection in connections.all():
+        install_query_hook(None, connection)
+    profile_serializers()
+
+
+def profile_serializers():
+    """
+    Time BaseSerializer.data while a request is profiled. Only the
+    outermost serializer is timed; the figure includes the queries it
+    triggers through lazy relations.
+    """
+    original = BaseSerializer.data
+    if getattr(original.fget, "profiled", False):
+        return
+
+    def data(self):
+        profile = current.get()
+        if profile is None or profile.serializing:
+            return original.fget(self)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            profile.serializer_time += time.perf_counter() - started
+            profile.serializing = False
+
+    data.profiled = True
+    BaseSerializer.data = property(data)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return random.random() < settings.PROFILE_SAMPLE_RATE
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        requested = asks_for_profile(request) and may_profile(request)
+        if not requested and not self.sampled():
+            return self.get_response(request)
+
+        profile = Profile()
+        token = current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.report(request, response, profile, requested)
+
+    async def __acall__(self, request):
+        # Off the event loop, as revocation may be looked up on Redis
+        requested = asks_for_profile(request) and await sync_to_async(
+            may_profile, thread_sensitive=False
+        )(request)
+        if not requested and not self.sampled():
+            return await self.get_response(request)
+
+        profile = Profile()
+        token = current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.report(request, response, profile, requested)
+
+    def report(self, request, response, profile, requested):
+        total = time.perf_counter() - profile.started
+        if requested:
+            response["Server-Timing"] = profile.server_timing(total)
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        record(view, profile, total)
+
+        duplicates = profile.duplicates
+        if duplicates:
+            sql, count = max(duplicates.items(), key=lambda item: item[1])
+            logger.warning(
+                "Possible N+1 in %s: statement run %s times",
+                view,
+                count,
+                extra={"sql": sql, "queries": profile.queries},
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        profile = current.get()
+        if profile is not None:
+            profile.render_started = time.perf_counter()
+            response.add_post_render_callback(profile.rendered)
+        return response
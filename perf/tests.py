@@ -0,0 +1,178 @@
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from rest_framework.test import APIClient
+
+from perf import factories, profiling
+from perf.audit import audit_endpoints, full_scans
+from perf.benchmark import compare, run_benchmarks, run_concurrency_benchmarks
+from perf.loadtest import LoadTest
+from users.choices import Role
+from users.serializers import CustomTokenObtainPairSerializer
+
+
+class QueryAuditTestCase(TestCase):
+    databases = "__all__"
+
+    def test_hot_endpoints_avoid_full_scans(self):
+        dataset = factories.seed(farms=5, buyers=5, messages_per_room=3)
+        audits = audit_endpoints(dataset)
+
+        for audit in audits:
+            self.assertEqual(audit.status_code, 200, audit.path)
+            self.assertEqual(audit.flagged, [], audit.path)
+
+    def test_full_scan_detection(self):
+        plan = [
+            "SCAN market_product",
+            "SCAN chat_room USING INDEX room_user1_activity_idx",
+            "SEARCH farms_farm USING INTEGER PRIMARY KEY (rowid=?)",
+            "SCAN CONSTANT ROW",
+        ]
+        self.assertEqual(full_scans("sqlite", plan), ["market_product"])
+        self.assertEqual(
+            full_scans("postgresql", ["Seq Scan on market_order  (cost=0.00..1.01)"]),
+            ["market_order"],
+        )
+
+
+@override_settings(PROFILE_HEADER="X-Profile", PROFILE_SECRET="s3cret")
+class ProfilingTestCase(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        profiling.enable()
+        profiling.reset()
+        self.dataset = factories.seed(farms=3, buyers=3, messages_per_room=1)
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_admins_get_server_timing(self):
+        self.authenticate(self.dataset.admin)
+        plain = self.client.get("/api/v1/users/")
+        profiled = self.client.get("/api/v1/users/", HTTP_X_PROFILE="1")
+
+        self.assertNotIn("Server-Timing", plain)
+        timing = profiled["Server-Timing"]
+        for metric in ("db;dur=", "serialize;dur=", "render;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+
+    def test_other_clients_need_the_secret(self):
+        self.authenticate(self.dataset.buyer)
+        ignored = self.client.get("/api/v1/orders/", HTTP_X_PROFILE="1")
+        self.assertNotIn("Server-Timing", ignored)
+        self.assertEqual(profiling.snapshot(), {})
+
+        self.client.credentials()
+        anonymous = self.client.get("/api/v1/categories/", HTTP_X_PROFILE="1")
+        self.assertNotIn("Server-Timing", anonymous)
+
+        with_secret = self.client.get("/api/v1/categories/", HTTP_X_PROFILE="s3cret")
+        self.assertIn("Server-Timing", with_secret)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled_requests_are_recorded_silently(self):
+        self.authenticate(self.dataset.buyer)
+        response = self.client.get("/api/v1/orders/", HTTP_X_PROFILE="1")
+
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(profiling.snapshot()["order-list"]["requests"], 1)
+
+    def test_stats_flag_n_plus_one_per_view(self):
+        self.authenticate(self.dataset.buyer)
+        with self.assertLogs("perf.profiling", "WARNING"):
+            self.client.get("/api/v1/orders/", HTTP_X_PROFILE="s3cret")
+
+        self.authenticate(self.dataset.admin)
+        response = self.client.get("/api/v1/perf/profiles/")
+
+        self.assertEqual(response.status_code, 200)
+        orders = response.data["views"]["order-list"]
+        self.assertEqual(orders["requests"], 1)
+        self.assertEqual(orders["n_plus_one_requests"], 1)
+        self.assertGreater(orders["max_queries"], 10)
+
+    def test_stats_are_admin_only(self):
+        self.authenticate(self.dataset.buyer)
+        self.assertEqual(self.client.get("/api/v1/perf/profiles/").status_code, 403)
+
+
+class BenchmarkTestCase(TestCase):
+    databases = "__all__"
+
+    def test_benchmarks_run_against_seeded_data(self):
+        dataset = factories.seed(farms=2, buyers=3, messages_per_room=5)
+        results = run_benchmarks(dataset, repeat=2, warmup=1)
+
+        for name, result in results.items():
+            self.assertTrue(all(code < 400 for code in result["statuses"]), name)
+            self.assertGreater(result["queries"], 0, name)
+        self.assertEqual(results["checkout"]["statuses"], [201])
+
+    def test_compare_flags_slowdowns_and_extra_queries(self):
+        baseline = {
+            "basket": {"median_ms": 10.0, "queries": 5},
+            "chat-inbox": {"median_ms": 2.0, "queries": 3},
+        }
+        results = {
+            "basket": {"median_ms": 10.5, "queries": 7},
+            "chat-inbox": {"median_ms": 4.0, "queries": 3},
+            "checkout": {"median_ms": 50.0, "queries": 30},
+        }
+
+        self.assertEqual(
+            compare(results, baseline, threshold=0.2, min_delta_ms=1.0),
+            [
+                "basket: 5 -> 7 queries",
+                "chat-inbox: median 2.0 -> 4.0 ms (+100%)",
+            ],
+        )
+
+
+class ConcurrencyBenchmarkTestCase(TransactionTestCase):
+    databases = "__all__"
+
+    def test_sync_and_async_serving_are_compared(self):
+        dataset = factories.seed(farms=2, buyers=2, messages_per_room=3)
+        results = run_concurrency_benchmarks(
+            dataset, ["chat-inbox", "profile"], requests=4, concurrency=2
+        )
+
+        self.assertEqual(set(results), {"chat-inbox", "profile"})
+        for modes in results.values():
+            self.assertEqual(set(modes), {"sync", "async"})
+            for result in modes.values():
+                self.assertEqual(result["statuses"], [200])
+                self.assertGreater(result["requests_per_second"], 0)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class LoadTestTestCase(TransactionTestCase):
+    databases = "__all__"
+
+    def test_messages_fan_out_to_both_participants(self):
+        farmers = factories.create_users(2, Role.Farmer, "farmer", "!", 100)
+        buyers = factories.create_users(2, Role.Buyer, "buyer", "!", 100)
+        load_test = LoadTest(
+            pairs=[tuple(sorted(pair)) for pair in zip(farmers, buyers)],
+            rate=20,
+            duration=0.5,
+        )
+
+        report = async_to_sync(load_test.run)()
+
+        self.assertEqual(report["connections"]["open"], 4)
+        messages = report["messages"]
+        self.assertEqual(messages["sent"], 10)
+        self.assertEqual(messages["delivered"], 20)
+        self.assertEqual(messages["lost"], 0)
+        self.assertEqual(report["connect_phase"]["bottleneck"], "auth")
+        self.assertLessEqual(
+            {"db_write", "channel_layer", "json"},
+            set(report["message_phase"]["stages"]),
+        )
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .views import ProfileStatsView
+
+urlpatterns = [
+    path("profiles/", ProfileStatsView.as_view(), name="perf-profiles"),
+]
@@ -0,0 +1,21 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from perf import profiling
+from users.permissions import IsAdmin
+
+
+class ProfileStatsView(APIView):
+    """
+    Per-view histograms of the profiled requests served by this process.
+    """
+
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response({"views": profiling.snapshot()}, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        profiling.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
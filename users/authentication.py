@@ -0,0 +1,57 @@
+"""
+JWT authentication without a user query per request.
+
+Access tokens carry the user's role and basic profile claims (see
+CustomTokenObtainPairSerializer), and the role permissions read the role
+from the token. The User row itself comes from a short-lived cache, so a
+request normally authenticates without touching the database. Saving or
+deleting a user drops its cache entry (queryset updates do not); other
+processes see the change once their entry expires after
+USER_CACHE_SECONDS. Tokens whose claims went stale are rejected through
+users/revocation.py before the user is looked up.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import User, user_cache_key
+from users.revocation import is_revoked
+
+
+def get_cached_user(user_id):
+    """
+    Return the User with the given id, or None if there is none.
+    """
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(id=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, settings.USER_CACHE_SECONDS)
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token):
+            raise InvalidToken(_("Token is revoked"))
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,120 @@
+"""
+Password hashers whose cost comes from settings.
+
+PASSWORD_HASHER_PROFILE picks the hasher new passwords are encoded with
+and PASSWORD_ARGON2 / PASSWORD_SCRYPT its parameters. Hashes made with
+another hasher or other parameters still verify; must_update() reports
+them, and User.check_password re-encodes the password on the next
+successful login.
+
+The encoded formats are Django's own ("argon2$...", "scrypt$..."), so
+hashes stay valid with Django's hashers.
+"""
+
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_noop as _
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2["time_cost"]
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2["memory_cost"]
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2["parallelism"]
+
+
+class ScryptPasswordHasher(hashers.BasePasswordHasher):
+    """
+    The scrypt hasher of later Django versions, with settings-driven cost.
+    """
+
+    algorithm = "scrypt"
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT["n"]
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT["r"]
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT["p"]
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        assert password is not None
+        assert salt and "$" not in salt
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=n,
+            r=r,
+            p=p,
+            # Twice the memory scrypt needs; OpenSSL's default stops at 32 MB
+            maxmem=256 * n * r,
+            dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode("ascii").strip()
+        return "%s$%d$%s$%d$%d$%s" % (self.algorithm, n, salt, r, p, hash_)
+
+    def decode(self, encoded):
+        algorithm, n, salt, r, p, hash_ = encoded.split("$", 5)
+        assert algorithm == self.algorithm
+        return {
+            "algorithm": algorithm,
+            "work_factor": int(n),
+            "salt": salt,
+            "block_size": int(r),
+            "parallelism": int(p),
+            "hash": hash_,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(
+            password,
+            decoded["salt"],
+            decoded["work_factor"],
+            decoded["block_size"],
+            decoded["parallelism"],
+        )
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _("algorithm"): decoded["algorithm"],
+            _("work factor"): decoded["work_factor"],
+            _("block size"): decoded["block_size"],
+            _("parallelism"): decoded["parallelism"],
+            _("salt"): hashers.mask_hash(decoded["salt"]),
+            _("hash"): hashers.mask_hash(decoded["hash"]),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (
+            decoded["work_factor"] != self.work_factor
+            or decoded["block_size"] != self.block_size
+            or decoded["parallelism"] != self.parallelism
+        )
+
+    def harden_runtime(self, password, encoded):
+        # The runtime for scrypt is too complicated to implement a sensible
+        # hardening algorithm.
+        pass
@@ -0,0 +1,26 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.service import BULK_BATCH_SIZE, IMPORT_FIELDS, import_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Create and provision the users of a CSV file with a header row of "
+        f"{', '.join(IMPORT_FIELDS)} columns. Emails already registered are "
+        "skipped, so an interrupted import can be run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        with open(options["path"], newline="", encoding="utf-8") as file:
+            rows = csv.DictReader(file)
+            try:
+                created = import_users(rows, batch_size=options["batch_size"])
+            except ValueError as e:
+                raise CommandError(str(e))
+        self.stdout.write(f"Imported {created} users.")
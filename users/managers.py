@@ -7,7 +7,22 @@ from django.utils.translation import gettext_lazy as _
 from users.choices import Role
 
 
+def with_profile(queryset, path=""):
+    """
+    Load the users at `path` of the queryset ("" for users, "farmer" for
+    farms) with everything UserSerializer reads: the info rows in the same
+    query and the socials in one more.
+    """
+    prefix = f"{path}__" if path else ""
+    return queryset.select_related(
+        f"{prefix}farmer_info", f"{prefix}buyer_info"
+    ).prefetch_related(f"{prefix}socials")
+
+
 class UserManager(BaseUserManager):
+    def with_profile(self):
+        return with_profile(self.get_queryset())
+
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError(_("The Email field must be set"))
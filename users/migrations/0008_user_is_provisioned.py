@@ -0,0 +1,30 @@
+# Generated by Django 3.1.12 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+def backfill_is_provisioned(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    db = schema_editor.connection.alias
+    User.objects.using(db).filter(
+        farmer_info__isnull=False,
+        buyer_info__isnull=False,
+        basket__isnull=False,
+    ).update(is_provisioned=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_merge_20241201_1616'),
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='is_provisioned',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_is_provisioned, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,15 @@
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from users import passwords
 from users.managers import UserManager
+from users.revocation import revoke_user_tokens
 
 from .choices import Role, PaymentMethod, SocialType
 
@@ -20,6 +25,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     avatar = models.ImageField(upload_to="avatars/", null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Has its FarmerInfo, BuyerInfo and Basket, see users/service.py
+    is_provisioned = models.BooleanField(default=False)
 
     @property
     def is_farmer(self):
@@ -38,6 +45,53 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "last_name"]
 
+    # Fields whose change makes the user's tokens stale (users/revocation.py)
+    TOKEN_FIELDS = ("role", "is_active")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            field: value
+            for field, value in zip(field_names, values)
+            if field in cls.TOKEN_FIELDS
+        }
+        return instance
+
+    def tokens_outdated(self):
+        if self._state.adding:
+            return False
+        if self._password is not None:
+            return True
+        loaded = getattr(self, "_loaded_values", {})
+        return any(
+            field in loaded and loaded[field] != getattr(self, field)
+            for field in self.TOKEN_FIELDS
+        )
+
+    # Hashing runs on the password pool, see users/passwords.py
+    def set_password(self, raw_password):
+        self.password = passwords.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        valid, must_update = passwords.check_password(raw_password, self.password)
+        if valid and must_update:
+            # Re-encoded with the current hasher profile; not a password
+            # change, so tokens stay valid
+            self.password = passwords.make_password(raw_password)
+            self.save(update_fields=["password"])
+        return valid
+
+    def save(self, *args, **kwargs):
+        outdated = self.tokens_outdated()
+        super().save(*args, **kwargs)
+        if outdated:
+            revoke_user_tokens(self.pk)
+        self._loaded_values = {
+            field: getattr(self, field) for field in self.TOKEN_FIELDS
+        }
+
     def switch_role(self):
         if self.role == Role.Admin:
             raise ValueError("Admin role cannot be switched")
@@ -88,3 +142,36 @@ class Social(models.Model):
 
     def __str__(self):
         return f"Social: {self.farmer.email} - {self.platform}"
+
+
+def user_cache_key(user_id):
+    return f"users:user:{user_id}"
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # See users/authentication.py
+    cache.delete(user_cache_key(instance.pk))
+
+
+def profile_cache_key(user_id):
+    return f"users:profile:{user_id}"
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=FarmerInfo)
+@receiver(post_delete, sender=FarmerInfo)
+@receiver(post_save, sender=BuyerInfo)
+@receiver(post_delete, sender=BuyerInfo)
+@receiver(post_save, sender=Social)
+@receiver(post_delete, sender=Social)
+def forget_cached_profile(sender, instance, **kwargs):
+    # See ProfileView
+    user_id = {
+        FarmerInfo: "farmer_id",
+        BuyerInfo: "buyer_id",
+        Social: "farmer_id",
+    }.get(sender, "pk")
+    cache.delete(profile_cache_key(getattr(instance, user_id)))
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+    """
+    Keyset pagination of the admin user listing, newest first: each page
+    continues from the last id of the previous one, so deep pages cost the
+    same as the first and no COUNT query is issued.
+    """
+
+    ordering = "-id"
+    page_size = 100
+    page_size_query_param = "limit"
+    max_page_size = 1000
@@ -0,0 +1,118 @@
+"""
+Password hashing on a process pool.
+
+Hashing is deliberately expensive, and a burst of sign-ups or logins would
+otherwise spend every worker's CPU on it. User.set_password and
+User.check_password (and so registration, createsuperuser and token login,
+through Django's ModelBackend) and user imports hash on a pool of
+PASSWORD_HASHING_WORKERS processes instead, and the calling thread only
+waits. The login and registration views run on pooled threads under ASGI
+(see fms/async_views.py), so the wait holds neither the event loop nor
+the sync thread other requests need.
+
+The pool belongs to the process, so it bounds the cores one worker spends
+on hashing, not the machine: a serving pool of N workers (fms/serving.py)
+runs up to N * PASSWORD_HASHING_WORKERS hashing processes. With the
+default sizes that is more processes than cores, and the OS shares the
+cores between them.
+
+The pool is started on first use and spawns fresh interpreters, which
+read the settings module like the parent (settings overridden at run
+time, as in tests, do not reach them). PASSWORD_HASHING_WORKERS = 0
+hashes in the calling thread.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return executor
+
+
+def forget_executor():
+    # A forked worker must not share its parent's pool
+    global executor
+    executor = None
+
+
+os.register_at_fork(after_in_child=forget_executor)
+
+
+def discard_executor(broken):
+    global executor
+    with executor_lock:
+        if executor is broken:
+            executor = None
+    broken.shutdown(wait=False)
+
+
+def on_pool(call):
+    """
+    Return call(executor). A pool whose process died (say the OOM killer
+    took one mid-hash) stays broken, so it is replaced and the call retried
+    once on the new one.
+    """
+    pool = get_executor()
+    try:
+        return call(pool)
+    except BrokenProcessPool:
+        discard_executor(pool)
+        return call(get_executor())
+
+
+def run(function, *args):
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return function(*args)
+    return on_pool(lambda pool: pool.submit(function, *args).result())
+
+
+def check(password, encoded):
+    updates = []
+    valid = hashers.check_password(password, encoded, setter=updates.append)
+    return valid, bool(updates)
+
+
+def make_password(password):
+    if password is None:
+        return hashers.make_password(None)  # Unusable; nothing to hash
+    return run(hashers.make_password, password)
+
+
+def make_passwords(passwords):
+    """
+    make_password() for many passwords, hashed in parallel on the pool.
+    """
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return [hashers.make_password(password) for password in passwords]
+    return on_pool(
+        lambda pool: list(pool.map(hashers.make_password, passwords, chunksize=8))
+    )
+
+
+def check_password(password, encoded):
+    """
+    Return whether the password matches the encoded hash, and whether the
+    hash should be re-encoded with the current hasher profile.
+    """
+    if password is None or not hashers.is_password_usable(encoded):
+        return False, False
+    return run(check, password, encoded)
@@ -1,11 +1,25 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from users.choices import Role
+
+
+def request_role(request):
+    """
+    The role claim of the request's access token, so role checks need no
+    user lookup. Requests authenticated another way use the user's role.
+    """
+    token = request.auth
+    role = token.get("role") if hasattr(token, "get") else None
+    return role or request.user.role
+
 
 class IsFarmer(BasePermission):
 
     def has_permission(self, request, view):
         return bool(
-            request.user and request.user.is_authenticated and request.user.is_farmer
+            request.user
+            and request.user.is_authenticated
+            and request_role(request) == Role.Farmer
         )
 
 
@@ -13,12 +27,16 @@ class IsBuyer(BasePermission):
 
     def has_permission(self, request, view):
         return bool(
-            request.user and request.user.is_authenticated and request.user.is_buyer
+            request.user
+            and request.user.is_authenticated
+            and request_role(request) == Role.Buyer
         )
 
 
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
         return bool(
-            request.user and request.user.is_authenticated and request.user.is_admin
+            request.user
+            and request.user.is_authenticated
+            and request_role(request) == Role.Admin
         )
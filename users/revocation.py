@@ -0,0 +1,159 @@
+"""
+JWT revocation.
+
+Tokens are stateless, so a token stays valid until it expires, even after
+logout or after the claims it carries (the role, see
+users/authentication.py) went stale. Two kinds of entries revoke tokens
+before then:
+
+- a revoked jti, which rejects that one token (logout);
+- a per-user watermark, which rejects every token of the user issued
+  before it (role switch, password change, deactivation; User.save sets
+  it).
+
+Checking a token is two key lookups, one round trip on Redis. Entries
+expire with the tokens they reject, so the store only holds what is
+still relevant. TOKEN_REVOCATION_STORE picks the store: "memory" keeps
+it per process, which is enough for a single process and for tests;
+"redis" shares it across workers (REDIS_URL).
+
+The tokens of this simplejwt version carry no iat claim; the issue time
+is derived from exp and the lifetime of the token type. It is known to
+the second, so a token issued in the second the watermark was set stays
+valid (that is what the new tokens of a role switch rely on).
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+
+import redis
+
+
+def issued_at(token):
+    lifetime = {
+        "access": api_settings.ACCESS_TOKEN_LIFETIME,
+        "refresh": api_settings.REFRESH_TOKEN_LIFETIME,
+    }.get(token.get(api_settings.TOKEN_TYPE_CLAIM))
+    if lifetime is None:
+        return None
+    return token["exp"] - int(lifetime.total_seconds())
+
+
+class MemoryStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jtis = {}
+        self.watermarks = {}
+        self.writes = 0
+
+    def revoke_jti(self, jti, ttl):
+        now = time.time()
+        with self.lock:
+            self.jtis[jti] = now + ttl
+            self.prune(now)
+
+    def set_watermarks(self, user_ids, watermark, ttl):
+        now = time.time()
+        with self.lock:
+            for user_id in user_ids:
+                self.watermarks[str(user_id)] = (watermark, now + ttl)
+            self.prune(now)
+
+    def lookup(self, jti, user_id):
+        now = time.time()
+        expires = self.jtis.get(jti)
+        watermark, until = self.watermarks.get(str(user_id), (None, 0))
+        return (
+            expires is not None and expires > now,
+            watermark if until > now else None,
+        )
+
+    def prune(self, now):
+        # Every 1000 writes, so the dicts only hold live entries
+        self.writes += 1
+        if self.writes % 1000:
+            return
+        self.jtis = {jti: exp for jti, exp in self.jtis.items() if exp > now}
+        self.watermarks = {
+            user_id: entry
+            for user_id, entry in self.watermarks.items()
+            if entry[1] > now
+        }
+
+    def clear(self):
+        with self.lock:
+            self.jtis.clear()
+            self.watermarks.clear()
+
+
+class RedisStore:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    def revoke_jti(self, jti, ttl):
+        self.client.set(f"revoked:jti:{jti}", 1, ex=ttl)
+
+    def set_watermarks(self, user_ids, watermark, ttl):
+        pipeline = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.set(f"revoked:user:{user_id}", watermark, ex=ttl)
+        pipeline.execute()
+
+    def lookup(self, jti, user_id):
+        revoked, watermark = self.client.mget(
+            f"revoked:jti:{jti}", f"revoked:user:{user_id}"
+        )
+        return revoked is not None, int(watermark) if watermark else None
+
+    def clear(self):
+        keys = list(self.client.scan_iter("revoked:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+stores = {}
+
+
+def get_store():
+    backend = settings.TOKEN_REVOCATION_STORE
+    if backend not in stores:
+        if backend == "memory":
+            stores[backend] = MemoryStore()
+        elif backend == "redis":
+            stores[backend] = RedisStore(settings.REDIS_URL)
+        else:
+            raise ValueError(f"Unknown token revocation store {backend!r}")
+    return stores[backend]
+
+
+def revoke_token(token):
+    """
+    Reject this token until it expires.
+    """
+    ttl = token["exp"] - int(time.time())
+    if ttl > 0:
+        get_store().revoke_jti(token[api_settings.JTI_CLAIM], ttl)
+
+
+def revoke_user_tokens(*user_ids):
+    """
+    Reject every token of the users issued before now.
+    """
+    ttl = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()) + 1
+    get_store().set_watermarks(user_ids, int(time.time()), ttl)
+
+
+def is_revoked(token):
+    revoked, watermark = get_store().lookup(
+        token.get(api_settings.JTI_CLAIM),
+        token.get(api_settings.USER_ID_CLAIM),
+    )
+    if revoked:
+        return True
+    if watermark is None:
+        return False
+    issued = issued_at(token)
+    return issued is None or issued < watermark
@@ -1,18 +1,58 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import serializers
-from django.contrib.auth.hashers import make_password
+from django.utils.translation import gettext_lazy as _
 
+from fms.sqlite import write_transaction
+from users.choices import Role
 from users.models import Social, User
+from users.passwords import make_password
+from users.revocation import is_revoked, revoke_token
+from users.service import create_if_not_exists
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
+        # Trusted by the role permissions, see users/authentication.py
         token["role"] = user.role
+        token["email"] = user.email
+        token["first_name"] = user.first_name
+        token["last_name"] = user.last_name
         return token
 
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        if is_revoked(refresh):
+            raise TokenError(_("Token is revoked"))
+        data = super().validate(attrs)
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            revoke_token(refresh)
+        return data
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e))
+        user_id = refresh.get(api_settings.USER_ID_CLAIM)
+        if str(user_id) != str(self.context["request"].user.id):
+            raise serializers.ValidationError("Token belongs to another user.")
+        return refresh
+
+
 class RegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -31,7 +71,11 @@ class RegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data["password"] = make_password(validated_data["password"])
-        return super().create(validated_data)
+        # The account and the rows it needs are created together or not at all
+        with write_transaction(model=User):
+            user = super().create(validated_data)
+            create_if_not_exists(user)
+        return user
 
 
 class AdminUserSerializer(serializers.ModelSerializer):
@@ -52,6 +96,38 @@ class AdminUserSerializer(serializers.ModelSerializer):
         ]
 
 
+class UserFilterSerializer(serializers.Serializer):
+    """
+    Filters of the admin user listing, export and bulk update, see
+    users.service.filter_users().
+    """
+
+    role = serializers.ChoiceField(choices=Role.choices, required=False)
+    is_active = serializers.BooleanField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    email = serializers.CharField(required=False, help_text="Email prefix")
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class BulkUserUpdateSerializer(serializers.Serializer):
+    filter = UserFilterSerializer()
+    role = serializers.ChoiceField(choices=[Role.Farmer, Role.Buyer], required=False)
+    is_active = serializers.BooleanField(required=False)
+
+    def validate_filter(self, value):
+        if not value:
+            raise serializers.ValidationError(
+                "A filter is required; bulk updates never apply to every user."
+            )
+        return value
+
+    def validate(self, data):
+        if "role" not in data and "is_active" not in data:
+            raise serializers.ValidationError("Nothing to update.")
+        return data
+
+
 class UserSerializer(serializers.ModelSerializer):
     info = serializers.SerializerMethodField()
     socials = serializers.SerializerMethodField()
@@ -104,8 +180,8 @@ class UserSerializer(serializers.ModelSerializer):
         return None
 
     def get_socials(self, obj):
-        socials = Social.objects.filter(farmer=obj)
-        return SocialSerializer(socials, many=True).data
+        # Prefetched by with_profile() (users/managers.py)
+        return SocialSerializer(obj.socials.all(), many=True).data
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -1,12 +1,213 @@
+import csv
+import io
+import itertools
+import tempfile
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from fms.sqlite import write_transaction
 from market.models import Basket
-from users.models import BuyerInfo, FarmerInfo, User
+from users import passwords
+from users.choices import Role
+from users.models import (
+    BuyerInfo,
+    FarmerInfo,
+    User,
+    profile_cache_key,
+    user_cache_key,
+)
+from users.revocation import revoke_user_tokens
 
+# Users per statement (or per transaction, for imports) of the bulk functions
+BULK_BATCH_SIZE = 1000
+
+IMPORT_FIELDS = ["email", "first_name", "last_name", "phone", "role", "password"]
+
+# UserFilterSerializer fields and their lookups
+FILTER_LOOKUPS = {
+    "role": "role",
+    "is_active": "is_active",
+    "created_after": "created_at__gte",
+    "created_before": "created_at__lt",
+    "email": "email__istartswith",
+    "ids": "id__in",
+}
+
+EXPORT_FIELDS = [
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "phone",
+    "role",
+    "is_active",
+    "created_at",
+]
 
-def create_if_not_exists(user: User):
 
-    if user.role == "Farmer" or user.role == "Buyer":
-        FarmerInfo.objects.get_or_create(farmer=user)
-        BuyerInfo.objects.get_or_create(buyer=user)
-        Basket.objects.get_or_create(buyer=user)
-    else:
+def provision_users(user_ids, batch_size=BULK_BATCH_SIZE):
+    """
+    Give the users the rows every farmer and buyer account has (FarmerInfo,
+    BuyerInfo and Basket) and mark them provisioned, in one transaction of
+    four statements per batch_size users.
+
+    Rows are bulk inserted with ignore_conflicts, so the ones that exist
+    are skipped through their unique keys and a retried or concurrent call
+    is harmless. Cached users are not dropped; that is up to the caller.
+    """
+    user_ids = list(user_ids)
+    with write_transaction(model=User):
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start : start + batch_size]
+            FarmerInfo.objects.bulk_create(
+                [FarmerInfo(farmer_id=user_id) for user_id in batch],
+                ignore_conflicts=True,
+            )
+            BuyerInfo.objects.bulk_create(
+                [BuyerInfo(buyer_id=user_id) for user_id in batch],
+                ignore_conflicts=True,
+            )
+            Basket.objects.bulk_create(
+                [Basket(buyer_id=user_id) for user_id in batch],
+                ignore_conflicts=True,
+            )
+            User.objects.filter(id__in=batch, is_provisioned=False).update(
+                is_provisioned=True
+            )
+
+
+def create_if_not_exists(user: User):
+    """
+    Provision the user. Once it is, this costs no query.
+    """
+    if user.is_provisioned:
+        return
+    if user.role not in (Role.Farmer, Role.Buyer):
         raise ValueError("Invalid role")
+    provision_users([user.id])
+    user.is_provisioned = True
+    cache.delete_many([user_cache_key(user.id), profile_cache_key(user.id)])
+
+
+def import_users(rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Create and provision the users of rows, dicts with IMPORT_FIELDS keys
+    (all but email optional; without a password the account cannot log in
+    until one is set). Returns the number of users created.
+
+    Each batch_size rows are one transaction. Emails already registered,
+    or repeated, are skipped, so an interrupted import can be run again.
+    """
+    rows = iter(rows)
+    created = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return created
+
+        users = {}
+        for row in batch:
+            role = row.get("role") or Role.Buyer
+            if role not in (Role.Farmer, Role.Buyer):
+                raise ValueError(f"Invalid role {role!r} for {row.get('email')}")
+            email = User.objects.normalize_email(row.get("email") or "")
+            if not email:
+                raise ValueError("Every user needs an email")
+            users.setdefault(
+                email,
+                (
+                    User(
+                        email=email,
+                        first_name=row.get("first_name") or "",
+                        last_name=row.get("last_name") or "",
+                        phone=row.get("phone") or None,
+                        role=role,
+                    ),
+                    row.get("password") or None,
+                ),
+            )
+        for email in User.objects.filter(email__in=list(users)).values_list(
+            "email", flat=True
+        ):
+            del users[email]
+        if not users:
+            continue
+
+        # Hashed before the transaction, which would otherwise wait on it
+        new_users = [user for user, password in users.values()]
+        hashes = passwords.make_passwords(
+            [password for user, password in users.values()]
+        )
+        for user, encoded in zip(new_users, hashes):
+            user.password = encoded
+
+        with write_transaction(model=User):
+            User.objects.bulk_create(new_users, ignore_conflicts=True)
+            # SQLite does not return primary keys from bulk inserts. Rows a
+            # concurrent import or registration inserted first were skipped;
+            # the salted hashes tell this batch's rows apart from them.
+            user_ids = list(
+                User.objects.filter(
+                    email__in=list(users), password__in=hashes
+                ).values_list("id", flat=True)
+            )
+            provision_users(user_ids, batch_size)
+        created += len(user_ids)
+
+
+def filter_users(queryset, filters):
+    return queryset.filter(
+        **{FILTER_LOOKUPS[name]: value for name, value in filters.items()}
+    )
+
+
+def bulk_update_users(queryset, **changes):
+    """
+    Apply changes (role, is_active) to the users of the queryset with one
+    UPDATE per BULK_BATCH_SIZE users. Returns the number of users updated.
+
+    Queryset updates skip User.save, so what it would do is done here per
+    batch: tokens carrying the old role are revoked, cached users and
+    profiles dropped, and users given a role are provisioned.
+    """
+    ids = queryset.order_by("id").values_list("id", flat=True)
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(ids.filter(id__gt=last_id)[:BULK_BATCH_SIZE])
+        if not batch:
+            return updated
+        last_id = batch[-1]
+
+        with write_transaction(model=User):
+            updated += User.objects.filter(id__in=batch).update(
+                **changes, updated_at=timezone.now()
+            )
+            if "role" in changes:
+                provision_users(batch)
+        revoke_user_tokens(*batch)
+        cache.delete_many(
+            [user_cache_key(user_id) for user_id in batch]
+            + [profile_cache_key(user_id) for user_id in batch]
+        )
+
+
+def export_users(queryset):
+    """
+    Write the users of the queryset as CSV to a temporary file and return
+    it rewound. Rows are read from a database cursor in chunks and the
+    file spills to disk past 1 MB, so memory stays flat for any number of
+    users.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    text = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_FIELDS)
+    writer.writerows(
+        queryset.order_by("id").values_list(*EXPORT_FIELDS).iterator(chunk_size=2000)
+    )
+    text.flush()
+    text.detach()
+    spool.seek(0)
+    return spool
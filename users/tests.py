@@ -1,3 +1,557 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import redis
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from fms import ratelimit
+from market.models import Basket
+from users import passwords
+from users.choices import Role, SocialType
+from users.models import (
+    BuyerInfo,
+    FarmerInfo,
+    Social,
+    User,
+    profile_cache_key,
+    user_cache_key,
+)
+from users.service import create_if_not_exists, import_users
+from users.revocation import RedisStore, get_store, is_revoked, revoke_user_tokens
+from users.serializers import CustomTokenObtainPairSerializer
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="farmer@example.com",
+            password="password123",
+            first_name="Ada",
+            last_name="Farmer",
+            role=Role.Farmer,
+        )
+        self.client = APIClient()
+
+    def authenticate(self, token=None):
+        if token is None:
+            token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_token_carries_profile_claims(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+
+        self.assertEqual(token["role"], Role.Farmer)
+        self.assertEqual(token["email"], "farmer@example.com")
+        self.assertEqual((token["first_name"], token["last_name"]), ("Ada", "Farmer"))
+
+    def test_user_is_loaded_once_then_cached(self):
+        self.authenticate()
+        self.assertEqual(self.client.get("/api/v1/socials/").status_code, 200)
+
+        # Only the socials query is left
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/v1/socials/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_saving_the_user_drops_the_cache_entry(self):
+        self.authenticate()
+        self.client.get("/api/v1/socials/")
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.id)))
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(cache.get(user_cache_key(self.user.id)))
+        self.assertEqual(self.client.get("/api/v1/socials/").status_code, 401)
+
+    def test_role_permissions_trust_the_token_claim(self):
+        token = AccessToken.for_user(self.user)
+        token["role"] = Role.Buyer
+        self.authenticate(token)
+
+        self.assertEqual(self.client.get("/api/v1/socials/").status_code, 403)
+
+    def test_switching_role_returns_tokens_with_the_new_role(self):
+        self.authenticate()
+        response = self.client.put("/api/v1/switch-role/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["role"], Role.Buyer)
+        self.assertEqual(AccessToken(response.data["access"])["role"], Role.Buyer)
+
+
+class TokenRevocationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_store().clear()
+        self.user = User.objects.create_user(
+            email="farmer@example.com",
+            password="password123",
+            first_name="Ada",
+            last_name="Farmer",
+            role=Role.Farmer,
+        )
+        self.refresh = CustomTokenObtainPairSerializer.get_token(self.user)
+        self.access = self.refresh.access_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+
+    def backdate(self, token, seconds=5):
+        # Tokens are issued to the second, see users/revocation.py
+        token["exp"] -= seconds
+        return token
+
+    def test_logout_revokes_the_access_and_refresh_tokens(self):
+        response = self.client.post(
+            "/api/v1/logout/", {"refresh": str(self.refresh)}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get("/api/v1/socials/").status_code, 401)
+        response = self.client.post(
+            "/api/v1/token/refresh/", {"refresh": str(self.refresh)}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_logout_rejects_another_users_refresh_token(self):
+        other = User.objects.create_user(
+            email="other@example.com", password="password123", role=Role.Buyer
+        )
+        refresh = RefreshToken.for_user(other)
+
+        response = self.client.post(
+            "/api/v1/logout/", {"refresh": str(refresh)}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(is_revoked(refresh))
+
+    def test_switching_role_revokes_earlier_tokens(self):
+        self.backdate(self.refresh)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {self.backdate(self.access)}"
+        )
+        response = self.client.put("/api/v1/switch-role/")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertTrue(is_revoked(self.access))
+        self.assertTrue(is_revoked(self.refresh))
+        self.assertEqual(self.client.get("/api/v1/profile/").status_code, 401)
+        # The tokens issued by the switch itself stay valid
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get("/api/v1/profile/").status_code, 200)
+        response = self.client.post(
+            "/api/v1/token/refresh/",
+            {"refresh": response.data["refresh"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_change_revokes_earlier_tokens(self):
+        self.backdate(self.access)
+        self.user.set_password("new-password")
+        self.user.save()
+
+        self.assertTrue(is_revoked(self.access))
+
+    def test_unrelated_saves_keep_tokens_valid(self):
+        self.backdate(self.access)
+        self.user.first_name = "Grace"
+        self.user.save()
+        User.objects.get(id=self.user.id).save()
+
+        self.assertFalse(is_revoked(self.access))
+
+    def test_redis_store_is_shared_by_workers(self):
+        server = fakeredis.FakeServer()
+        with mock.patch.object(
+            redis.Redis,
+            "from_url",
+            side_effect=lambda url: fakeredis.FakeRedis(server=server),
+        ):
+            worker = RedisStore("redis://redis:6379")
+            other = RedisStore("redis://redis:6379")
+
+        worker.revoke_jti("a", 60)
+        worker.set_watermarks([1, 2], 1000, 60)
+
+        self.assertEqual(other.lookup("a", 1), (True, 1000))
+        self.assertEqual(other.lookup("b", 2), (False, 1000))
+        self.assertEqual(other.lookup("b", 3), (False, None))
+        self.assertEqual(other.client.ttl("revoked:user:2"), 60)
+
+        with override_settings(TOKEN_REVOCATION_STORE="redis"), mock.patch.dict(
+            "users.revocation.stores", {"redis": worker}
+        ):
+            revoke_user_tokens(self.user.id)
+            self.assertTrue(is_revoked(self.backdate(self.access)))
+
+        other.client.set("ratelimit:login:ip:1", 1)
+        worker.clear()
+        self.assertEqual(other.lookup("a", 1), (False, None))
+        self.assertEqual(other.client.keys(), [b"ratelimit:login:ip:1"])
+
+    def test_watermark_spares_tokens_issued_after_it(self):
+        self.backdate(self.access)
+        revoke_user_tokens(self.user.id)
+        fresh = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+
+        self.assertTrue(is_revoked(self.access))
+        self.assertFalse(is_revoked(fresh))
+
+
+class PasswordHashingTestCase(TestCase):
+    def setUp(self):
+        get_store().clear()
+        ratelimit.get_store().clear()
+        self.user = User.objects.create_user(
+            email="buyer@example.com", password="password123", role=Role.Buyer
+        )
+
+    def login(self):
+        return APIClient().post(
+            "/api/v1/token/",
+            {"email": "buyer@example.com", "password": "password123"},
+        )
+
+    def test_hashing_runs_on_the_pool(self):
+        self.assertNotEqual(passwords.run(os.getpid), os.getpid())
+        self.assertTrue(self.user.password.startswith("argon2$argon2i$v=19$"))
+        self.assertIn("$m=19456,t=2,p=1$", self.user.password)
+
+    def test_a_broken_pool_is_replaced(self):
+        pool = passwords.get_executor()
+        with self.assertRaises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+
+        self.assertNotEqual(passwords.run(os.getpid), os.getpid())
+        self.assertIsNot(passwords.get_executor(), pool)
+        self.assertEqual(len(passwords.make_passwords(["a", "b"])), 2)
+
+    @override_settings(PASSWORD_HASHING_WORKERS=0)
+    def test_login_rehashes_with_new_parameters(self):
+        with self.settings(
+            PASSWORD_ARGON2={"time_cost": 3, "memory_cost": 8192, "parallelism": 1}
+        ):
+            response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIn("$m=8192,t=3,p=1$", self.user.password)
+        # Re-encoding is not a password change
+        self.assertFalse(is_revoked(AccessToken(response.data["access"])))
+
+    def test_login_upgrades_legacy_hashes(self):
+        legacy = make_password("password123", hasher="pbkdf2_sha256")
+        User.objects.filter(id=self.user.id).update(password=legacy)
+
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("argon2$"))
+
+    @override_settings(
+        PASSWORD_HASHING_WORKERS=0,
+        PASSWORD_HASHERS=["users.hashers.ScryptPasswordHasher"],
+    )
+    def test_scrypt_profile(self):
+        encoded = passwords.make_password("password123")
+
+        self.assertTrue(encoded.startswith("scrypt$16384$"))
+        check = passwords.check_password
+        self.assertEqual(check("password123", encoded), (True, False))
+        self.assertEqual(check("wrong", encoded), (False, False))
+        with self.settings(PASSWORD_SCRYPT={"n": 2**15, "r": 8, "p": 1}):
+            self.assertEqual(check("password123", encoded), (True, True))
+
+
+class ProfileViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="farmer@example.com", password="password123", role=Role.Farmer
+        )
+        create_if_not_exists(self.user)
+        Social.objects.create(
+            farmer=self.user, platform=SocialType.choices[0][0], url="https://a.b"
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.client.get("/api/v1/socials/")  # Caches the user
+
+    def test_profile_is_built_in_two_queries_then_cached(self):
+        # The user with both infos, then the socials
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/v1/profile/")
+        self.assertEqual(response.data["info"]["experience"], 0)
+        self.assertEqual(len(response.data["socials"]), 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/v1/profile/").data, response.data)
+
+    def test_saving_the_profile_drops_the_cached_fragment(self):
+        self.client.get("/api/v1/profile/")
+
+        self.user.farmer_info.experience = 7
+        self.user.farmer_info.save()
+        self.assertIsNone(cache.get(profile_cache_key(self.user.id)))
+        response = self.client.get("/api/v1/profile/")
+        self.assertEqual(response.data["info"]["experience"], 7)
+
+        Social.objects.filter(farmer=self.user).get().delete()
+        self.assertEqual(self.client.get("/api/v1/profile/").data["socials"], [])
+
+
+class UserAdminAPITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_store().clear()
+        self.admin = User.objects.create_user(
+            email="spam-admin@example.com", password="password123", role=Role.Admin
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.admin)}"
+        )
+        self.spam = [
+            User.objects.create_user(
+                email=f"spam{number}@example.com", password="x", role=Role.Buyer
+            )
+            for number in range(5)
+        ]
+        self.farmer = User.objects.create_user(
+            email="farmer@example.com", password="x", role=Role.Farmer
+        )
+        User.objects.filter(id=self.farmer.id).update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+
+    def test_listing_is_filtered_and_keyset_paginated(self):
+        response = self.client.get("/api/v1/users/", {"email": "spam", "limit": 2})
+        self.assertEqual(response.status_code, 200)
+        ids = [user["id"] for user in response.data["results"]]
+
+        # Follow the cursors; no page needs a COUNT
+        while response.data["next"]:
+            with self.assertNumQueries(1):
+                response = self.client.get(response.data["next"])
+            ids += [user["id"] for user in response.data["results"]]
+
+        expected = [user.id for user in [self.admin, *self.spam]]
+        self.assertEqual(ids, sorted(expected, reverse=True))
+
+    def test_listing_filters_by_role_activity_and_creation(self):
+        week_ago = (timezone.now() - timedelta(days=7)).isoformat()
+        response = self.client.get(
+            "/api/v1/users/", {"created_before": week_ago, "is_active": "true"}
+        )
+        self.assertEqual([u["id"] for u in response.data["results"]], [self.farmer.id])
+
+        response = self.client.get("/api/v1/users/", {"role": "Buyer"})
+        self.assertEqual(len(response.data["results"]), 5)
+
+        self.assertEqual(
+            self.client.get("/api/v1/users/", {"role": "Pirate"}).status_code, 400
+        )
+
+    @mock.patch("users.service.BULK_BATCH_SIZE", 2)
+    def test_bulk_update_deactivates_matching_users_in_batches(self):
+        token = AccessToken.for_user(self.spam[0])
+        token["exp"] -= 5  # Issued before the update, see users/revocation.py
+        cache.set(user_cache_key(self.spam[0].id), self.spam[0])
+
+        response = self.client.post(
+            "/api/v1/users/bulk-update/",
+            {"filter": {"email": "spam"}, "is_active": False},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"updated": 5})
+        self.assertEqual(User.objects.filter(is_active=False).count(), 5)
+        # Admins are never touched, whatever the filter
+        self.assertTrue(User.objects.get(id=self.admin.id).is_active)
+        self.assertTrue(is_revoked(token))
+        self.assertIsNone(cache.get(user_cache_key(self.spam[0].id)))
+
+    def test_bulk_role_change_creates_the_role_rows(self):
+        response = self.client.post(
+            "/api/v1/users/bulk-update/",
+            {"filter": {"ids": [self.spam[0].id]}, "role": "Farmer"},
+            format="json",
+        )
+
+        self.assertEqual(response.data, {"updated": 1})
+        self.assertEqual(User.objects.get(id=self.spam[0].id).role, Role.Farmer)
+        self.assertTrue(BuyerInfo.objects.filter(buyer=self.spam[0]).exists())
+
+    def test_bulk_update_needs_a_filter_and_a_change(self):
+        for data in [{"filter": {}, "is_active": False}, {"filter": {"email": "x"}}]:
+            response = self.client.post(
+                "/api/v1/users/bulk-update/", data, format="json"
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(is_active=False).exists())
+
+    def test_export_streams_matching_users_as_csv(self):
+        response = self.client.get("/api/v1/users/export/", {"role": "Buyer"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row["email"] for row in rows], [u.email for u in self.spam])
+
+
+class ProvisioningTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_store().clear()
+        ratelimit.get_store().clear()
+
+    def register(self, email="new@example.com"):
+        return APIClient().post(
+            "/api/v1/register/",
+            {
+                "email": email,
+                "first_name": "New",
+                "last_name": "Farmer",
+                "password": "password123",
+                "role": Role.Farmer,
+            },
+        )
+
+    def assertProvisioned(self, user):
+        user.refresh_from_db()
+        self.assertTrue(user.is_provisioned)
+        self.assertEqual(FarmerInfo.objects.filter(farmer=user).count(), 1)
+        self.assertEqual(BuyerInfo.objects.filter(buyer=user).count(), 1)
+        self.assertEqual(Basket.objects.filter(buyer=user).count(), 1)
+
+    def test_registration_creates_the_whole_account(self):
+        response = self.register()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertProvisioned(User.objects.get(id=response.data["user_id"]))
+
+    def test_failed_registration_leaves_no_partial_account(self):
+        with mock.patch.object(
+            Basket.objects, "bulk_create", side_effect=IntegrityError("boom")
+        ):
+            response = self.register()
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(User.objects.filter(email="new@example.com").exists())
+        self.assertFalse(FarmerInfo.objects.exists())
+
+    def test_provisioning_is_idempotent_and_then_free(self):
+        user = User.objects.create_user(
+            email="buyer@example.com", password="x", role=Role.Buyer
+        )
+        create_if_not_exists(user)
+        # A retry after a partial failure fills in what is missing
+        Basket.objects.filter(buyer=user).delete()
+        User.objects.filter(id=user.id).update(is_provisioned=False)
+        user.refresh_from_db()
+        create_if_not_exists(user)
+        self.assertProvisioned(user)
+
+        with self.assertNumQueries(0):
+            create_if_not_exists(user)
+
+    def test_switching_role_again_provisions_nothing(self):
+        self.register()
+        user = User.objects.get(email="new@example.com")
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        response = client.put("/api/v1/switch-role/")
+        self.assertEqual(response.status_code, 200)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+        with mock.patch("users.service.provision_users") as provision:
+            response = client.put("/api/v1/switch-role/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["role"], Role.Farmer)
+        provision.assert_not_called()
+
+    @override_settings(PASSWORD_HASHING_WORKERS=0)
+    def test_import_skips_registered_and_repeated_emails(self):
+        User.objects.create_user(email="taken@example.com", password="x")
+        rows = [
+            {"email": "a@example.com", "role": Role.Farmer, "password": "secret"},
+            {"email": "b@example.com", "first_name": "Bea"},
+            {"email": "a@example.com", "role": Role.Buyer},
+            {"email": "taken@example.com"},
+        ]
+
+        self.assertEqual(import_users(rows, batch_size=2), 2)
+        a = User.objects.get(email="a@example.com")
+        self.assertEqual(a.role, Role.Farmer)
+        self.assertTrue(a.check_password("secret"))
+        self.assertFalse(User.objects.get(email="b@example.com").has_usable_password())
+        for user in User.objects.exclude(email="taken@example.com"):
+            self.assertProvisioned(user)
+        # Running it again changes nothing
+        self.assertEqual(import_users(rows), 0)
+
+    @override_settings(PASSWORD_HASHING_WORKERS=0)
+    def test_import_counts_only_the_users_it_inserted(self):
+        make_passwords = passwords.make_passwords
+
+        def register_meanwhile(raw_passwords):
+            # Between the check for registered emails and the insert
+            User.objects.create_user(email="a@example.com", password="x")
+            return make_passwords(raw_passwords)
+
+        rows = [{"email": "a@example.com"}, {"email": "b@example.com"}]
+        with mock.patch.object(passwords, "make_passwords", register_meanwhile):
+            self.assertEqual(import_users(rows), 1)
+
+        self.assertTrue(User.objects.get(email="a@example.com").check_password("x"))
+
+    def test_import_command_hashes_on_the_pool(self):
+        path = self.tmp_csv(
+            [
+                ["email", "first_name", "last_name", "phone", "role", "password"],
+                ["c@example.com", "Cy", "Farmer", "", "Farmer", "secret"],
+                ["d@example.com", "Di", "Buyer", "+7700", "Buyer", "secret"],
+            ]
+        )
+        out = io.StringIO()
+        call_command("import_users", path, stdout=out)
+
+        self.assertIn("Imported 2 users", out.getvalue())
+        user = User.objects.get(email="d@example.com")
+        self.assertEqual(user.phone, "+7700")
+        self.assertTrue(user.password.startswith("argon2$"))
+        self.assertProvisioned(user)
+
+        path = self.tmp_csv([["email", "role"], ["e@example.com", "Admin"]])
+        with self.assertRaises(CommandError):
+            call_command("import_users", path, stdout=out)
+
+    def tmp_csv(self, rows):
+        file = tempfile.NamedTemporaryFile(
+            "w", suffix=".csv", newline="", delete=False
+        )
+        self.addCleanup(os.remove, file.name)
+        with file:
+            csv.writer(file).writerows(rows)
+        return file.name
@@ -1,9 +1,8 @@
 from django.urls import include, path
-from rest_framework_simplejwt.views import (
-    TokenRefreshView,
-)
 from .views import (
     CustomTokenObtainPairView,
+    CustomTokenRefreshView,
+    LogoutView,
     ProfileView,
     RegistrationView,
     SwitchRoleView,
@@ -18,7 +17,8 @@ router.register(r"users", UserViewSet, basename="users")
 
 urlpatterns = [
     path("token/", CustomTokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("token/refresh/", CustomTokenRefreshView.as_view(), name="token_refresh"),
+    path("logout/", LogoutView.as_view(), name="logout"),
     path("register/", RegistrationView.as_view(), name="register"),
     path("profile/", ProfileView.as_view(), name="profile"),
     path("switch-role/", SwitchRoleView.as_view(), name="switch_role"),
@@ -1,49 +1,133 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import IntegrityError
+from django.http import FileResponse
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
+    TokenRefreshView,
 )
-from users.models import Social, User
+from users.models import Social, User, profile_cache_key
 from users.permissions import IsAdmin, IsFarmer
-from users.serializers import CustomTokenObtainPairSerializer
+from users.revocation import revoke_token
+from users.serializers import (
+    CustomTokenObtainPairSerializer,
+    CustomTokenRefreshSerializer,
+    LogoutSerializer,
+)
 from rest_framework.views import APIView
+from fms.async_views import AsyncReadMixin
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.decorators import action
 
-from users.service import create_if_not_exists
+from fms.db_router import ReplicaReadMixin
+from fms.sqlite import write_transaction
+from users.choices import Role
+from users.pagination import UserCursorPagination
+from users.service import (
+    bulk_update_users,
+    create_if_not_exists,
+    export_users,
+    filter_users,
+)
 from .serializers import (
     AdminUserSerializer,
+    BulkUserUpdateSerializer,
     RegistrationSerializer,
     SocialSerializer,
     UpdateUserSerializer,
+    UserFilterSerializer,
     UserSerializer,
 )
 
 
-class CustomTokenObtainPairView(TokenObtainPairView):
+class CustomTokenObtainPairView(AsyncReadMixin, TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_scope = "login"
+    # Waits for the password hashing pool, see users/passwords.py
+    concurrent_methods = ("POST",)
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = CustomTokenRefreshSerializer
+
+
+class LogoutView(APIView):
+    serializer_class = LogoutSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        revoke_token(request.auth)
+        refresh = serializer.validated_data.get("refresh")
+        if refresh is not None:
+            revoke_token(refresh)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = AdminUserSerializer
     permission_classes = [IsAdmin]
+    pagination_class = UserCursorPagination
 
     def get_queryset(self):
         return User.objects.all()
 
+    def filter_queryset(self, queryset):
+        """
+        Narrow listings and exports by the UserFilterSerializer parameters.
+        """
+        if self.action not in ("list", "export"):
+            return queryset
+        filters = UserFilterSerializer(data=self.request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        return filter_users(queryset, filters.validated_data)
 
-class RegistrationView(APIView):
+    @action(detail=False, methods=["post"], url_path="bulk-update")
+    def bulk_update(self, request):
+        """
+        Set the role and/or is_active of every user matching the filter.
+        Admin accounts are never touched.
+        """
+        serializer = BulkUserUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = dict(serializer.validated_data)
+        users = filter_users(
+            User.objects.exclude(role=Role.Admin), changes.pop("filter")
+        )
+        return Response({"updated": bulk_update_users(users, **changes)})
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        The matching users as a CSV download.
+        """
+        users = self.filter_queryset(self.get_queryset())
+        return FileResponse(
+            export_users(users),
+            as_attachment=True,
+            filename="users.csv",
+            content_type="text/csv",
+        )
+
+
+class RegistrationView(AsyncReadMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_scope = "register"
+    # Waits for the password hashing pool, see users/passwords.py
+    concurrent_methods = ("POST",)
 
     def post(self, request):
         serializer = RegistrationSerializer(data=request.data)
         if serializer.is_valid():
             try:
                 user: User = serializer.save()
-                create_if_not_exists(user)
                 return Response(
                     {"message": "User registered successfully", "user_id": user.id},
                     status=status.HTTP_201_CREATED,
@@ -57,14 +141,29 @@ class RegistrationView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProfileView(APIView):
+class ProfileView(AsyncReadMixin, APIView):
     serializer_class = UserSerializer
 
+    def get_profile(self, request):
+        """
+        The user's representation, cached until the user, their info or
+        socials are saved (users/models.py), or PROFILE_CACHE_SECONDS.
+        """
+        key = profile_cache_key(request.user.id)
+        profile = cache.get(key)
+        if profile is None:
+            user = User.objects.with_profile().get(id=request.user.id)
+            # Cached without the request, so the avatar URL is relative
+            profile = dict(self.serializer_class(user).data)
+            cache.set(key, profile, settings.PROFILE_CACHE_SECONDS)
+        avatar = profile.get("avatar")
+        if avatar:
+            profile = {**profile, "avatar": request.build_absolute_uri(avatar)}
+        return profile
+
     def get(self, request):
         try:
-            user: User = request.user
-            serializer = self.serializer_class(user, context={"request": request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return Response(self.get_profile(request), status=status.HTTP_200_OK)
         except Exception as e:
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -99,8 +198,7 @@ class ProfileView(APIView):
             serializer = UpdateUserSerializer(user, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
-                serializer = self.serializer_class(user, context={"request": request})
-                return Response(serializer.data, status=status.HTTP_200_OK)
+                return Response(self.get_profile(request), status=status.HTTP_200_OK)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
@@ -118,10 +216,18 @@ class SwitchRoleView(APIView):
                 raise AttributeError(
                     "The switch_role method is not implemented on the User model."
                 )
-            user.switch_role()
-            create_if_not_exists(user)
+            with write_transaction(model=User):
+                user.switch_role()
+                create_if_not_exists(user)
             serializer = self.serializer_class(user)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # Tokens carry the role claim, so hand out ones with the new role
+            refresh = CustomTokenObtainPairSerializer.get_token(user)
+            data = {
+                **serializer.data,
+                "refresh": str(refresh),
+                "access": str(refresh.access_token),
+            }
+            return Response(data, status=status.HTTP_200_OK)
         except AttributeError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e: